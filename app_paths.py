@@ -0,0 +1,34 @@
+"""Locations of bundled resources, for source checkouts and PyInstaller builds.
+
+Kept free of heavy imports so the GUI can load its icon and fonts before
+the OCR engine (Tesseract, NumPy, Poppler bindings) is imported.
+"""
+import os
+import subprocess
+import sys
+
+# Without it, every tesseract/poppler process started by the windowed Windows build flashes a console
+CREATE_NO_WINDOW = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+
+def resource_path(relative_path: str) -> str:
+    """Get absolute path to resource, works for dev and PyInstaller bundle."""
+    try:
+        base_path = sys._MEIPASS  # type: ignore[attr-defined]
+    except Exception:
+        base_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_path, relative_path)
+
+
+def no_window(creationflags: int = 0) -> dict:
+    """subprocess keyword arguments that keep a child process from opening a console on Windows."""
+    if os.name == 'nt':
+        return {'creationflags': CREATE_NO_WINDOW | creationflags}
+    return {}
+
+
+def app_base_dir() -> str:
+    """Directory of the running app (dist folder when frozen)."""
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
@@ -0,0 +1,205 @@
+"""Batch OCR from the command line, without starting the Tk UI.
+
+Usage:
+    python -m batch_ocr scans/ invoice.pdf photo.jpg --format txt docx
+
+Each input file gets its result written next to it (or into --output-dir)
+as <name>.txt, <name>.docx and/or <name>.ocr.pdf (a searchable PDF: the
+page images with an invisible text layer, written page by page during
+the OCR pass). Directories are expanded to the supported PDF and image
+files they contain, leaving out earlier <name>.ocr.pdf results.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import tess_backend
+from image_preprocess import parse_stages
+from job_trace import PROFILE_SUFFIX, TRACE_SUFFIX, format_stages, profiled
+from ocr_cache import OcrCache
+from ocr_engine import OcrCancelled, OcrEngine, default_workers, is_supported_file
+from ocr_metrics import MetricsStore, engine_labels
+from searchable_pdf import PDF_SUFFIX, is_output_file
+
+try:
+    from docx import Document
+    DOCX_AVAILABLE = True
+except Exception:
+    DOCX_AVAILABLE = False
+
+
+def iter_input_files(paths, recursive: bool = False):
+    """Expand files and directories into a sorted list of supported files.
+
+    Searchable PDFs written by an earlier run are skipped in directories;
+    named explicitly, they are OCRed like any other file.
+    """
+    for p in paths:
+        if os.path.isdir(p):
+            if recursive:
+                found = []
+                for root, _dirs, files in os.walk(p):
+                    found.extend(os.path.join(root, f) for f in files)
+            else:
+                found = [os.path.join(p, f) for f in os.listdir(p)]
+            for f in sorted(found):
+                if os.path.isfile(f) and is_supported_file(f) and not is_output_file(f):
+                    yield f
+        elif os.path.isfile(p):
+            yield p
+        else:
+            print(f"រកមិនឃើញ: {p}", file=sys.stderr)
+
+
+def output_base(path: str, output_dir: str | None) -> str:
+    base = os.path.splitext(path)[0]
+    if output_dir:
+        base = os.path.join(output_dir, os.path.basename(base))
+    return base
+
+
+def write_txt(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def write_docx(path: str, text: str):
+    doc = Document()
+    for para in text.split("\n\n"):
+        doc.add_paragraph(para)
+    doc.save(path)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m batch_ocr",
+        description="OCR PDF and image files (Khmer + English) without the GUI.",
+    )
+    parser.add_argument("paths", nargs="+", help="files or directories to OCR")
+    parser.add_argument("-f", "--format", nargs="+", choices=("txt", "docx", "pdf"), default=["txt"],
+                        help="output formats to write (default: txt)")
+    parser.add_argument("-o", "--output-dir", help="write results here instead of next to each input")
+    parser.add_argument("-l", "--lang", choices=("mixed", "khm", "eng"), default=None,
+                        help="language hint (default: auto-detect)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="processes for PDF pages (default: AANAI_OCR_WORKERS or CPU count)")
+    parser.add_argument("--force-ocr", action="store_true",
+                        help="OCR every PDF page even when it already has a text layer")
+    parser.add_argument("--always-render", action="store_true",
+                        help="rasterize scanned PDF pages instead of extracting their embedded image")
+    parser.add_argument("--preprocess", type=parse_stages, default=None, metavar="STAGES",
+                        help="image cleanup before OCR: all, off or a comma list of "
+                             "orient,deskew,binarize,despeckle (default: AANAI_PREPROCESS or off)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="do not read or write the OCR result cache (AANAI_CACHE_DIR)")
+    parser.add_argument("--trace", action="store_true",
+                        help="also write <name>.trace.json, a per-stage timeline for chrome://tracing or Perfetto")
+    parser.add_argument("--profile", action="store_true",
+                        help="also write <name>.prof, a cProfile capture of the OCR thread (for pstats/snakeviz)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="descend into sub-directories")
+    parser.add_argument("--skip-existing", action="store_true",
+                        help="skip inputs whose outputs already exist")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print errors and the summary")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if "docx" in args.format and not DOCX_AVAILABLE:
+        print("python-docx មិនទាន់ដំឡើង។ សូមដំឡើងដើម្បីរក្សាទុកជា .docx។", file=sys.stderr)
+        return 2
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    def on_page(page_num, total_pages, _text):
+        if not args.quiet:
+            print(f"  ទំព័រ {page_num}/{total_pages}", flush=True)
+
+    cache = None if args.no_cache else OcrCache.from_env()
+    metrics = MetricsStore.from_env()
+    try:
+        with OcrEngine(on_page=on_page, workers=args.workers or default_workers(), cache=cache,
+                       use_text_layer=not args.force_ocr, use_embedded_images=not args.always_render,
+                       preprocess=args.preprocess) as engine:
+            return run_batch(engine, args, metrics)
+    finally:
+        tess_backend.close_all()
+        if metrics is not None:
+            metrics.close()
+
+
+def record_metrics(metrics, engine: OcrEngine, args, started: float, state: str, error: str | None = None):
+    """Append the file's stats to the metrics history (AANAI_METRICS=0 turns it off).
+
+    `started` is the file's time.time() start, taken before anything could fail.
+    """
+    if metrics is None:
+        return
+    try:
+        metrics.record(engine.stats, state, time.time() - started, engine_labels(engine, args.lang), error)
+    except Exception:
+        pass
+
+
+def run_batch(engine: OcrEngine, args, metrics=None) -> int:
+    done = failed = skipped = pages = 0
+    batch_start = time.time()
+    for path in iter_input_files(args.paths, args.recursive):
+        base = output_base(path, args.output_dir)
+        targets = [(fmt, base + PDF_SUFFIX if fmt == "pdf" else f"{base}.{fmt}") for fmt in args.format]
+        pdf_path = next((t for fmt, t in targets if fmt == "pdf"), None)
+        if args.skip_existing and all(os.path.exists(t) for _fmt, t in targets):
+            skipped += 1
+            continue
+        if not args.quiet:
+            print(f"កំពុងដំណើរការ: {path}", flush=True)
+        started = time.time()
+        try:
+            with profiled(base + PROFILE_SUFFIX if args.profile else None):
+                text, _lang = engine.ocr_file(path, args.lang, pdf_path=pdf_path)
+            text = text.strip()
+            for fmt, target in targets:
+                if fmt == "txt":
+                    write_txt(target, text)
+                elif fmt == "docx":
+                    write_docx(target, text)
+        except Exception as e:
+            failed += 1
+            print(f"បញ្ហា OCR: {path}: {e}", file=sys.stderr, flush=True)
+            record_metrics(metrics, engine, args, started, "cancelled" if isinstance(e, OcrCancelled) else "failed",
+                           str(e))
+            continue
+        finally:
+            # Failed files get their trace too; it shows where they stalled
+            if args.trace:
+                try:
+                    engine.trace.save(base + TRACE_SUFFIX)
+                except OSError as e:
+                    print(f"មិនអាចរក្សាទុក trace: {e}", file=sys.stderr, flush=True)
+        done += 1
+        record_metrics(metrics, engine, args, started, "done")
+        pages += engine.stats['pages_processed']
+        if not args.quiet:
+            elapsed = time.time() - started
+            print(f"  បានបញ្ចប់ក្នុង {elapsed:.1f} វិនាទី • អក្សរ {len(text):,}", flush=True)
+            stage_times = engine.stats['preprocess_seconds']
+            if stage_times:
+                print("  កែរូបភាព: " + " • ".join(f"{k} {v:.2f}s" for k, v in stage_times.items()), flush=True)
+            stages = format_stages(engine.stats['stage_seconds'], limit=6)
+            slowest = engine.trace.slowest_pages(1)
+            if stages:
+                print(f"  ពេលវេលា: {stages}"
+                      + (f" • ទំព័រយឺតបំផុត {slowest[0][0]} ({slowest[0][1]:.1f}s)" if slowest else ""), flush=True)
+
+    elapsed = time.time() - batch_start
+    speed = pages / elapsed if elapsed > 0 else 0
+    print(f"ឯកសារ {done} បានបញ្ចប់ • {failed} បរាជ័យ • {skipped} រំលង • "
+          f"{pages} ទំព័រ ក្នុង {elapsed:.1f} វិនាទី ({speed:.2f} ទំព័រ/វិនាទី)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
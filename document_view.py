@@ -0,0 +1,479 @@
+"""Paged view of a large document in a Tk Text widget.
+
+A Text widget gets slow to scroll, search and edit once it holds megabytes
+of Khmer text, since complex-script lines are shaped and laid out again
+and again. DocumentStore keeps the whole document as pages of at most
+PAGE_CHARS characters (cut at line ends), each with its tag ranges and
+marks as page offsets. PagedTextView materializes only a window of
+WINDOW_PAGES pages in the widget and slides it when the view is scrolled
+to the window's top or bottom edge; the scrollbar shows the position in
+the whole document.
+
+Pages in the window are live: while shown, the widget holds their copy of
+record (the user may type, format or proofread them). They are read back
+into the store with one Text.dump per page whenever the window moves or
+the whole document is needed (save, copy, Copy MD, AI proofreading).
+"""
+import bisect
+
+from markdown_export import dump_lines, line_markdown
+
+PAGE_CHARS = 20_000
+WINDOW_PAGES = 3
+# Tags that only mean something inside the widget
+_WIDGET_TAGS = ("sel",)
+_PAGE_MARK = "vpage"
+
+
+def _merge(spans):
+    merged = []
+    for s, e in sorted(spans):
+        if e <= s:
+            continue
+        if merged and s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return merged
+
+
+class _Page:
+    __slots__ = ("text", "tags")
+
+    def __init__(self, text: str = "", tags=None):
+        self.text = text
+        # tag -> sorted, non-overlapping [start, end] offsets into text
+        self.tags = tags or {}
+
+
+class DocumentStore:
+    """The whole document as pages of text with tag spans and named marks.
+
+    Marks behave like Tk marks with left gravity: text inserted at a mark
+    goes after it, and a mark inside replaced text ends up after the new
+    text.
+    """
+
+    def __init__(self, page_chars: int = PAGE_CHARS):
+        self.page_chars = page_chars
+        self.pages = []
+        # name -> [page, offset]
+        self.marks = {}
+        self._starts = None
+
+    def __len__(self) -> int:
+        starts = self.page_starts()
+        return starts[-1] if starts else 0
+
+    def page_starts(self) -> list[int]:
+        """Document offset of every page, plus the document length at the end."""
+        if self._starts is None:
+            starts = [0]
+            for page in self.pages:
+                starts.append(starts[-1] + len(page.text))
+            self._starts = starts
+        return self._starts
+
+    def locate(self, offset: int) -> tuple[int, int]:
+        """(page, offset in page) of a document offset; the end belongs to the last page."""
+        if not self.pages:
+            self.pages.append(_Page())
+            self._starts = None
+        starts = self.page_starts()
+        page = min(max(bisect.bisect_right(starts, offset) - 1, 0), len(self.pages) - 1)
+        return page, min(offset - starts[page], len(self.pages[page].text))
+
+    def clear(self):
+        self.pages = []
+        self.marks = {}
+        self._starts = None
+
+    def text(self) -> str:
+        return "".join(page.text for page in self.pages)
+
+    def snapshot(self) -> "DocumentStore":
+        """A copy of the pages and tags (not marks) that later edits leave alone."""
+        copy = DocumentStore(self.page_chars)
+        copy.pages = [_Page(page.text, {tag: [span[:] for span in spans] for tag, spans in page.tags.items()})
+                      for page in self.pages]
+        return copy
+
+    def page_text(self, page: int) -> str:
+        return self.pages[page].text
+
+    def append(self, text: str, tags=None) -> list[tuple[int, int, str, dict]]:
+        """Add text at the end; `tags` maps a tag to (start, end) offsets into `text`.
+
+        Returns the (page, offset in page, piece, piece tags) pieces the text
+        was split into, so a view can mirror them.
+        """
+        pieces = []
+        pos = 0
+        while pos < len(text):
+            if not self.pages or len(self.pages[-1].text) >= self.page_chars:
+                self.pages.append(_Page())
+            page = self.pages[-1]
+            room = self.page_chars - len(page.text)
+            end = min(len(text), pos + room)
+            if end < len(text):
+                cut = text.rfind("\n", pos, end)
+                if cut >= pos:
+                    end = cut + 1
+                elif page.text:
+                    # No line end fits: start the line on a new page
+                    self.pages.append(_Page())
+                    continue
+            piece_tags = {}
+            for tag, spans in (tags or {}).items():
+                clipped = [(max(s, pos) - pos, min(e, end) - pos) for s, e in spans if s < end and e > pos]
+                if clipped:
+                    piece_tags[tag] = clipped
+            base = len(page.text)
+            page.text += text[pos:end]
+            for tag, spans in piece_tags.items():
+                page.tags[tag] = _merge(page.tags.get(tag, []) + [[s + base, e + base] for s, e in spans])
+            pieces.append((len(self.pages) - 1, base, text[pos:end], piece_tags))
+            pos = end
+        self._starts = None
+        return pieces
+
+    def set_page(self, page: int, text: str, tags: dict, marks: dict):
+        """Replace a page with text read back from a view, with its tags and marks."""
+        self.pages[page] = _Page(text, {tag: _merge(spans) for tag, spans in tags.items()})
+        for name, offset in marks.items():
+            self.marks[name] = [page, offset]
+        self._starts = None
+
+    def mark_set(self, name: str, offset: int):
+        self.marks[name] = list(self.locate(offset))
+
+    def mark_unset(self, *names):
+        for name in names:
+            self.marks.pop(name, None)
+
+    def get(self, start_mark: str, end_mark: str) -> str:
+        (pa, oa), (pb, ob) = self.marks[start_mark], self.marks[end_mark]
+        if pa == pb:
+            return self.pages[pa].text[oa:ob]
+        return "".join([self.pages[pa].text[oa:]] + [self.pages[p].text for p in range(pa + 1, pb)]
+                       + [self.pages[pb].text[:ob]])
+
+    def replace(self, start_mark: str, end_mark: str, new: str) -> bool:
+        """Replace the text between two marks; False if it already reads `new`."""
+        if self.get(start_mark, end_mark) == new:
+            return False
+        (pa, a), (pb, b) = self.marks[start_mark], self.marks[end_mark]
+        if pb != pa:
+            # Join the pages the range covers into the first one; the others are
+            # left empty so page numbers (marks, the view's window) stay valid
+            self._join_pages(pa, pb)
+            b = self.marks[end_mark][1]
+        page = self.pages[pa]
+        n = len(new)
+        delta = n - (b - a)
+
+        def start_pos(p):
+            return p if p < a else (a + n if p < b else p + delta)
+
+        def end_pos(p):
+            return p if p <= a else (a if p <= b else p + delta)
+
+        # Like a Tk insert-then-delete: ranges covering the whole replaced text
+        # keep covering it, ranges inside it disappear
+        for tag, spans in list(page.tags.items()):
+            page.tags[tag] = _merge([start_pos(s), end_pos(e)] for s, e in spans)
+        for mark in self.marks.values():
+            if mark[0] == pa and mark[1] > a:
+                mark[1] = a + n if mark[1] <= b else mark[1] + delta
+        page.text = page.text[:a] + new + page.text[b:]
+        self._starts = None
+        return True
+
+    def _join_pages(self, first: int, last: int):
+        page = self.pages[first]
+        for p in range(first + 1, last + 1):
+            other = self.pages[p]
+            base = len(page.text)
+            page.text += other.text
+            for tag, spans in other.tags.items():
+                page.tags[tag] = _merge(page.tags.get(tag, []) + [[s + base, e + base] for s, e in spans])
+            for mark in self.marks.values():
+                if mark[0] == p:
+                    mark[0], mark[1] = first, mark[1] + base
+            self.pages[p] = _Page()
+        self._starts = None
+
+    def dump_items(self):
+        """The document as Text.dump-style ("tagon"/"tagoff"/"text", value, None) items."""
+        for page in self.pages:
+            events = []
+            for tag, spans in page.tags.items():
+                for s, e in spans:
+                    events.append((s, 1, "tagon", tag))
+                    events.append((e, 0, "tagoff", tag))
+            events.sort()
+            pos = 0
+            for at, _order, key, tag in events:
+                if at > pos:
+                    yield ("text", page.text[pos:at], None)
+                    pos = at
+                yield (key, tag, None)
+            if pos < len(page.text):
+                yield ("text", page.text[pos:], None)
+
+    def tag_lines(self, tag: str) -> set[str]:
+        """Stripped text of every line where a `tag` range starts."""
+        lines = set()
+        for page in self.pages:
+            for s, _e in page.tags.get(tag, ()):
+                start = page.text.rfind("\n", 0, s) + 1
+                end = page.text.find("\n", s)
+                lines.add(page.text[start:end if end >= 0 else len(page.text)].strip())
+        return lines
+
+
+class PagedTextView:
+    """Show a DocumentStore in a Text widget, WINDOW_PAGES pages at a time.
+
+    All whole-document access goes through the view (text, markdown,
+    tag_lines, marks and replace), so it works the same whether the pages
+    involved are materialized or not. Must be used from the Tk thread.
+    """
+
+    def __init__(self, text, scrollbar=None, store: DocumentStore | None = None,
+                 window_pages: int = WINDOW_PAGES):
+        self.widget = text
+        self.scrollbar = scrollbar
+        self.store = store if store is not None else DocumentStore()
+        self.window_pages = window_pages
+        self.first = 0
+        self.count = 0
+        self._prev_top = 0.0
+        self._rendering = False
+        self._shift_pending = False
+        text.configure(yscrollcommand=self._on_yscroll)
+        if scrollbar is not None:
+            scrollbar.configure(command=self._on_scrollbar)
+
+    # --- Contents ---
+    def clear(self):
+        self._unset_widget_marks()
+        self.widget.delete("1.0", "end")
+        self.store.clear()
+        self.first = self.count = 0
+
+    def append(self, text: str, tags=None):
+        """Add text (with tag spans, see DocumentStore.append) at the end of the document."""
+        for page, base, piece, piece_tags in self.store.append(text, tags):
+            if self._shown(page):
+                self._insert_end(piece, piece_tags)
+            elif page == self.first + self.count and self.count < self.window_pages:
+                self._set_page_mark(page, "end-1c")
+                self.count += 1
+                self._insert_end(piece, piece_tags)
+
+    def text(self) -> str:
+        self.sync()
+        return self.store.text()
+
+    def markdown(self) -> str:
+        """Markdown of the whole document (see markdown_export.line_markdown)."""
+        self.sync()
+        # The trailing newline matches an export of the widget from "1.0" to "end"
+        items = list(self.store.dump_items()) + [("text", "\n", None)]
+        return "\n".join(line_markdown(runs) for runs in dump_lines(items))
+
+    def tag_lines(self, tag: str) -> set[str]:
+        self.sync()
+        return self.store.tag_lines(tag)
+
+    def snapshot(self) -> DocumentStore:
+        """The whole document with its tags, safe to read from another thread."""
+        self.sync()
+        return self.store.snapshot()
+
+    # --- Marks that survive edits and window moves (always left gravity) ---
+    def mark_set(self, name: str, offset: int):
+        """Mark a document offset; call after text() so offsets match the store."""
+        self.store.mark_set(name, offset)
+        page, page_offset = self.store.marks[name]
+        if self._shown(page):
+            self.widget.mark_set(name, f"{_PAGE_MARK}{page} + {page_offset} chars")
+            self.widget.mark_gravity(name, "left")
+
+    def mark_unset(self, *names):
+        self.store.mark_unset(*names)
+        if names:
+            self.widget.mark_unset(*names)
+
+    def replace(self, start_mark: str, end_mark: str, new: str):
+        """Replace the text between two marks, wherever it is in the document."""
+        pages = (self.store.marks[start_mark][0], self.store.marks[end_mark][0])
+        shown = [self._shown(p) for p in pages]
+        if all(shown):
+            if self.widget.get(start_mark, end_mark) == new:
+                return
+            self.widget.insert(start_mark, new)
+            self.widget.delete(f"{start_mark} + {len(new)} chars", end_mark)
+        elif any(shown):
+            self.sync()
+            top = self._top_offset()
+            if self.store.replace(start_mark, end_mark, new):
+                self._render(self.first, top)
+        else:
+            self.store.replace(start_mark, end_mark, new)
+
+    # --- Window ---
+    def _shown(self, page: int) -> bool:
+        return self.first <= page < self.first + self.count
+
+    def _set_page_mark(self, page: int, index: str):
+        name = f"{_PAGE_MARK}{page}"
+        self.widget.mark_set(name, index)
+        self.widget.mark_gravity(name, "left")
+
+    def _insert_end(self, piece: str, piece_tags: dict):
+        start = self.widget.index("end-1c")
+        self.widget.insert("end", piece)
+        for tag, spans in piece_tags.items():
+            ranges = [f"{start} + {i} chars" for span in spans for i in span]
+            self.widget.tag_add(tag, *ranges)
+
+    def _unset_widget_marks(self):
+        names = [f"{_PAGE_MARK}{p}" for p in range(self.first, self.first + self.count)]
+        names += list(self.store.marks)
+        if names:
+            self.widget.mark_unset(*names)
+
+    def sync(self):
+        """Read the materialized pages (text, tags, marks) back into the store."""
+        if not self.count:
+            return
+        last = self.first + self.count - 1
+        for page in range(self.first, last + 1):
+            start = f"{_PAGE_MARK}{page}"
+            # The last page runs to "end" so marks at its very end are included;
+            # the widget's own trailing newline is dropped below
+            end = f"{_PAGE_MARK}{page + 1}" if page < last else "end"
+            initial = [t for t in self.widget.tag_names(start) if t not in _WIDGET_TAGS]
+            open_at = {t: 0 for t in initial}
+            tags = {}
+            marks = {}
+            parts = []
+            pos = 0
+            for key, value, _index in self.widget.dump(start, end, text=True, tag=True, mark=True):
+                if key == "text":
+                    parts.append(value)
+                    pos += len(value)
+                elif key == "tagon" and value not in _WIDGET_TAGS:
+                    open_at[value] = pos
+                elif key == "tagoff" and value in open_at:
+                    tags.setdefault(value, []).append([open_at.pop(value), pos])
+                elif key == "mark" and value in self.store.marks:
+                    marks[value] = pos
+            text = "".join(parts)
+            if page == last and text.endswith("\n"):
+                text = text[:-1]
+            for tag, s in open_at.items():
+                tags.setdefault(tag, []).append([s, len(text)])
+            marks = {name: min(offset, len(text)) for name, offset in marks.items()}
+            self.store.set_page(page, text, {t: [[s, min(e, len(text))] for s, e in spans]
+                                             for t, spans in tags.items()}, marks)
+
+    def _render(self, first: int, top: int | None = None):
+        """Materialize the pages of the window starting at `first` (call sync() first).
+
+        `top` is a document offset to scroll to the top of the view.
+        """
+        self._rendering = True
+        try:
+            self._unset_widget_marks()
+            self.widget.delete("1.0", "end")
+            pages = len(self.store.pages)
+            first = max(0, min(first, pages - self.window_pages))
+            # Pages emptied by a replace spanning pages do not count towards the window
+            count = filled = 0
+            while first + count < pages and filled < self.window_pages:
+                filled += bool(self.store.page_text(first + count))
+                count += 1
+            self.first, self.count = first, count
+            texts = [self.store.page_text(p) for p in range(first, first + self.count)]
+            self.widget.insert("1.0", "".join(texts))
+            offset = 0
+            ranges = {}
+            for page, text in zip(range(first, first + self.count), texts):
+                self._set_page_mark(page, f"1.0 + {offset} chars")
+                for tag, spans in self.store.pages[page].tags.items():
+                    ranges.setdefault(tag, []).extend(f"1.0 + {offset + i} chars" for span in spans for i in span)
+                offset += len(text)
+            for tag, indices in ranges.items():
+                self.widget.tag_add(tag, *indices)
+            for name, (page, page_offset) in self.store.marks.items():
+                if self._shown(page):
+                    self.widget.mark_set(name, f"{_PAGE_MARK}{page} + {page_offset} chars")
+                    self.widget.mark_gravity(name, "left")
+            if top is not None:
+                self.widget.yview(self._index_of(top))
+        finally:
+            self._rendering = False
+        self._prev_top = self.widget.yview()[0]
+
+    def _top_offset(self) -> int:
+        """Document offset of the first visible character."""
+        start = self.store.page_starts()[self.first] if self.count else 0
+        counted = self.widget.count("1.0", "@0,0", "chars")
+        return start + (counted[0] if counted else 0)
+
+    def _index_of(self, offset: int) -> str:
+        page, page_offset = self.store.locate(offset)
+        if not self._shown(page):
+            return "1.0"
+        return f"{_PAGE_MARK}{page} + {page_offset} chars"
+
+    # --- Scrolling ---
+    def _window_span(self) -> tuple[int, int, int]:
+        starts = self.store.page_starts()
+        if not self.count:
+            return 0, 0, 0
+        return starts[self.first], starts[self.first + self.count] - starts[self.first], starts[-1]
+
+    def _on_yscroll(self, top, bottom):
+        top, bottom = float(top), float(bottom)
+        if self.scrollbar is not None:
+            start, size, total = self._window_span()
+            if total and size:
+                self.scrollbar.set((start + top * size) / total, (start + bottom * size) / total)
+            else:
+                self.scrollbar.set(top, bottom)
+        if self._rendering:
+            return
+        moving_down = top > self._prev_top
+        moving_up = top < self._prev_top
+        self._prev_top = top
+        more_below = self.first + self.count < len(self.store.pages)
+        if (moving_down and bottom >= 1.0 and more_below) or (moving_up and top <= 0.0 and self.first > 0):
+            if not self._shift_pending:
+                self._shift_pending = True
+                self.widget.after_idle(self._shift, 1 if moving_down else -1)
+
+    def _shift(self, step: int):
+        self._shift_pending = False
+        self.sync()
+        self._render(self.first + step, self._top_offset())
+
+    def _on_scrollbar(self, *args):
+        if args and args[0] == "moveto":
+            start, size, total = self._window_span()
+            target = float(args[1]) * total
+            if not total:
+                self.widget.yview_moveto(float(args[1]))
+                return
+            page, _ = self.store.locate(int(target))
+            if not self._shown(page):
+                self.sync()
+                self._render(page - (self.window_pages - 1) // 2)
+                start, size, total = self._window_span()
+            self.widget.yview_moveto((target - start) / size if size else 0.0)
+            self._prev_top = self.widget.yview()[0]
+        else:
+            self.widget.yview(*args)
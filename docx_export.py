@@ -0,0 +1,223 @@
+"""Streaming DOCX export of formatted text.
+
+python-docx keeps the whole document as an XML tree and only writes it in
+save(), so a 1000-page result is built in memory first. DocxStreamWriter
+copies every part of python-docx's default template (styles, numbering,
+theme) into the new file and streams word/document.xml through zipfile a
+paragraph at a time: memory stays flat and the export can run on a worker
+thread with progress.
+
+Input is lines of (text, tags) runs, as produced by
+markdown_export.iter_dump_lines from the output widget or DocumentStore:
+
+- blank lines separate paragraphs; other line ends become line breaks
+- bold, italic, underline, larger and smaller become run formatting
+- h1 lines become "Heading 1" paragraphs, bullet lines "List Bullet"
+- left, center and right set the paragraph alignment
+"""
+import os
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+DOCUMENT_PART = "word/document.xml"
+# Points for the 'larger' / 'smaller' tags, as in the output widget
+LARGER_PT = 15
+SMALLER_PT = 11
+HEADING_STYLE = "Heading1"
+BULLET_STYLE = "ListBullet"
+ALIGN_TAGS = ("left", "center", "right")
+# Typed by the bullet button at the start of a line
+BULLET_PREFIX = "• "
+# Buffered XML is written to the zip in pieces of about this size
+FLUSH_CHARS = 64_000
+
+# Characters XML 1.0 does not allow (Tesseract ends pages with a form feed)
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def template_path() -> str:
+    """python-docx's default.docx, whose styles and parts the export reuses."""
+    import docx
+    return os.path.join(os.path.dirname(docx.__file__), "templates", "default.docx")
+
+
+def _text(value: str) -> str:
+    return escape(_INVALID_XML.sub("", value))
+
+
+def _run_xml(text: str, tags) -> str:
+    props = []
+    if "bold" in tags:
+        props.append("<w:b/><w:bCs/>")
+    if "italic" in tags:
+        props.append("<w:i/><w:iCs/>")
+    if "underline" in tags:
+        props.append('<w:u w:val="single"/>')
+    size = LARGER_PT if "larger" in tags else SMALLER_PT if "smaller" in tags else None
+    if size:
+        props.append(f'<w:sz w:val="{size * 2}"/><w:szCs w:val="{size * 2}"/>')
+    rpr = f"<w:rPr>{''.join(props)}</w:rPr>" if props else ""
+    return f'<w:r>{rpr}<w:t xml:space="preserve">{_text(text)}</w:t></w:r>'
+
+
+def _strip_bullet(runs):
+    """Drop the literal "• " the bullet button types; the List Bullet style draws its own.
+
+    The prefix may be split over runs (e.g. "•" and " " with different tags).
+    """
+    joined = "".join(text for text, _tags in runs)
+    stripped = joined.lstrip()
+    drop = len(joined) - len(stripped) + len(BULLET_PREFIX) if stripped.startswith(BULLET_PREFIX) else 0
+    result = []
+    for text, tags in runs:
+        cut = min(drop, len(text))
+        drop -= cut
+        if text[cut:]:
+            result.append((text[cut:], tags))
+    return result
+
+
+def paragraphs(lines):
+    """Group lines of runs into (style, alignment, lines) paragraphs."""
+    block = []
+    align = None
+    for runs in lines:
+        plain = "".join(text for text, _tags in runs)
+        if not plain.strip():
+            if block:
+                yield None, align, block
+                block = []
+            continue
+        first_tags = runs[0][1]
+        line_align = next((a for a in ALIGN_TAGS if a in first_tags), None)
+        if "h1" in first_tags or "bullet" in first_tags or plain.lstrip().startswith(BULLET_PREFIX):
+            if block:
+                yield None, align, block
+                block = []
+            if "h1" in first_tags:
+                yield HEADING_STYLE, line_align, [runs]
+            else:
+                yield BULLET_STYLE, line_align, [_strip_bullet(runs)]
+            continue
+        if not block:
+            align = line_align
+        block.append(runs)
+    if block:
+        yield None, align, block
+
+
+class DocxStreamWriter:
+    """Write a .docx paragraph by paragraph.
+
+        with DocxStreamWriter("out.docx") as doc:
+            doc.add_paragraph([[("Hello", frozenset({"bold"}))]])
+    """
+
+    def __init__(self, path: str, template: str | None = None):
+        self.path = path
+        self.paragraph_count = 0
+        self._closed = False
+        self._buf = []
+        self._buf_chars = 0
+        with zipfile.ZipFile(template or template_path()) as tpl:
+            parts = [(info, tpl.read(info)) for info in tpl.infolist()]
+        document = next(data for info, data in parts if info.filename == DOCUMENT_PART).decode("utf-8")
+        body_start = document.index("<w:body>") + len("<w:body>")
+        sect = re.search(r"<w:sectPr\b.*</w:sectPr>", document, re.S)
+        self._tail = (sect.group(0) if sect else "") + "</w:body></w:document>"
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        try:
+            for info, data in parts:
+                if info.filename != DOCUMENT_PART:
+                    self._zip.writestr(info.filename, data)
+            self._part = self._zip.open(DOCUMENT_PART, "w", force_zip64=True)
+        except Exception:
+            self._zip.close()
+            raise
+        self._write(document[:body_start])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write(self, xml: str):
+        self._buf.append(xml)
+        self._buf_chars += len(xml)
+        if self._buf_chars >= FLUSH_CHARS:
+            self._flush()
+
+    def _flush(self):
+        if self._buf:
+            self._part.write("".join(self._buf).encode("utf-8"))
+            self._buf = []
+            self._buf_chars = 0
+
+    def add_paragraph(self, lines, style: str | None = None, align: str | None = None):
+        """One paragraph from lines of (text, tags) runs, joined by line breaks."""
+        ppr = ""
+        if style or align:
+            ppr = "<w:pPr>" + (f'<w:pStyle w:val="{style}"/>' if style else "") \
+                  + (f'<w:jc w:val="{align}"/>' if align else "") + "</w:pPr>"
+        xml = ["<w:p>", ppr]
+        for n, runs in enumerate(lines):
+            if n:
+                xml.append("<w:r><w:br/></w:r>")
+            xml.extend(_run_xml(text, tags) for text, tags in runs)
+        xml.append("</w:p>")
+        self._write("".join(xml))
+        self.paragraph_count += 1
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._write(self._tail)
+        self._flush()
+        self._part.close()
+        self._zip.close()
+
+    def abort(self):
+        """Close and delete an unfinished file."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._part.close()
+            self._zip.close()
+        except Exception:
+            pass
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def export_docx(path: str, lines, total_chars: int = 0, on_progress=None, progress_every: int = 200) -> int:
+    """Write lines of runs to `path`; returns the number of paragraphs.
+
+    `on_progress(done_chars, total_chars)` is called every `progress_every`
+    paragraphs and at the end.
+    """
+    done = 0
+
+    def counting(lines):
+        # Characters (line ends included) consumed so far, for progress
+        nonlocal done
+        for runs in lines:
+            done += sum(len(text) for text, _tags in runs) + 1
+            yield runs
+
+    with DocxStreamWriter(path) as doc:
+        for style, align, block in paragraphs(counting(lines)):
+            doc.add_paragraph(block, style, align)
+            if on_progress is not None and doc.paragraph_count % progress_every == 0:
+                on_progress(min(done, total_chars or done), total_chars)
+    if on_progress is not None:
+        on_progress(total_chars or done, total_chars)
+    return doc.paragraph_count
@@ -0,0 +1,161 @@
+"""Local stand-in for the Gemini generateContent API, for offline tests and benchmarks.
+
+It answers generateContent with the submitted text "corrected" by a few
+fixed replacements, after a configurable latency, and can fail a share of
+requests with 429 (or the first few with given statuses) to exercise
+retries. streamGenerateContent?alt=sse sends
+the same answer as server-sent events over a chunked response: the first
+event after `latency`, then pieces of `stream_chars` characters paced by
+`latency_per_kchar`; with `cut_after` the connection is dropped after
+that many characters, as a network failure would.
+
+    python -m fake_gemini --port 8765 --latency 0.5 --fail-rate 0.1
+    AANAI_GEMINI_URL=http://127.0.0.1:8765/v1beta python app.py
+"""
+import argparse
+import http
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Typical OCR slips the fake "model" fixes
+CORRECTIONS = {"teh": "the", "0CR": "OCR", "rn": "m"}
+_WORD = re.compile(r"\b(" + "|".join(map(re.escape, CORRECTIONS)) + r")\b")
+
+
+def correct(text: str) -> str:
+    return _WORD.sub(lambda m: CORRECTIONS[m.group(1)], text)
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeGemini/1.0"
+
+    def log_message(self, *args):
+        if self.server.verbose:
+            super().log_message(*args)
+
+    def _send_json(self, status: int, body: dict, headers=()):
+        raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(raw)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            text = payload["contents"][0]["parts"][-1]["text"]
+        except (ValueError, KeyError, IndexError):
+            self._send_json(400, {"error": {"code": 400, "message": "bad request"}})
+            return
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            status = server.fail_statuses.pop(0) if server.fail_statuses else None
+        if status is None and random.random() < server.fail_rate:
+            status = 429
+        if status is not None:
+            headers = [("Retry-After", "0.2")] if status == 429 else []
+            self._send_json(status, {"error": {"code": status, "message": http.HTTPStatus(status).phrase}}, headers)
+            return
+        url = urlsplit(self.path)
+        if url.path.endswith(":streamGenerateContent"):
+            if parse_qs(url.query).get("alt") != ["sse"]:
+                self._send_json(400, {"error": {"code": 400, "message": "only alt=sse is supported"}})
+                return
+            self._stream(correct(text))
+            return
+        time.sleep(server.latency + server.latency_per_kchar * len(text) / 1000.0)
+        if not url.path.endswith(":generateContent"):
+            self._send_json(404, {"error": {"code": 404, "message": "unknown method"}})
+            return
+        self._send_json(200, _response(correct(text)))
+
+    def _stream(self, text: str):
+        server = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(server.latency)
+        step = max(1, server.stream_chars)
+        for start in range(0, len(text), step):
+            if server.cut_after is not None and start >= server.cut_after:
+                # No terminating chunk: the client sees the body end early
+                self.close_connection = True
+                return
+            piece = text[start:start + step]
+            if start:
+                time.sleep(server.latency_per_kchar * len(piece) / 1000.0)
+            event = ("data: " + json.dumps(_response(piece), ensure_ascii=False) + "\r\n\r\n").encode("utf-8")
+            self.wfile.write(f"{len(event):X}\r\n".encode("ascii") + event + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def _response(text: str) -> dict:
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}
+
+
+def make_server(host: str = "127.0.0.1", port: int = 0, latency: float = 0.2, latency_per_kchar: float = 0.0,
+                fail_rate: float = 0.0, stream_chars: int = 64, verbose: bool = False,
+                fail_statuses=(), cut_after=None) -> ThreadingHTTPServer:
+    """Create (not start) a server; port 0 picks a free port (see server.server_address).
+
+    The first requests are answered with `fail_statuses` in order, later
+    ones fail with 429 at `fail_rate`; a 429 carries Retry-After: 0.2.
+    Streams stop after `cut_after` characters when it is set.
+    server.requests counts every request.
+    """
+    server = ThreadingHTTPServer((host, port), FakeGeminiHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.latency_per_kchar = latency_per_kchar
+    server.fail_rate = fail_rate
+    server.stream_chars = stream_chars
+    server.verbose = verbose
+    server.fail_statuses = list(fail_statuses)
+    server.cut_after = cut_after
+    server.requests = 0
+    server.lock = threading.Lock()
+    return server
+
+
+def start_background(**kwargs) -> tuple[ThreadingHTTPServer, str]:
+    """Serve on a thread; returns (server, base_url) for GeminiProofreader(base_url=...)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, name="fake-gemini", daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1beta"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fake_gemini", description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per request")
+    parser.add_argument("--latency-per-kchar", type=float, default=0.2, help="extra seconds per 1000 chars")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--stream-chars", type=int, default=64, help="characters per streamed event")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    server = make_server(args.host, args.port, args.latency, args.latency_per_kchar, args.fail_rate,
+                         args.stream_chars, args.verbose)
+    print(f"Fake Gemini on http://{args.host}:{args.port}/v1beta (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Optional NumPy preprocessing pipeline run on a page before Tesseract.
+
+Every stage works on whole arrays (integral images, shifted views,
+histograms); there are no per-pixel Python loops. Stages run in a fixed
+order and can be switched on individually:
+
+  orient     fix pages turned by 90/180/270 degrees
+  deskew     straighten small rotations (up to MAX_SKEW degrees)
+  binarize   Sauvola adaptive threshold to black/white
+  despeckle  drop isolated specks of noise left by the threshold
+
+Orientation and skew are measured on a downscaled Otsu ink mask with
+projection profiles. The 90 degree case is decided from the profiles alone;
+up/down (0 vs 180, 90 vs 270) needs Tesseract's `osd` model and is only
+corrected when osd.traineddata is installed.
+
+Environment:
+  AANAI_PREPROCESS  comma separated stages, "all" or "off" (default: off)
+"""
+import os
+import re
+import time
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+STAGES = ("orient", "deskew", "binarize", "despeckle")
+
+# Orientation/skew are measured on a copy scaled down to this size
+ANALYSIS_MAX_SIDE = 1000
+MAX_SKEW = 5.0
+SKEW_STEP = 0.1
+# Columns must show this many times more line gaps than rows to turn a page
+ORIENT_RATIO = 1.5
+SAUVOLA_K = 0.2
+SAUVOLA_R = 128.0
+# Ink blobs with at most this many pixels in their 5x5 neighbourhood are noise
+DESPECKLE_MAX_PIXELS = 2
+
+_osd_available = None
+
+
+def parse_stages(spec: str | None) -> tuple[str, ...]:
+    """Stage names from "all", "off" or a comma list, in pipeline order."""
+    spec = (spec or "").strip().lower()
+    if spec in ("", "0", "off", "none"):
+        return ()
+    if spec in ("1", "all", "on"):
+        return STAGES
+    wanted = {s.strip() for s in spec.split(",") if s.strip()}
+    unknown = wanted - set(STAGES)
+    if unknown:
+        raise ValueError(f"unknown preprocessing stage(s): {', '.join(sorted(unknown))}")
+    return tuple(s for s in STAGES if s in wanted)
+
+
+def stages_from_env() -> tuple[str, ...]:
+    try:
+        return parse_stages(os.environ.get("AANAI_PREPROCESS"))
+    except ValueError:
+        return ()
+
+
+def run_pipeline(image, stages) -> tuple[Image.Image, dict[str, float]]:
+    """Apply the enabled stages; returns (image, {stage: seconds})."""
+    timings = {}
+    if not stages:
+        return image, timings
+    if image.mode != "L":
+        image = image.convert("L")
+
+    if "orient" in stages or "deskew" in stages:
+        small = _analysis_image(image)
+        if "orient" in stages:
+            t0 = time.perf_counter()
+            turn = detect_orientation(small)
+            if turn:
+                # PIL rotates counter-clockwise; multiples of 90 are lossless transposes
+                image = image.rotate(-turn, expand=True)
+                small = small.rotate(-turn, expand=True)
+            timings["orient"] = time.perf_counter() - t0
+        if "deskew" in stages:
+            t0 = time.perf_counter()
+            angle = detect_skew(ink_mask(np.asarray(small)))
+            if abs(angle) >= SKEW_STEP:
+                image = image.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+            timings["deskew"] = time.perf_counter() - t0
+
+    if "binarize" in stages:
+        t0 = time.perf_counter()
+        white = sauvola(np.asarray(image))
+        timings["binarize"] = time.perf_counter() - t0
+    else:
+        white = None
+
+    if "despeckle" in stages:
+        t0 = time.perf_counter()
+        if white is None:
+            arr = np.asarray(image)
+            white = arr >= otsu_threshold(arr)
+        white = despeckle(white)
+        timings["despeckle"] = time.perf_counter() - t0
+
+    if white is not None:
+        image = Image.fromarray(white)  # bool array -> mode '1'
+    return image, timings
+
+
+def _analysis_image(image):
+    w, h = image.size
+    if max(w, h) <= ANALYSIS_MAX_SIDE:
+        return image
+    scale = ANALYSIS_MAX_SIDE / float(max(w, h))
+    return image.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.BILINEAR)
+
+
+def otsu_threshold(arr) -> int:
+    """Global Otsu threshold of a uint8 array."""
+    hist = np.bincount(arr.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 128
+    levels = np.arange(256, dtype=np.float64)
+    w0 = np.cumsum(hist)
+    w1 = total - w0
+    m0 = np.cumsum(hist * levels)
+    mean0 = m0 / np.maximum(w0, 1)
+    mean1 = (m0[-1] - m0) / np.maximum(w1, 1)
+    between = w0 * w1 * (mean0 - mean1) ** 2
+    return int(np.argmax(between)) + 1
+
+
+def ink_mask(arr):
+    """Dark pixels of a uint8 grayscale array."""
+    return arr < otsu_threshold(arr)
+
+
+def _gap_fraction(profile) -> float:
+    # Across text lines the profile drops to (near) zero between lines; along
+    # them word gaps rarely line up, so there are few empty bins
+    nonzero = np.nonzero(profile)[0]
+    if len(nonzero) < 2:
+        return 0.0
+    inside = profile[nonzero[0]:nonzero[-1] + 1]
+    return float(np.count_nonzero(inside <= inside.max() * 0.02)) / len(inside)
+
+
+def detect_orientation(small) -> int:
+    """Clockwise degrees (0/90/180/270) that turn the page upright."""
+    mask = ink_mask(np.asarray(small))
+    if not mask.any():
+        return 0
+    rows = _gap_fraction(mask.sum(axis=1))
+    cols = _gap_fraction(mask.sum(axis=0))
+    candidates = (90, 270) if cols > rows * ORIENT_RATIO else (0, 180)
+    rotate = _osd_rotation(small)
+    return rotate if rotate in candidates else candidates[0]
+
+
+def _osd_rotation(small) -> int | None:
+    """Tesseract OSD's suggested clockwise rotation, or None without the osd model."""
+    global _osd_available
+    if _osd_available is None:
+        try:
+            _osd_available = "osd" in pytesseract.get_languages(config="")
+        except Exception:
+            _osd_available = False
+    if not _osd_available:
+        return None
+    try:
+        out = pytesseract.image_to_osd(small, config="--psm 0", timeout=15)
+    except Exception:
+        return None
+    m = re.search(r"Rotate:\s*(\d+)", out)
+    return int(m.group(1)) % 360 if m else None
+
+
+def detect_skew(mask, max_angle: float = MAX_SKEW, step: float = SKEW_STEP, max_points: int = 50000) -> float:
+    """Counter-clockwise degrees that level the text lines of an ink mask.
+
+    Projects ink pixels onto rows at each candidate angle and keeps the
+    angle whose row histogram is sharpest (highest sum of squares).
+    """
+    ys, xs = np.nonzero(mask)
+    if len(ys) < 50:
+        return 0.0
+    if len(ys) > max_points:
+        pick = np.random.default_rng(0).choice(len(ys), max_points, replace=False)
+        ys, xs = ys[pick], xs[pick]
+    ys = ys.astype(np.float64)
+    xs = xs.astype(np.float64)
+    angles = np.arange(-max_angle, max_angle + step / 2, step)
+    offset = float(mask.shape[1])
+    best_angle, best_score = 0.0, -1.0
+    for angle in angles:
+        theta = np.deg2rad(angle)
+        rows = np.round(ys * np.cos(theta) - xs * np.sin(theta) + offset).astype(np.int64)
+        hist = np.bincount(rows - rows.min())
+        score = float(np.dot(hist, hist))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def _window_sums(a, radius: int):
+    """Sum over the (2r+1)x(2r+1) window around every pixel (edges replicated)."""
+    k = 2 * radius + 1
+    padded = np.pad(a, radius, mode="edge")
+    ii = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(padded, axis=0, dtype=np.float64), axis=1, out=ii[1:, 1:])
+    return ii[k:, k:] - ii[:-k, k:] - ii[k:, :-k] + ii[:-k, :-k]
+
+
+def sauvola(arr, window: int | None = None, k: float = SAUVOLA_K, r: float = SAUVOLA_R):
+    """Sauvola threshold of a uint8 array; returns a bool array, True = paper."""
+    if window is None:
+        # ~25 px for a 2000 px page, about two text heights
+        window = max(15, max(arr.shape) // 80)
+    radius = window // 2
+    area = float((2 * radius + 1) ** 2)
+    a = arr.astype(np.float64)
+    mean = _window_sums(a, radius) / area
+    sq_mean = _window_sums(a * a, radius) / area
+    std = np.sqrt(np.maximum(sq_mean - mean * mean, 0.0))
+    return a > mean * (1.0 + k * (std / r - 1.0))
+
+
+def despeckle(white, max_pixels: int = DESPECKLE_MAX_PIXELS):
+    """Turn tiny isolated ink blobs into paper; `white` is True for paper."""
+    ink = ~white
+    neighbourhood = _window_sums(ink.astype(np.float64), 2)
+    return white | (ink & (neighbourhood <= max_pixels + 0.5))
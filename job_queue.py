@@ -0,0 +1,325 @@
+"""Queue of OCR jobs that keeps a few documents in flight at once.
+
+Each job runs on its own thread with an OcrEngine taken from a small set
+of reusable engines (one per concurrent document), so a worker pool is
+started once per slot rather than once per file. Every job keeps its own
+page buffer and stats, so the GUI can show any finished or running job
+while the others continue.
+
+Nothing here touches Tk: callbacks arrive on job threads and the GUI
+marshals them itself.
+
+Environment:
+  AANAI_CONCURRENT_DOCS  documents OCR'd at the same time (default 2)
+
+ocr_engine (Tesseract, NumPy, Poppler bindings) and searchable_pdf are
+imported when first needed, so the GUI can build its window around a
+JobQueue before those modules are loaded.
+"""
+import itertools
+import os
+import threading
+import time
+
+from job_trace import PROFILE_SUFFIX, JobTrace, profiled
+from ocr_metrics import engine_labels
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+_job_ids = itertools.count(1)
+
+
+def default_concurrency() -> int:
+    try:
+        return max(1, int(os.environ.get("AANAI_CONCURRENT_DOCS", "2")))
+    except ValueError:
+        return 2
+
+
+def workers_per_document(concurrency: int) -> int:
+    """Split the OCR processes between documents so they do not oversubscribe the CPU."""
+    from ocr_engine import default_workers
+    return max(1, default_workers() // max(1, concurrency))
+
+
+class OcrJob:
+    """One file in the queue with its own output buffer and stats."""
+
+    def __init__(self, path: str, lang: str | None = None, pdf_path: str | None = None,
+                 profile_path: str | None = None):
+        self.id = next(_job_ids)
+        self.path = path
+        self.lang = lang
+        # Searchable PDF written during the OCR pass, if requested
+        self.pdf_path = pdf_path
+        # cProfile output of the job's thread, if requested
+        self.profile_path = profile_path
+        # Stage timings (job_trace.JobTrace) once the job has started
+        self.trace = None
+        self.state = QUEUED
+        self.status = ""
+        self.error = None
+        self.detected_lang = None
+        # page_num -> text; the job's own output buffer
+        self.pages = {}
+        # page_num -> PageLayout (word boxes and confidences) for OCR'd pages
+        self.layouts = {}
+        # Live engine stats while running, a snapshot afterwards
+        from ocr_engine import new_stats
+        self.stats = new_stats()
+        self.queued_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._engine = None
+        self._cancel_requested = False
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.path)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def text(self) -> str:
+        """The document text so far, pages in order (same separator as OcrEngine)."""
+        return "\n\n".join(self.pages[p] for p in sorted(self.pages))
+
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def eta(self) -> float | None:
+        """Seconds left, from the pages done so far; None until there is a rate."""
+        if self.state != RUNNING:
+            return None
+        total = self.stats.get('total_pages') or 0
+        done = self.stats.get('pages_processed') or 0
+        if not total or not done:
+            return None
+        return (total - done) * self.elapsed() / done
+
+
+class JobQueue:
+    """Run queued OcrJobs, at most `concurrency` at a time.
+
+    `make_engine(workers)` builds an OcrEngine. It is called on the new
+    job's thread without the queue's lock, so it may block; if it raises,
+    that job fails. With an ocr_metrics MetricsStore as `metrics`, every
+    finished job is appended to it.
+    Callbacks (job threads):
+
+    - on_update(job): state, status or progress changed
+    - on_page(job, page_num, total_pages, text): a page finished; its
+      PageLayout, if any, is already in job.layouts
+    """
+
+    def __init__(self, make_engine, concurrency: int | None = None, on_update=None, on_page=None,
+                 metrics=None):
+        self.make_engine = make_engine
+        self.metrics = metrics
+        self.concurrency = max(1, int(concurrency or default_concurrency()))
+        self.on_update = on_update
+        self.on_page = on_page
+        self.jobs = []
+        self._lock = threading.Lock()
+        self._idle_engines = []
+        self._engines = []
+        self._running = 0
+        self._closed = False
+
+    def add(self, paths, lang: str | None = None, searchable_pdf: bool = False,
+            profile: bool = False) -> list[OcrJob]:
+        from searchable_pdf import PDF_SUFFIX
+        jobs = [OcrJob(p, lang, os.path.splitext(p)[0] + PDF_SUFFIX if searchable_pdf else None,
+                       os.path.splitext(p)[0] + PROFILE_SUFFIX if profile else None) for p in paths]
+        with self._lock:
+            self.jobs.extend(jobs)
+        for job in jobs:
+            self._notify(job)
+        self._pump()
+        return jobs
+
+    def set_concurrency(self, concurrency: int):
+        """Change how many jobs run at once.
+
+        Engines get the matching worker count (see workers_per_document)
+        when they are handed their next job; running documents keep theirs.
+        """
+        with self._lock:
+            self.concurrency = max(1, int(concurrency))
+        self._pump()
+
+    def cancel(self, job: OcrJob):
+        with self._lock:
+            if job.state == QUEUED:
+                job.state = CANCELLED
+                job.finished_at = time.time()
+            elif job.state == RUNNING:
+                job._cancel_requested = True
+                if job._engine is not None:
+                    job._engine.cancel()
+        self._notify(job)
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            if not job.finished:
+                self.cancel(job)
+
+    def remove_finished(self) -> list[OcrJob]:
+        with self._lock:
+            removed = [j for j in self.jobs if j.finished]
+            self.jobs = [j for j in self.jobs if not j.finished]
+        return removed
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            counts = {}
+            for job in self.jobs:
+                counts[job.state] = counts.get(job.state, 0) + 1
+            return counts
+
+    def busy(self) -> bool:
+        with self._lock:
+            return any(j.state in (QUEUED, RUNNING) for j in self.jobs)
+
+    def close(self):
+        """Cancel everything and shut down the engines."""
+        with self._lock:
+            self._closed = True
+            engines = list(self._engines)
+        self.cancel_all()
+        for engine in engines:
+            engine.close()
+
+    def _pump(self):
+        """Start queued jobs while there are free slots."""
+        while True:
+            with self._lock:
+                if self._closed or self._running >= self.concurrency:
+                    return
+                job = next((j for j in self.jobs if j.state == QUEUED), None)
+                if job is None:
+                    return
+                job.state = RUNNING
+                job.started_at = time.time()
+                self._running += 1
+                # Without an idle engine, the job's thread builds one (see _run)
+                engine = self._idle_engines.pop() if self._idle_engines else None
+                if engine is not None:
+                    self._attach(job, engine)
+            threading.Thread(target=self._run, args=(job, engine), name=f"ocr-job-{job.id}",
+                             daemon=True).start()
+
+    def _attach(self, job: OcrJob, engine):
+        """Hand `engine` to `job`; called with the lock held."""
+        # An idle engine may have been built for another concurrency
+        engine.set_workers(workers_per_document(self.concurrency))
+        # Cleared here rather than when the job starts, so a cancel() that arrives
+        # in between is not lost; one that came before the engine is passed on
+        engine.reset_cancel()
+        if job._cancel_requested:
+            engine.cancel()
+        job._engine = engine
+
+    def _new_engine(self, job: OcrJob):
+        """Build and attach an engine on the job's thread; None if the job cannot run."""
+        try:
+            engine = self.make_engine(workers_per_document(self.concurrency))
+        except Exception as e:
+            self._finish_unstarted(job, FAILED, str(e))
+            return None
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._engines.append(engine)
+                self._attach(job, engine)
+        if closed:
+            # close() ran while the engine was being built and did not see it
+            engine.close()
+            self._finish_unstarted(job, CANCELLED)
+            return None
+        return engine
+
+    def _finish_unstarted(self, job: OcrJob, state: str, error: str | None = None):
+        """End a job that got a slot but never ran, and free the slot."""
+        with self._lock:
+            job.state = CANCELLED if job._cancel_requested else state
+            job.error = error
+            job.finished_at = time.time()
+            self._running -= 1
+        self._notify(job)
+
+    def _run(self, job: OcrJob, engine):
+        if engine is None:
+            engine = self._new_engine(job)
+            if engine is None:
+                self._pump()
+                return
+
+        def on_status(message):
+            job.status = message
+            self._notify(job)
+
+        def on_page_layout(page_num, layout):
+            job.layouts[page_num] = layout
+
+        def on_page(page_num, total_pages, text):
+            job.pages[page_num] = text
+            if self.on_page is not None:
+                try:
+                    self.on_page(job, page_num, total_pages, text)
+                except Exception:
+                    pass
+            self._notify(job)
+
+        engine.on_status = on_status
+        engine.on_busy = None
+        engine.on_page = on_page
+        engine.on_page_layout = on_page_layout
+        job.stats = engine.stats
+        job.trace = JobTrace(job.name)
+        self._notify(job)
+        from ocr_engine import OcrCancelled
+        try:
+            with profiled(job.profile_path):
+                _text, job.detected_lang = engine.ocr_file(job.path, job.lang, collect_text=False,
+                                                           pdf_path=job.pdf_path, trace=job.trace)
+            state = DONE
+        except OcrCancelled:
+            state = CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            state = FAILED
+        # The engine's stats dict is reused by its next job
+        job.stats = {k: (dict(v) if isinstance(v, dict) else list(v) if isinstance(v, list) else v)
+                     for k, v in engine.stats.items()}
+        labels = engine_labels(engine, job.lang)
+        with self._lock:
+            job.state = CANCELLED if job._cancel_requested and state != DONE else state
+            job.finished_at = time.time()
+            job._engine = None
+            engine.on_status = engine.on_page = engine.on_page_layout = None
+            self._idle_engines.append(engine)
+            self._running -= 1
+        if self.metrics is not None:
+            try:
+                self.metrics.record(job.stats, job.state, job.elapsed(), labels, job.error)
+            except Exception:
+                pass
+        self._notify(job)
+        self._pump()
+
+    def _notify(self, job):
+        if self.on_update is None:
+            return
+        try:
+            self.on_update(job)
+        except Exception:
+            pass
@@ -0,0 +1,177 @@
+"""Per-stage timing of OCR jobs, exportable as a Chrome trace.
+
+A JobTrace collects spans (stage, start, duration, page) from the job's
+thread, the PDF render thread, the Tk thread and pool worker processes.
+time.perf_counter() is a system-wide monotonic clock on Linux, macOS and
+Windows, so spans measured in a worker line up with the parent's.
+
+Stage totals and per-page totals feed the stats card and the batch
+output. save() writes the Chrome trace event format, which
+chrome://tracing and https://ui.perfetto.dev show as a timeline: one track
+per thread and worker process, plus one track per page from the moment it
+was rendered until its text was handed on, so stalls stand out.
+
+profiled() runs a block under cProfile. Only the calling thread is
+profiled (for a job: cache, detection and in-process Tesseract calls);
+pool workers show up in the trace instead.
+"""
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Stage names in pipeline order (also the order of the breakdowns)
+STAGES = ("setup", "pdfinfo", "text_layer", "pdfimages", "extract", "render", "render_wait", "cache",
+          "preprocess", "detect", "tesseract", "retry", "pdf_encode", "pdf_write", "gc", "callbacks", "ui")
+TRACE_SUFFIX = ".trace.json"
+PROFILE_SUFFIX = ".prof"
+
+
+def new_timing() -> dict:
+    """Timing dict for spans measured where no JobTrace is at hand (pool workers)."""
+    return {'pid': os.getpid(), 'tid': threading.get_ident(), 'spans': []}
+
+
+def record(timing: dict, stage: str, start: float, **args) -> float:
+    """Add a span that started at `start` (perf_counter) to `timing`; returns its seconds."""
+    seconds = time.perf_counter() - start
+    timing['spans'].append((stage, start, seconds, args or None))
+    return seconds
+
+
+def _stage_order(stage):
+    return STAGES.index(stage) if stage in STAGES else len(STAGES)
+
+
+def format_stages(stage_seconds: dict, limit: int = 4) -> str:
+    """The slowest stages as "tesseract 12.3s • render 2.1s"."""
+    top = sorted(stage_seconds.items(), key=lambda item: -item[1])[:limit]
+    return " • ".join(f"{stage} {seconds:.1f}s" for stage, seconds in top if seconds >= 0.05)
+
+
+class JobTrace:
+    """Timed spans of one OCR job; safe to add to from any thread."""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.origin = time.perf_counter()
+        self.started = time.time()
+        self._lock = threading.Lock()
+        # (stage, start, seconds, page, pid, tid, args)
+        self._spans = []
+        # page -> (start, end)
+        self._pages = {}
+        # (pid, tid) -> thread name
+        self._threads = {}
+        self._totals = {}
+
+    def add(self, stage: str, start: float, seconds: float, page: int | None = None, pid: int | None = None,
+            tid: int | None = None, args: dict | None = None):
+        """Record a span measured elsewhere; pid/tid default to the calling thread."""
+        if pid is None:
+            pid = os.getpid()
+        if tid is None:
+            tid = threading.get_ident()
+        thread = threading.current_thread().name if pid == os.getpid() else None
+        with self._lock:
+            self._spans.append((stage, start, seconds, page, pid, tid, args))
+            self._totals[stage] = self._totals.get(stage, 0.0) + seconds
+            if thread and (pid, tid) not in self._threads:
+                self._threads[(pid, tid)] = thread
+
+    @contextmanager
+    def span(self, stage: str, page: int | None = None, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, start, time.perf_counter() - start, page, args=args or None)
+
+    def add_timing(self, timing: dict, page: int | None = None):
+        """Record the spans of a new_timing() dict (e.g. returned by a pool worker)."""
+        for stage, start, seconds, args in timing.get('spans', ()):
+            self.add(stage, start, seconds, page, timing.get('pid'), timing.get('tid'), args)
+
+    def page(self, page: int, start: float, end: float | None = None):
+        """A page's lifetime, from render to delivery."""
+        with self._lock:
+            self._pages[page] = (start, time.perf_counter() if end is None else end)
+
+    def stage_seconds(self) -> dict[str, float]:
+        """Seconds per stage, summed over threads and workers (so it can exceed wall time)."""
+        with self._lock:
+            return dict(sorted(self._totals.items(), key=lambda item: _stage_order(item[0])))
+
+    def page_seconds(self) -> dict[int, dict[str, float]]:
+        """{page: {stage: seconds}} for spans tied to a page."""
+        pages = {}
+        with self._lock:
+            spans = list(self._spans)
+        for stage, _start, seconds, page, _pid, _tid, _args in spans:
+            if page is not None:
+                stages = pages.setdefault(page, {})
+                stages[stage] = stages.get(stage, 0.0) + seconds
+        return dict(sorted(pages.items()))
+
+    def slowest_pages(self, count: int = 3) -> list[tuple[int, float]]:
+        """(page, seconds from render to delivery) of the slowest pages."""
+        with self._lock:
+            lifetimes = [(page, end - start) for page, (start, end) in self._pages.items()]
+        return sorted(lifetimes, key=lambda item: -item[1])[:count]
+
+    def chrome_trace(self) -> dict:
+        """The trace in Chrome trace event format (timestamps in microseconds)."""
+        with self._lock:
+            spans = list(self._spans)
+            pages = dict(self._pages)
+            threads = dict(self._threads)
+        own_pid = os.getpid()
+
+        def us(t):
+            return round((t - self.origin) * 1e6, 1)
+
+        events = []
+        pids = {own_pid} | {pid for _s, _t, _d, _p, pid, _tid, _a in spans}
+        for pid in sorted(pids):
+            name = f"OCR {self.name}".strip() if pid == own_pid else f"OCR worker {pid}"
+            events.append({'ph': "M", 'name': "process_name", 'pid': pid, 'tid': 0, 'args': {'name': name}})
+        for (pid, tid), name in threads.items():
+            events.append({'ph': "M", 'name': "thread_name", 'pid': pid, 'tid': tid, 'args': {'name': name}})
+        for stage, start, seconds, page, pid, tid, args in spans:
+            event = {'ph': "X", 'name': stage, 'cat': "stage", 'ts': us(start), 'dur': round(seconds * 1e6, 1),
+                     'pid': pid, 'tid': tid}
+            if page is not None or args:
+                event['args'] = {**({'page': page} if page is not None else {}), **(args or {})}
+            events.append(event)
+        for page, (start, end) in sorted(pages.items()):
+            # Async events: each page gets its own track under the process
+            common = {'name': f"page {page}", 'cat': "page", 'id': page, 'pid': own_pid, 'tid': 0}
+            events.append({**common, 'ph': "b", 'ts': us(start)})
+            events.append({**common, 'ph': "e", 'ts': us(end)})
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': "ms",
+            'otherData': {'job': self.name, 'started': self.started,
+                          'stage_seconds': {k: round(v, 4) for k, v in self.stage_seconds().items()}},
+        }
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+
+
+@contextmanager
+def profiled(path: str | None):
+    """Run the block under cProfile and write pstats data to `path` (no-op for None)."""
+    if not path:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
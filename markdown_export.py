@@ -0,0 +1,197 @@
+"""Formatting runs of a Tk Text widget and their Markdown rendering.
+
+The widget is read with a single `Text.dump(..., text=True, tag=True)`
+call, which returns the text in segments together with the tag on/off
+transitions between them. Cost grows with the number of formatting runs
+and lines instead of with characters (the old export made three Tcl
+calls per character).
+
+Benchmark, without a display (synthetic dump output instead of a widget):
+    python -m markdown_export --size 1000000
+"""
+import argparse
+import random
+import sys
+import time
+
+# Inline tags and their Markdown markers, in the order they are opened and closed
+INLINE_MARKERS = (("bold", "**"), ("italic", "*"), ("underline", "_"))
+
+
+def iter_dump_lines(items, initial_tags=()):
+    """Lines of (text, tags) runs from Text.dump(text=True, tag=True) output, one at a time.
+
+    `initial_tags` are the tags already active at the dump's start index
+    (dump only reports transitions inside the range).
+    """
+    line = []
+    active = set(initial_tags)
+    tags = frozenset(active)
+    for key, value, _index in items:
+        if key == "tagon":
+            active.add(value)
+            tags = frozenset(active)
+        elif key == "tagoff":
+            active.discard(value)
+            tags = frozenset(active)
+        elif key == "text":
+            parts = value.split("\n")
+            for n, part in enumerate(parts):
+                if n:
+                    yield line
+                    line = []
+                if part:
+                    line.append((part, tags))
+    yield line
+
+
+def dump_lines(items, initial_tags=()) -> list[list[tuple[str, frozenset]]]:
+    """Split Text.dump(text=True, tag=True) output into lines of (text, tags) runs."""
+    return list(iter_dump_lines(items, initial_tags))
+
+
+def widget_lines(text, start: str, end: str) -> list[list[tuple[str, frozenset]]]:
+    """Whole lines from the line of `start` to the line of `end`, as (text, tags) runs."""
+    first = f"{text.index(start).split('.')[0]}.0"
+    last = f"{text.index(end).split('.')[0]}.end"
+    items = text.dump(first, last, text=True, tag=True)
+    return dump_lines(items, text.tag_names(first))
+
+
+def line_markdown(runs) -> str:
+    """One line of (text, tags) runs as Markdown (bullets, h1 and inline emphasis)."""
+    if not runs:
+        return ""
+    md = []
+    active = set()
+    for chunk, tags in runs:
+        for tag, marker in INLINE_MARKERS:
+            if tag in active and tag not in tags:
+                md.append(marker)
+                active.discard(tag)
+        for tag, marker in INLINE_MARKERS:
+            if tag in tags and tag not in active:
+                md.append(marker)
+                active.add(tag)
+        md.append(chunk)
+    for tag, marker in INLINE_MARKERS:
+        if tag in active:
+            md.append(marker)
+    line_md = "".join(md)
+    first_tags = runs[0][1]
+    if "h1" in first_tags:
+        line_md = f"# {line_md}"
+    plain = "".join(chunk for chunk, _tags in runs)
+    bullet_prefix = "- " if "bullet" in first_tags or plain.strip().startswith("• ") else ""
+    return bullet_prefix + line_md
+
+
+def widget_markdown(text, start: str = "1.0", end: str = "end") -> str:
+    """Markdown for the lines of a Text widget between two indices."""
+    return "\n".join(line_markdown(runs) for runs in widget_lines(text, start, end))
+
+
+def sample_dump(size: int, seed: int = 0) -> list[tuple[str, str, str]]:
+    """About `size` characters of formatted OCR-like text, as Text.dump(text=True, tag=True) items."""
+    rng = random.Random(seed)
+    words = ["ភាសាខ្មែរ", "អក្សរ", "ឯកសារ", "OCR", "text", "page", "scan", "ការអាន", "invoice", "2024"]
+    items = []
+    total = 0
+    ln = 0
+    while total < size:
+        ln += 1
+        line = " ".join(rng.choice(words) for _ in range(rng.randint(6, 14)))
+        total += len(line) + 1
+        if ln % 50 == 1:
+            items += [("tagon", "h1", f"{ln}.0"), ("text", line, f"{ln}.0"), ("tagoff", "h1", f"{ln}.{len(line)}")]
+        elif ln % 7 == 1:
+            start, end = rng.randint(0, 10), rng.randint(12, 40)
+            tag = rng.choice(["bold", "italic", "underline"])
+            items += [("text", line[:start], f"{ln}.0"), ("tagon", tag, f"{ln}.{start}"),
+                      ("text", line[start:end], f"{ln}.{start}"), ("tagoff", tag, f"{ln}.{end}"),
+                      ("text", line[end:], f"{ln}.{end}")]
+        else:
+            items.append(("text", line, f"{ln}.0"))
+        items.append(("text", "\n", f"{ln}.{len(line)}"))
+    return [item for item in items if item[0] != "text" or item[1]]
+
+
+def per_character_markdown(items) -> str:
+    """The old export's algorithm: one tag_names() lookup per character.
+
+    Tag lookups go to ranges taken from `items` instead of the Tcl
+    interpreter, so this times the per-character Python work only; the
+    real widget also paid three Tcl round trips per character.
+    """
+    texts, ranges = [], []
+    line, spans, opened = [], {}, {}
+    for key, value, index in items:
+        col = int(index.split(".")[1])
+        if key == "tagon":
+            opened[value] = col
+        elif key == "tagoff":
+            spans.setdefault(value, []).append((opened.pop(value), col))
+        else:
+            for n, part in enumerate(value.split("\n")):
+                if n:
+                    texts.append("".join(line))
+                    ranges.append(spans)
+                    line, spans = [], {}
+                line.append(part)
+    texts.append("".join(line))
+    ranges.append(spans)
+
+    def tag_names(ln, col):
+        return tuple(tag for tag, tag_spans in ranges[ln].items() if any(s <= col < e for s, e in tag_spans))
+
+    lines = []
+    for ln, txt in enumerate(texts):
+        if not txt:
+            lines.append("")
+            continue
+        md = []
+        active = set()
+        for col, ch in enumerate(txt):
+            tags = set(tag_names(ln, col))
+            for tag, marker in INLINE_MARKERS:
+                if tag in active and tag not in tags:
+                    md.append(marker)
+                    active.discard(tag)
+            for tag, marker in INLINE_MARKERS:
+                if tag in tags and tag not in active:
+                    md.append(marker)
+                    active.add(tag)
+            md.append(ch)
+        for tag, marker in INLINE_MARKERS:
+            if tag in active:
+                md.append(marker)
+        line_md = "".join(md)
+        if "h1" in tag_names(ln, 0):
+            line_md = f"# {line_md}"
+        bullet = "bullet" in tag_names(ln, 0) or txt.strip().startswith("• ")
+        lines.append(("- " if bullet else "") + line_md)
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m markdown_export",
+                                     description="Benchmark the run-based Markdown export against per-character lookups.")
+    parser.add_argument("--size", type=int, default=1_000_000, help="characters of sample text")
+    parser.add_argument("--skip-legacy", action="store_true", help="time only the run-based export")
+    args = parser.parse_args(argv)
+    items = sample_dump(args.size)
+    t0 = time.perf_counter()
+    fast = "\n".join(line_markdown(runs) for runs in iter_dump_lines(items))
+    fast_seconds = time.perf_counter() - t0
+    print(f"{args.size:,} chars • {len(items):,} dump items • run export {fast_seconds:.2f}s")
+    if not args.skip_legacy:
+        t0 = time.perf_counter()
+        slow = per_character_markdown(items)
+        slow_seconds = time.perf_counter() - t0
+        print(f"per-character export {slow_seconds:.2f}s • {slow_seconds / max(fast_seconds, 1e-9):.0f}x faster • "
+              f"identical output: {fast == slow}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""Reproducible OCR throughput and accuracy benchmark.
+
+Usage:
+    python -m ocr_bench --pages 12 --lang auto mixed --preprocess off all -o bench.json
+    python -m ocr_bench --compare before.json after.json
+
+Synthetic pages are rendered offline from fixed word lists with a seeded
+RNG: Khmer, English and mixed pages in Noto Sans Khmer (the bundled
+assets/fonts/NotoSansKhmer-Regular.ttf, or --font). They are saved as PNG
+pages and as multi-page image-only PDFs, and the text that was drawn is
+the ground truth, so a seed gives the same corpus on every machine.
+
+Every configuration (language hint x preprocessing x source x workers)
+runs through OcrEngine.ocr_file in its own spawned process, so the peak
+RSS it reports is its own. For each configuration the JSON output has
+pages/sec, peak RSS of the OCR process and of its largest child (CLI
+Tesseract or pool worker), and the character error rate (edit distance /
+reference length, whitespace collapsed), overall and per page kind. The
+metadata records the git commit, Tesseract version, font and whether
+Pillow shapes text with raqm, so files from different commits can be
+compared with --compare.
+
+Sources: "pdf" OCRs the PDFs the usual way (embedded page images),
+"render" re-renders every PDF page with pdftoppm, "image" OCRs the PNGs.
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, features
+
+from image_preprocess import parse_stages
+from ocr_engine import OcrEngine, resource_path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BUNDLED_FONT = os.path.join("assets", "fonts", "NotoSansKhmer-Regular.ttf")
+SYSTEM_FONTS = (
+    "/usr/share/fonts/truetype/noto/NotoSansKhmer-Regular.ttf",
+    "/usr/share/fonts/noto/NotoSansKhmer-Regular.ttf",
+    "/usr/share/fonts/google-noto/NotoSansKhmer-Regular.ttf",
+    "/Library/Fonts/NotoSansKhmer-Regular.ttf",
+    os.path.expanduser("~/Library/Fonts/NotoSansKhmer-Regular.ttf"),
+    r"C:\Windows\Fonts\NotoSansKhmer-Regular.ttf",
+    r"C:\Windows\Fonts\KhmerUI.ttf",
+)
+PAGE_KINDS = ("khm", "eng", "mixed")
+DEFAULT_SEED = 1234
+DEFAULT_DPI = 200
+# A4 at the corpus DPI, 12 pt text
+PAGE_INCHES = (8.27, 11.69)
+FONT_PT = 12
+LINE_SPACING = 1.6
+MARGIN_INCHES = 0.75
+
+KHMER_WORDS = (
+    "សួស្តី", "អរគុណ", "ប្រទេស", "កម្ពុជា", "ភាសា", "ខ្មែរ", "សាលារៀន", "សិស្ស", "គ្រូ", "សៀវភៅ",
+    "ទឹក", "បាយ", "ផ្ទះ", "ក្រុង", "ភ្នំពេញ", "ថ្ងៃ", "ខែ", "ឆ្នាំ", "មនុស្ស", "ការងារ",
+    "រដ្ឋាភិបាល", "សេដ្ឋកិច្ច", "អភិវឌ្ឍន៍", "វប្បធម៌", "ប្រវត្តិសាស្ត្រ", "អក្សរ", "ឯកសារ", "ព័ត៌មាន",
+    "បច្ចេកវិទ្យា", "កុំព្យូទ័រ", "ទូរស័ព្ទ", "ផ្លូវ", "ស្រុក", "ខេត្ត", "ភូមិ", "ទន្លេ", "សមុទ្រ", "ព្រៃឈើ",
+    "កសិកម្ម", "សុខភាព", "មន្ទីរពេទ្យ", "ការអប់រំ", "និង", "ជា", "នៅ", "ក្នុង", "របស់", "ដែល", "មាន",
+    "ពី", "ទៅ", "សម្រាប់", "ច្រើន", "ថ្មី", "ល្អ", "ធំ", "តូច", "១២៣", "២០២៤",
+)
+ENGLISH_WORDS = (
+    "the", "report", "invoice", "total", "amount", "date", "page", "document", "province", "district",
+    "village", "school", "student", "teacher", "health", "water", "rice", "market", "river", "road",
+    "ministry", "office", "number", "account", "payment", "service", "project", "budget", "annual",
+    "review", "public", "notice", "and", "of", "for", "with", "from", "new", "second", "quarter",
+    "Phnom", "Penh", "Cambodia", "Kingdom", "USD", "2024", "No.", "15/03", "12,500", "Ltd.",
+)
+
+
+# --- Corpus ---
+def find_font(path: str | None = None) -> str:
+    """The Khmer font for the corpus: --font, the bundled Noto Sans Khmer or a system copy."""
+    candidates = [path] if path else [resource_path(BUNDLED_FONT), *SYSTEM_FONTS]
+    for candidate in candidates:
+        if candidate and os.path.isfile(candidate):
+            return candidate
+    raise SystemExit("រកមិនឃើញពុម្ពអក្សរខ្មែរ: ដាក់ NotoSansKhmer-Regular.ttf ក្នុង assets/fonts ឬប្រើ --font")
+
+
+def _words(rng, kind: str):
+    while True:
+        if kind == "khm" or (kind == "mixed" and rng.random() < 0.5):
+            yield rng.choice(KHMER_WORDS)
+        else:
+            yield rng.choice(ENGLISH_WORDS)
+
+
+def render_page(rng, kind: str, font, dpi: int) -> tuple[Image.Image, str]:
+    """One synthetic page and the text drawn on it."""
+    width, height = int(PAGE_INCHES[0] * dpi), int(PAGE_INCHES[1] * dpi)
+    margin = int(MARGIN_INCHES * dpi)
+    line_height = int(font.size * LINE_SPACING)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    words = _words(rng, kind)
+    lines = []
+    y = margin
+    while y + line_height <= height - margin:
+        if lines and rng.random() < 0.12:
+            # Paragraph break
+            lines.append("")
+            y += line_height
+            continue
+        line = next(words)
+        while True:
+            word = next(words)
+            if draw.textlength(f"{line} {word}", font=font) > width - 2 * margin:
+                break
+            line = f"{line} {word}"
+        draw.text((margin, y), line, font=font, fill=0)
+        lines.append(line)
+        y += line_height
+    return image, "\n".join(lines).strip("\n")
+
+
+def build_corpus(work_dir: str, pages: int, per_pdf: int, seed: int, font_path: str, dpi: int) -> dict:
+    """Render the corpus into `work_dir` (reused when it was built with the same settings)."""
+    with open(font_path, "rb") as f:
+        font_hash = hashlib.sha256(f.read()).hexdigest()[:16]
+    params = {'pages': pages, 'per_pdf': per_pdf, 'seed': seed, 'dpi': dpi, 'font': font_hash,
+              'raqm': features.check("raqm")}
+    manifest_path = os.path.join(work_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get('params') == params:
+            return manifest
+    os.makedirs(work_dir, exist_ok=True)
+    layout = ImageFont.Layout.RAQM if params['raqm'] else ImageFont.Layout.BASIC
+    font = ImageFont.truetype(font_path, round(FONT_PT * dpi / 72), layout_engine=layout)
+    rng = random.Random(seed)
+    entries = []
+    images = []
+    for n in range(pages):
+        kind = PAGE_KINDS[n % len(PAGE_KINDS)]
+        image, truth = render_page(rng, kind, font, dpi)
+        png = os.path.join(work_dir, f"page{n + 1:03d}-{kind}.png")
+        image.save(png, dpi=(dpi, dpi))
+        entries.append({'id': n + 1, 'kind': kind, 'png': png, 'truth': truth})
+        images.append(image)
+    pdfs = []
+    for start in range(0, pages, per_pdf):
+        chunk = images[start:start + per_pdf]
+        pdf = os.path.join(work_dir, f"doc{start // per_pdf + 1:03d}.pdf")
+        chunk[0].save(pdf, "PDF", save_all=True, append_images=chunk[1:], resolution=float(dpi))
+        pdfs.append({'path': pdf, 'pages': [e['id'] for e in entries[start:start + per_pdf]]})
+    manifest = {'params': params, 'pages': entries, 'pdfs': pdfs}
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    return manifest
+
+
+# --- Accuracy ---
+def normalize(text: str) -> str:
+    """Collapse all whitespace, so line wrapping does not count as errors."""
+    return " ".join(text.split())
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance in code points (one NumPy row per character of the longer string)."""
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return len(a)
+    codes = np.array([ord(c) for c in b], dtype=np.int64)
+    idx = np.arange(len(b) + 1, dtype=np.int64)
+    prev = idx.copy()
+    cur = np.empty_like(prev)
+    for n, ch in enumerate(a, 1):
+        cur[0] = n
+        np.minimum(prev[1:] + 1, prev[:-1] + (codes != ord(ch)), out=cur[1:])
+        # Insertions: cur[j] = min over k <= j of cur[k] + (j - k)
+        prev = np.minimum.accumulate(cur - idx) + idx
+    return int(prev[-1])
+
+
+# --- Running one configuration ---
+def peak_rss_mb() -> tuple[float | None, float | None]:
+    """Peak RSS of this process and of its largest waited-for child, in MB."""
+    if resource is None:
+        return None, None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return (round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1))
+
+
+def config_key(config: dict) -> str:
+    return ",".join(f"{k}={config[k]}" for k in ("lang", "preprocess", "source", "workers"))
+
+
+def run_config(config: dict, manifest: dict) -> dict:
+    """OCR the corpus with one configuration (run in a fresh process)."""
+    truth = {e['id']: e for e in manifest['pages']}
+    if config['source'] == "image":
+        inputs = [(e['png'], [e['id']]) for e in manifest['pages']]
+    else:
+        inputs = [(d['path'], d['pages']) for d in manifest['pdfs']]
+    texts = {}
+    current = {}
+
+    def on_page(page_num, _total, text):
+        page_ids = current['ids']
+        if 0 < page_num <= len(page_ids):
+            texts[page_ids[page_num - 1]] = text
+
+    engine = OcrEngine(on_page=on_page, workers=config['workers'],
+                       use_embedded_images=config['source'] != "render",
+                       preprocess=parse_stages(config['preprocess']))
+    lang = None if config['lang'] == "auto" else config['lang']
+    error = None
+    start = time.perf_counter()
+    try:
+        with engine:
+            for path, page_ids in inputs:
+                current['ids'] = page_ids
+                engine.ocr_file(path, lang, collect_text=False)
+    except Exception as e:
+        error = str(e)
+    seconds = time.perf_counter() - start
+    rss, child_rss = peak_rss_mb()
+
+    errors = {kind: [0, 0] for kind in PAGE_KINDS}
+    for page_id, entry in truth.items():
+        ref = normalize(entry['truth'])
+        errors[entry['kind']][0] += edit_distance(normalize(texts.get(page_id, "")), ref)
+        errors[entry['kind']][1] += len(ref)
+    total_errors = sum(e for e, _n in errors.values())
+    total_chars = sum(n for _e, n in errors.values())
+    return {
+        'key': config_key(config),
+        'config': config,
+        'pages': len(texts),
+        'seconds': round(seconds, 3),
+        'pages_per_sec': round(len(texts) / seconds, 3) if seconds else None,
+        'rss_peak_mb': rss,
+        'child_rss_peak_mb': child_rss,
+        'reference_chars': total_chars,
+        'cer': round(total_errors / total_chars, 4) if total_chars else None,
+        'cer_by_kind': {k: round(e / n, 4) for k, (e, n) in errors.items() if n},
+        'lang_pages': engine.stats['lang_pages'],
+        'error': error,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _tesseract_version() -> str | None:
+    try:
+        import tess_backend
+        return tess_backend.backend_version()
+    except Exception:
+        return None
+
+
+def run_benchmark(args) -> dict:
+    font_path = find_font(args.font)
+    if not features.check("raqm"):
+        print("ព្រមាន: Pillow គ្មាន raqm; អក្សរខ្មែរនឹងមិនត្រូវបានផ្សំត្រឹមត្រូវ (CER មិនអាចប្រៀបធៀបជាមួយម៉ាស៊ីនដែលមាន raqm)",
+              file=sys.stderr)
+    work_dir = args.work_dir or os.path.join(tempfile.gettempdir(), "aanai-ocr-bench")
+    manifest = build_corpus(work_dir, args.pages, args.per_pdf, args.seed, font_path, args.dpi)
+    configs = [{'lang': lang, 'preprocess': prep, 'source': source, 'workers': workers}
+               for lang in args.lang for prep in args.preprocess for source in args.source
+               for workers in args.workers]
+    results = []
+    spawn = multiprocessing.get_context("spawn")
+    for config in configs:
+        # A fresh process per configuration keeps peak RSS and warm caches separate
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+            result = pool.submit(run_config, config, manifest).result()
+        results.append(result)
+        cer = f"{result['cer']:.2%}" if result['cer'] is not None else "-"
+        speed = f"{result['pages_per_sec']:.2f}" if result['pages_per_sec'] else "-"
+        print(f"{result['key']}: {speed} ទំព័រ/វិនាទី • CER {cer} • RSS {result['rss_peak_mb']} MB"
+              + (f" • បញ្ហា: {result['error']}" if result['error'] else ""))
+    return {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            'commit': _git_commit(),
+            'tesseract': _tesseract_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'font': os.path.basename(font_path),
+        },
+        'corpus': {**manifest['params'], 'kinds': list(PAGE_KINDS)},
+        'results': results,
+    }
+
+
+def compare(before_path: str, after_path: str):
+    """Print pages/sec, CER and RSS changes between two result files."""
+    with open(before_path, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(after_path, encoding="utf-8") as f:
+        after = json.load(f)
+    if before['corpus'] != after['corpus']:
+        print("ព្រមាន: corpus ខុសគ្នា; លទ្ធផលមិនអាចប្រៀបធៀបបានពេញលេញ", file=sys.stderr)
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    old = {r['key']: r for r in before['results']}
+    for new in after['results']:
+        prev = old.get(new['key'])
+        if prev is None:
+            print(f"{new['key']}: ថ្មី")
+            continue
+        parts = []
+        for field, label, fmt in (('pages_per_sec', "ទំព័រ/វិនាទី", "{:.2f}"), ('cer', "CER", "{:.2%}"),
+                                  ('rss_peak_mb', "RSS MB", "{:.0f}")):
+            a, b = prev.get(field), new.get(field)
+            if a is None or b is None:
+                continue
+            change = f" ({(b - a) / a:+.1%})" if a else ""
+            parts.append(f"{label} {fmt.format(a)} -> {fmt.format(b)}{change}")
+        print(f"{new['key']}: " + " • ".join(parts))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m ocr_bench",
+                                     description="OCR throughput and accuracy benchmark on a synthetic corpus.")
+    parser.add_argument("--pages", type=int, default=12, help="synthetic pages (Khmer, English and mixed in turn)")
+    parser.add_argument("--per-pdf", type=int, default=6, help="pages per generated PDF")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI, help="resolution of the generated pages")
+    parser.add_argument("--font", help="Khmer font file (default: assets/fonts/NotoSansKhmer-Regular.ttf)")
+    parser.add_argument("--work-dir", help="where the corpus is generated and reused")
+    parser.add_argument("--lang", nargs="+", default=["auto"], choices=("auto", "khm", "eng", "mixed"))
+    parser.add_argument("--preprocess", nargs="+", default=["off"], help="preprocessing specs, e.g. off all deskew,binarize")
+    parser.add_argument("--source", nargs="+", default=["pdf"], choices=("pdf", "render", "image"))
+    parser.add_argument("--workers", nargs="+", type=int, default=[1])
+    parser.add_argument("-o", "--output", help="write results as JSON here")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files and exit")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    report = run_benchmark(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"បានរក្សាទុក {args.output}")
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    return 1 if any(r['error'] for r in report['results']) else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""Persistent, content-addressed OCR result cache (SQLite) with LRU eviction.
+
+Keys are SHA-256 digests of everything that can change a result: the file
+or page content hash, the Tesseract language string, the preprocessing
+parameters and the engine version. Values are small JSON documents.
+Once the stored values exceed the size cap, the least recently used
+entries are evicted.
+
+Environment:
+  AANAI_CACHE_DIR     where ocr_cache.sqlite3 lives (default: per-user cache dir)
+  AANAI_CACHE_MAX_MB  size cap in MB (default 256; 0 disables the cache)
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_MAX_MB = 256
+CACHE_FILENAME = "ocr_cache.sqlite3"
+# Bump when the layout of cached values changes
+CACHE_SCHEMA = 1
+
+
+def default_cache_dir() -> str:
+    env = os.environ.get("AANAI_CACHE_DIR")
+    if env:
+        return env
+    if os.name == 'nt':
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "AanAI", "cache")
+    if sys.platform == "darwin":
+        return os.path.join(os.path.expanduser("~"), "Library", "Caches", "AanAI")
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "aanai")
+
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's content, read in blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_image(image) -> str:
+    """SHA-256 of a PIL image's pixels (plus mode and size)."""
+    h = hashlib.sha256()
+    h.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def make_key(*parts) -> str:
+    """Stable digest of arbitrary JSON-serialisable key parts."""
+    raw = json.dumps([CACHE_SCHEMA, *parts], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class OcrCache:
+    """Thread-safe SQLite key/value store with a byte cap and LRU eviction."""
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used)")
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @classmethod
+    def from_env(cls, filename: str = CACHE_FILENAME):
+        """Cache configured from AANAI_CACHE_* (None if disabled or unusable)."""
+        try:
+            max_mb = float(os.environ.get("AANAI_CACHE_MAX_MB", DEFAULT_MAX_MB))
+        except ValueError:
+            max_mb = DEFAULT_MAX_MB
+        if max_mb <= 0:
+            return None
+        try:
+            return cls(os.path.join(default_cache_dir(), filename), int(max_mb * 1024 * 1024))
+        except Exception:
+            return None
+
+    def get(self, key: str):
+        """Return the cached value (decoded JSON) or None; refreshes its LRU position."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        try:
+            return json.loads(row[0])
+        except ValueError:
+            return None
+
+    def put(self, key: str, value):
+        raw = json.dumps(value, ensure_ascii=False)
+        size = len(raw.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, raw, size, time.time()),
+            )
+            self._total += size - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Other processes may share the file; resync before trimming to 90% of the cap
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        if self._total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY last_used ASC").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self._total <= target:
+                break
+            doomed.append((key,))
+            self._total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._total = 0
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
@@ -0,0 +1,1169 @@
+"""Headless OCR engine (Tesseract + Poppler) shared by the GUI and the batch CLI.
+
+Nothing in this module touches Tk: progress is reported through plain
+callbacks so the same engine can run inside app.py or from `python -m batch_ocr`.
+"""
+import os
+import re
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import gc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from PIL import Image
+import pytesseract
+
+import tess_backend
+from app_paths import app_base_dir, no_window, resource_path
+from image_preprocess import run_pipeline, stages_from_env
+from job_trace import JobTrace, new_timing, record
+from ocr_cache import hash_file, hash_image, make_key
+from page_layout import PageLayout, min_confidence, parse_tsv
+from searchable_pdf import SearchablePdfWriter, encode_page_image
+from pdf_pages import (DEFAULT_CHUNK_SIZE, DEFAULT_DPI, extract_text_layer, iter_rendered_pages,
+                       pdf_page_count, pdf_page_geometry, render_dpi, single_image_pages,
+                       usable_text_layer)
+
+PDF_EXTENSIONS = (".pdf",)
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp")
+
+# Anything that changes what Tesseract sees; part of every cache key
+PREPROCESS_PARAMS = {'mode': 'L', 'max_side': 2000}
+
+# Per-page Tesseract deadline: base + seconds per megapixel (doubled for khm), capped
+TIMEOUT_BASE = 20.0
+TIMEOUT_PER_MP = 10.0
+TIMEOUT_MAX = 300.0
+# A page that times out is retried once at this fraction of its size
+RETRY_SCALE = 0.6
+# How long a cancelled parallel job waits for workers before killing them
+CANCEL_GRACE = 2.0
+
+# Cancellation event of the owning engine, set in pool workers by _init_pool_worker
+_worker_cancel = None
+
+
+class OcrCancelled(Exception):
+    """The job was cancelled with OcrEngine.cancel()."""
+
+
+# --- Language helpers ---
+def map_lang_to_tess(lang: str | None) -> str:
+    """Map our simple lang hint to Tesseract language codes."""
+    if not lang or lang == "mixed":
+        return "khm+eng"
+    l = lang.lower()
+    if "kh" in l or "km" in l:
+        return "khm"
+    return "eng"
+
+
+# Longest side of the English-only detection pre-pass (~140 DPI on A4/Letter)
+DETECT_MAX_SIDE = 1400
+_LATIN_WORD = re.compile(r"[(\"'“‘$€£#]?[A-Za-z0-9][A-Za-z0-9'’\".,:;!?()\-/$%&@#”]*")
+
+
+def classify_words(words) -> str:
+    """Decide 'eng', 'khm' or 'mixed' from (word, confidence) pairs of an eng-only pass.
+
+    English reads back as confident Latin words; Khmer script comes back
+    as low-confidence noise. Anything in between (or too little text to
+    judge) stays 'mixed', which is always safe.
+    """
+    tokens = [(w.strip(), c) for w, c in words if w and len(w.strip()) >= 2]
+    if len(tokens) < 5:
+        return "mixed"
+    good = sum(1 for w, c in tokens if c >= 70 and _LATIN_WORD.fullmatch(w))
+    ratio = good / len(tokens)
+    if ratio >= 0.8:
+        return "eng"
+    if ratio <= 0.05:
+        return "khm"
+    return "mixed"
+
+
+def detect_language(image):
+    """Fast per-page language detection for Khmer and English.
+
+    Runs a low-resolution eng-only pass so English-only pages can skip the
+    much slower khm model. Set AANAI_DETECT_LANG=0 to always use khm+eng.
+    """
+    if os.environ.get("AANAI_DETECT_LANG", "1") == "0":
+        return "mixed"
+    try:
+        small = image.convert('L')
+        w, h = small.size
+        if max(w, h) > DETECT_MAX_SIDE:
+            scale = DETECT_MAX_SIDE / float(max(w, h))
+            small = small.resize((int(w * scale), int(h * scale)), Image.BILINEAR)
+        return classify_words(run_tesseract_words(small, "eng", timeout_seconds=20))
+    except Exception:
+        pass
+
+    return "mixed"
+
+
+def detect_language_from_text(text: str) -> str:
+    """Language of already-extracted text, from Khmer vs Latin letters."""
+    khmer = sum(1 for c in text if '\u1780' <= c <= '\u17ff' or '\u19e0' <= c <= '\u19ff')
+    latin = sum(1 for c in text if c.isascii() and c.isalpha())
+    if khmer and latin:
+        return "mixed"
+    return "khm" if khmer else "eng"
+
+
+def merge_page_langs(langs) -> str | None:
+    """One language for a document: the common page language, else 'mixed'."""
+    unique = {l for l in langs if l}
+    if len(unique) == 1:
+        return unique.pop()
+    return "mixed" if unique else None
+
+
+# --- Image / Tesseract helpers ---
+def preprocess_image_for_ocr(image, lang="eng"):
+    """Preprocess with stability in mind: cap size and reduce to grayscale.
+
+    Tesseract binarizes internally, so colour only costs memory. 1-bit
+    images (fax/CCITT scans) are kept as they are. PDF pages normally arrive
+    already grayscale and within the cap, making this a no-op.
+    """
+    try:
+        max_side = PREPROCESS_PARAMS['max_side']  # cap the longest side
+        w, h = image.size
+        too_big = max(w, h) > max_side
+        # Convert to grayscale if needed (bilevel only when it must be resampled)
+        if image.mode != PREPROCESS_PARAMS['mode'] and (image.mode != "1" or too_big):
+            image = image.convert(PREPROCESS_PARAMS['mode'])
+
+        # Downscale very large images to reduce memory/CPU
+        if too_big:
+            scale = max_side / float(max(w, h))
+            new_size = (int(w * scale), int(h * scale))
+            image = image.resize(new_size, Image.BILINEAR)
+
+        return image
+
+    except Exception:
+        # If preprocessing fails, return original
+        return image
+
+
+def ocr_timeout(megapixels: float, tess_lang: str) -> float:
+    """Tesseract deadline scaled by page size; Khmer models are about twice as slow."""
+    per_mp = TIMEOUT_PER_MP * (2 if "khm" in tess_lang else 1)
+    return min(TIMEOUT_MAX, TIMEOUT_BASE + per_mp * megapixels)
+
+
+def run_tesseract_with_timeout(image: Image.Image, tess_lang: str, timeout_seconds: float = 60.0,
+                               cancel=None) -> str:
+    """Run Tesseract with a timeout to avoid indefinite stalls.
+    Prefers the persistent in-process API (tess_backend); falls back to the CLI.
+    `cancel` is a threading/multiprocessing Event that aborts the CLI run.
+    """
+    return run_tesseract_data(image, tess_lang, timeout_seconds, cancel, tsv=False)[0]
+
+
+def run_tesseract_data(image: Image.Image, tess_lang: str, timeout_seconds: float = 60.0,
+                       cancel=None, tsv: bool = True) -> tuple[str, str | None]:
+    """Like run_tesseract_with_timeout(), but returns (text, tsv) from one
+    recognition pass; tsv is Tesseract's word table (None with tsv=False).
+    """
+    if cancel is not None and cancel.is_set():
+        raise OcrCancelled("បានបោះបង់")
+    if tess_backend.backend_name() == "api":
+        if tsv:
+            result = tess_backend.api_image_to_data(image, tess_lang, timeout_seconds)
+        else:
+            text = tess_backend.api_image_to_string(image, tess_lang, timeout_seconds)
+            result = None if text is None else (text, None)
+        if result is not None:
+            return result
+    return _run_tesseract_cli(image, tess_lang, timeout_seconds, cancel, tsv)
+
+
+def _run_tesseract_cli(image: Image.Image, tess_lang: str, timeout_seconds: float, cancel=None,
+                       tsv: bool = False) -> tuple[str, str | None]:
+    """One `tesseract` process per image; killed on timeout or cancel so none are left behind."""
+    if image.mode not in ("1", "L", "RGB"):
+        image = image.convert("RGB")
+    if os.name == 'nt':
+        kwargs = no_window(subprocess.CREATE_NEW_PROCESS_GROUP)
+    else:
+        # Own process group, so wrapper scripts die together with tesseract
+        kwargs = {'start_new_session': True}
+    with tempfile.TemporaryDirectory(prefix="aanai-tess-") as tmp:
+        src = os.path.join(tmp, "page.png")
+        image.save(src)
+        base = os.path.join(tmp, "out")
+        # Both renderers write files from the same pass; plain text alone goes to stdout
+        args = [base, "-l", tess_lang, "txt", "tsv"] if tsv else ["stdout", "-l", tess_lang]
+        proc = subprocess.Popen(
+            [pytesseract.pytesseract.tesseract_cmd, src, *args],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs,
+        )
+        deadline = time.monotonic() + timeout_seconds
+        try:
+            while True:
+                try:
+                    out, err = proc.communicate(timeout=0.2)
+                    break
+                except subprocess.TimeoutExpired:
+                    if cancel is not None and cancel.is_set():
+                        raise OcrCancelled("បានបោះបង់")
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"OCR timed out after {timeout_seconds:.0f}s")
+        finally:
+            if proc.poll() is None:
+                _kill_process_tree(proc)
+                proc.communicate()
+        if proc.returncode:
+            raise RuntimeError(err.decode("utf-8", "replace").strip() or f"tesseract exit {proc.returncode}")
+        if not tsv:
+            return out.decode("utf-8", "replace"), None
+        with open(base + ".txt", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        with open(base + ".tsv", encoding="utf-8", errors="replace") as f:
+            return text, f.read()
+
+
+def run_tesseract_words(image: Image.Image, tess_lang: str, timeout_seconds: float = 60.0) -> list[tuple[str, float]]:
+    """Recognised words with their confidences (0-100)."""
+    if tess_backend.backend_name() == "api":
+        words = tess_backend.api_word_confidences(image, tess_lang, timeout_seconds)
+        if words is not None:
+            return words
+    data = pytesseract.image_to_data(image, lang=tess_lang, timeout=timeout_seconds,
+                                     output_type=pytesseract.Output.DICT)
+    words = []
+    for text, conf in zip(data.get('text', []), data.get('conf', [])):
+        try:
+            conf = float(conf)
+        except (TypeError, ValueError):
+            continue
+        if text and text.strip() and conf >= 0:
+            words.append((text, conf))
+    return words
+
+
+# --- Tesseract / Poppler discovery ---
+# Results of the one-time filesystem probes: 'tesseract', 'poppler', 'languages'
+# (installed language set of a system Tesseract) and the language sets found ready
+_discovery_lock = threading.Lock()
+_discovered = {}
+_langs_ready = set()
+
+
+def _discover(name, probe):
+    """probe() once per process; later calls return the stored result."""
+    with _discovery_lock:
+        if name not in _discovered:
+            _discovered[name] = probe()
+        return _discovered[name]
+
+
+def reset_discovery():
+    """Forget cached discovery, e.g. after installing Tesseract or traineddata while the app runs."""
+    with _discovery_lock:
+        _discovered.clear()
+        _langs_ready.clear()
+
+
+def _tesseract_candidates() -> list[str]:
+    return [
+        resource_path(os.path.join("vendor", "tesseract", "tesseract.exe")),
+        os.path.join(app_base_dir(), "vendor", "tesseract", "tesseract.exe"),
+        "C:/Program Files/Tesseract-OCR/tesseract.exe",
+    ]
+
+
+def _kill_process_tree(proc):
+    try:
+        if os.name == 'nt':
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True, timeout=10,
+                           **no_window())
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except Exception:
+        pass
+    if proc.poll() is None:
+        proc.kill()
+
+
+def find_tesseract_binary() -> str | None:
+    """Locate bundled or installed Tesseract binary; fall back to PATH (probed once)."""
+    def probe():
+        for c in _tesseract_candidates():
+            if os.path.exists(c):
+                return c
+        return shutil.which("tesseract")
+    return _discover('tesseract', probe)
+
+
+def preferred_tessdata_dir(tess_cmd: str | None) -> str | None:
+    """Choose tessdata directory, preferring bundled vendor path; create it if needed."""
+    for builder in (
+        lambda: resource_path(os.path.join("vendor", "tesseract", "tessdata")),
+        lambda: os.path.join(app_base_dir(), "vendor", "tesseract", "tessdata"),
+    ):
+        try:
+            p = builder()
+            parent = os.path.dirname(p)
+            if os.path.isdir(p) or os.path.isdir(parent):
+                os.makedirs(p, exist_ok=True)
+                return p
+        except Exception:
+            pass
+    if tess_cmd:
+        try:
+            cand = os.path.join(os.path.dirname(tess_cmd), "tessdata")
+            if os.path.isdir(os.path.dirname(cand)):
+                os.makedirs(cand, exist_ok=True)
+                return cand
+        except Exception:
+            pass
+    return None
+
+
+def ensure_traineddata(lang_codes: list[str], tess_cmd: str | None) -> tuple[bool, str, str | None]:
+    """Ensure required .traineddata files are present in tessdata; download if missing.
+    Also set TESSDATA_PREFIX to the tessdata directory itself (Windows-friendly).
+    """
+    td_dir = preferred_tessdata_dir(tess_cmd)
+    if not td_dir:
+        return False, "មិនអាចកំណត់ទីតាំង tessdata បានទេ", None
+    # Point to tessdata directly
+    try:
+        os.environ["TESSDATA_PREFIX"] = td_dir
+    except Exception:
+        pass
+    missing = []
+    for l in lang_codes:
+        dest = os.path.join(td_dir, f"{l}.traineddata")
+        if os.path.exists(dest):
+            continue
+        missing.append((l, dest))
+    if not missing:
+        return True, f"tessdata រួចរាល់នៅ: {td_dir}", td_dir
+    import requests  # only needed for downloads
+    for l, dest in missing:
+        ok = False
+        for url in (
+            f"https://github.com/tesseract-ocr/tessdata/raw/main/{l}.traineddata",
+            f"https://github.com/tesseract-ocr/tessdata_best/raw/main/{l}.traineddata",
+        ):
+            try:
+                r = requests.get(url, timeout=60)
+                if r.status_code == 200 and r.content:
+                    with open(dest, "wb") as f:
+                        f.write(r.content)
+                    ok = True
+                    break
+            except Exception:
+                continue
+        if not ok:
+            return False, f"ខកខានទាញយក {l}.traineddata ទៅ {td_dir}", td_dir
+    return True, f"បានតម្លើង traineddata ទៅ: {td_dir}", td_dir
+
+
+def _use_tesseract(tess: str):
+    """Point pytesseract at the binary and put its directory on PATH once."""
+    pytesseract.pytesseract.tesseract_cmd = tess
+    # Vendor dir first on PATH so tesseract DLLs resolve at runtime; PATH is not grown on later calls
+    vendor_dir = os.path.dirname(tess)
+    if vendor_dir and os.path.isdir(vendor_dir):
+        path = os.environ.get("PATH", "")
+        if vendor_dir not in path.split(os.pathsep):
+            os.environ["PATH"] = vendor_dir + os.pathsep + path
+
+
+def ensure_lang_available(lang_hint: str | None = None) -> tuple[bool, str]:
+    """Ensure Tesseract binary and required languages are available.
+
+    Discovery runs once per process: the binary location, a system
+    install's language list and every language set found ready are
+    cached (reset_discovery() forgets them). Failures are not cached, so
+    installing a missing language and trying again works.
+    """
+    tess = find_tesseract_binary()
+    if not tess:
+        return False, "រកមិនឃើញ Tesseract។ សូមដំឡើង ឬ ពិនិត្យ vendor/tesseract"
+    try:
+        _use_tesseract(tess)
+    except Exception:
+        pass
+    # khm and eng required; for mixed content prefer both
+    langs = map_lang_to_tess(lang_hint).split("+")
+    ready_key = (tess, tuple(langs))
+    if ready_key in _langs_ready:
+        return True, f"Tesseract រួចរាល់នៅ: {tess}"
+    if tess not in _tesseract_candidates():
+        # System install found on PATH: trust its own tessdata instead of writing next to the binary
+        try:
+            installed = _discover('languages', lambda: frozenset(pytesseract.get_languages(config="")))
+        except Exception as e:
+            return False, f"មិនអាចដំណើរការ Tesseract បានទេ: {e}"
+        missing = [l for l in langs if l not in installed]
+        if missing:
+            # Look again next time, in case the traineddata is installed meanwhile
+            with _discovery_lock:
+                _discovered.pop('languages', None)
+            return False, f"បាត់ភាសា {', '.join(missing)} ក្នុង tessdata របស់ {tess}"
+        _langs_ready.add(ready_key)
+        return True, f"Tesseract រួចរាល់នៅ: {tess}"
+    ok, msg, td = ensure_traineddata(langs, tess)
+    # Ensure TESSDATA_PREFIX is set even if files already existed
+    if td:
+        try:
+            os.environ["TESSDATA_PREFIX"] = td
+        except Exception:
+            pass
+    if ok:
+        _langs_ready.add(ready_key)
+    return (ok, msg)
+
+
+def guess_poppler_path() -> str | None:
+    """Windows-only: locate Poppler bin directory if bundled or installed (probed once)."""
+    def probe():
+        candidates = [
+            resource_path(os.path.join("vendor", "poppler", "bin")),
+            os.path.join(app_base_dir(), "vendor", "poppler", "bin"),
+            r"C:\\Program Files\\poppler\\bin",
+            r"C:\\Program Files (x86)\\poppler\\bin",
+            r"C:\\poppler\\bin",
+        ]
+        for p in candidates:
+            if os.path.isdir(p):
+                return p
+        return None
+    return _discover('poppler', probe)
+
+
+def ocr_rendered_page(page, lang: str | None = None, timeout_seconds: float | None = None, stages=(),
+                      cancel=None, pdf_image: bool = False):
+    """Preprocess, detect (if no lang given) and OCR one page; top-level so
+    process pool workers can run it. `stages` are image_preprocess pipeline
+    stages. The timeout defaults to ocr_timeout() for the page size; a page
+    that times out is retried once at RETRY_SCALE before TimeoutError is
+    raised. Returns (text, lang, timing, layout, image) where timing holds
+    detect_seconds, ocr_seconds, megapixels, preprocess ({stage: seconds}),
+    retried and the page's job_trace spans, layout is the page's PageLayout
+    (None if Tesseract gave no word data) and image, with pdf_image, is the
+    page Tesseract read, encoded for a searchable PDF (compressed here so
+    pool workers send back a small payload).
+    """
+    timing = new_timing()
+    if cancel is None:
+        cancel = _worker_cancel
+    try:
+        # Preprocess page for better OCR
+        t0 = time.perf_counter()
+        processed_page = preprocess_image_for_ocr(page, lang)
+        if stages:
+            processed_page, timing['preprocess'] = run_pipeline(processed_page, stages)
+        record(timing, "preprocess", t0, **{k: round(v, 4) for k, v in timing.get('preprocess', {}).items()})
+        if lang is None:
+            t0 = time.perf_counter()
+            lang = detect_language(processed_page)
+            timing['detect_seconds'] = record(timing, "detect", t0, lang=lang)
+        megapixels = processed_page.size[0] * processed_page.size[1] / 1e6
+        timing['megapixels'] = megapixels
+        tess_lang = map_lang_to_tess(lang)
+        t0 = time.perf_counter()
+        try:
+            text, tsv = run_tesseract_data(processed_page, tess_lang,
+                                           timeout_seconds or ocr_timeout(megapixels, tess_lang), cancel)
+            timing['ocr_seconds'] = record(timing, "tesseract", t0, lang=tess_lang, megapixels=round(megapixels, 2))
+        except TimeoutError:
+            record(timing, "tesseract", t0, lang=tess_lang, megapixels=round(megapixels, 2), timed_out=True)
+            t0 = time.perf_counter()
+            w, h = processed_page.size
+            smaller = processed_page.convert("L").resize(
+                (max(1, int(w * RETRY_SCALE)), max(1, int(h * RETRY_SCALE))), Image.BILINEAR)
+            timing['retried'] = True
+            text, tsv = run_tesseract_data(smaller, tess_lang,
+                                           ocr_timeout(megapixels * RETRY_SCALE ** 2, tess_lang), cancel)
+            record(timing, "retry", t0, lang=tess_lang)
+        encoded = None
+        if pdf_image:
+            t0 = time.perf_counter()
+            encoded = encode_page_image(processed_page)
+            record(timing, "pdf_encode", t0)
+        return text, lang, timing, parse_tsv(tsv) if tsv else None, encoded
+    finally:
+        del page
+        # Runs before the caller sees `timing`, so the collection is part of the page's spans
+        t0 = time.perf_counter()
+        gc.collect()
+        record(timing, "gc", t0)
+
+
+def _init_pool_worker(tesseract_cmd: str, environ: dict, cancel=None):
+    """Give pool processes the same Tesseract binary/tessdata and cancel event as the parent."""
+    global _worker_cancel
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    os.environ.update(environ)
+    _worker_cancel = cancel
+
+
+def default_workers() -> int:
+    """Worker processes for PDF pages: AANAI_OCR_WORKERS or the CPU count."""
+    try:
+        n = int(os.environ.get("AANAI_OCR_WORKERS", "0"))
+    except ValueError:
+        n = 0
+    return n if n > 0 else (os.cpu_count() or 1)
+
+
+def is_supported_file(path: str) -> bool:
+    ext = os.path.splitext(path)[1].lower()
+    return ext in PDF_EXTENSIONS or ext in IMAGE_EXTENSIONS
+
+
+def new_stats() -> dict:
+    return {
+        'start_time': None,
+        'file_size': 0,
+        'pages_processed': 0,
+        'total_pages': 0,
+        'characters_extracted': 0,
+        'processing_speed': 0,
+        'cache_hits': 0,
+        'cache_misses': 0,
+        'lang_pages': {},
+        'detect_seconds': 0.0,
+        'lang_time_saved': 0.0,
+        'text_layer_pages': 0,
+        'embedded_image_pages': 0,
+        'preprocess_seconds': {},
+        'stage_seconds': {},
+        'timeout_retries': 0,
+        'timeout_pages': [],
+        'words': 0,
+        'uncertain_words': 0,
+        'ocr_engine': 'Tesseract'
+    }
+
+
+class OcrEngine:
+    """OCR images and PDFs without any GUI.
+
+    Progress is reported through optional callbacks, all invoked from the
+    thread that runs the OCR (the GUI marshals them onto Tk itself):
+
+    - on_status(message): short human readable progress message
+    - on_busy(busy): True while Tesseract is working on a page, False after
+    - on_page(page_num, total_pages, text): a page has been recognised;
+      with workers > 1 pages arrive in completion order, not page order
+    - on_page_layout(page_num, layout): the page's PageLayout (words with
+      boxes and confidences), just before its on_page; not sent for pages
+      taken from a PDF text layer
+
+    PDF pages are rendered `chunk_size` at a time on a background thread.
+    With workers > 1 the rendered pages are spread over a process pool that
+    lives until close() so a batch run does not pay the spawn cost per file.
+
+    With use_text_layer, PDF pages whose embedded text is usable (born-digital
+    pages) are taken from pdftotext and never rasterized. With
+    use_embedded_images, scanned pages that are a single full-page bitmap
+    are OCR'd from that bitmap at native resolution instead of re-rendered.
+
+    With an OcrCache, ocr_file() first looks up the whole file by content
+    hash, then each rendered page by pixel hash, so unchanged pages of an
+    edited PDF are not OCR'd again.
+
+    cancel() stops the running job from any thread: CLI Tesseract processes
+    (also those in pool workers) are killed and ocr_file() raises
+    OcrCancelled. Pages that still time out after their reduced-resolution
+    retry are left empty and listed in stats['timeout_pages'] rather than
+    failing the whole PDF.
+
+    `preprocess` lists image_preprocess stages (orient, deskew, binarize,
+    despeckle) to run on every OCR'd page; None reads AANAI_PREPROCESS.
+
+    Every stage of a job (pdfinfo, rendering, preprocessing, detection,
+    Tesseract, gc, callbacks...) is timed into `trace`, a job_trace.JobTrace
+    that ocr_file() replaces per file; stats['stage_seconds'] holds its
+    totals.
+    """
+
+    def __init__(self, on_status=None, on_busy=None, on_page=None, on_page_layout=None, workers: int = 1,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, cache=None, use_text_layer: bool = True,
+                 use_embedded_images: bool = True, preprocess=None):
+        self.on_status = on_status
+        self.on_busy = on_busy
+        self.on_page = on_page
+        self.on_page_layout = on_page_layout
+        self.workers = max(1, int(workers or 1))
+        self.chunk_size = max(1, int(chunk_size or DEFAULT_CHUNK_SIZE))
+        self.cache = cache
+        self.use_text_layer = use_text_layer
+        self.use_embedded_images = use_embedded_images
+        self.preprocess = stages_from_env() if preprocess is None else tuple(preprocess)
+        self.stats = new_stats()
+        # multiprocessing Event so pool workers see it too
+        self._cancel = multiprocessing.Event()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._engine_version = None
+        # Running Tesseract cost (seconds per megapixel) per language string
+        self._sec_per_mp = {}
+        # page_num -> layout dict of the current file, for its document cache entry
+        self._doc_layouts = {}
+        # Searchable PDF being written by ocr_file(pdf_path=...), and its page sizes in points
+        self._pdf = None
+        self._page_sizes = {}
+        self.trace = JobTrace()
+        # page_num -> perf_counter when the page came out of the renderer
+        self._page_started = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def cancel(self):
+        """Ask the running job to stop; safe to call from any thread.
+
+        The request stays in effect, also for a job that has been handed
+        this engine but not started yet, until reset_cancel().
+        """
+        self._cancel.set()
+        self._emit(self.on_status, "កំពុងបោះបង់...")
+
+    def reset_cancel(self):
+        """Clear an earlier cancel(); call when the engine is assigned its next job."""
+        self._cancel.clear()
+
+    def set_workers(self, workers: int):
+        """Change the number of worker processes; call between documents.
+
+        A pool of the old size is shut down and the next document starts a new one.
+        """
+        workers = max(1, int(workers or 1))
+        with self._pool_lock:
+            if workers == self.workers:
+                return
+            self.workers = workers
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def _check_cancel(self):
+        if self._cancel.is_set():
+            raise OcrCancelled("បានបោះបង់")
+
+    def close(self):
+        """Shut down the worker pool, if one was started.
+
+        The in-process API handles are pooled for every engine in the process
+        and stay open; tess_backend.close_all() frees them at shutdown.
+        """
+        self._cancel.set()
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if self.cache is not None:
+            self.cache.close()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                environ = {k: os.environ[k] for k in ("TESSDATA_PREFIX", "PATH") if k in os.environ}
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_pool_worker,
+                    initargs=(pytesseract.pytesseract.tesseract_cmd, environ, self._cancel),
+                )
+            return self._pool
+
+    def _discard_pool(self):
+        """Kill the worker processes, e.g. when they are stuck in an API call after cancel()."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        # ProcessPoolExecutor has no public way to stop running tasks
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for proc in processes:
+            try:
+                proc.kill()
+            except Exception:
+                pass
+
+    def _emit(self, callback, *args):
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception:
+            pass
+
+    def update_stats(self, file_path=None, page_num=None, total_pages=None, text_length=None):
+        """Update processing statistics"""
+        stats = self.stats
+        if file_path:
+            stats['start_time'] = time.time()
+            stats['file_size'] = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+            stats['pages_processed'] = 0
+            stats['total_pages'] = 0
+            stats['characters_extracted'] = 0
+            stats['cache_hits'] = 0
+            stats['cache_misses'] = 0
+            stats['lang_pages'] = {}
+            stats['detect_seconds'] = 0.0
+            stats['lang_time_saved'] = 0.0
+            stats['text_layer_pages'] = 0
+            stats['embedded_image_pages'] = 0
+            stats['preprocess_seconds'] = {}
+            stats['stage_seconds'] = {}
+            stats['timeout_retries'] = 0
+            stats['timeout_pages'] = []
+            stats['words'] = 0
+            stats['uncertain_words'] = 0
+
+        if total_pages:
+            stats['total_pages'] = total_pages
+
+        if page_num:
+            stats['pages_processed'] = page_num
+
+        if text_length:
+            stats['characters_extracted'] += text_length
+
+        # Calculate processing speed
+        if stats['start_time']:
+            elapsed = time.time() - stats['start_time']
+            if elapsed > 0:
+                stats['processing_speed'] = stats['pages_processed'] / elapsed
+
+    def _record_page_lang(self, lang, timing=None):
+        """Count the page's language, add up its timings and estimate time saved versus khm+eng."""
+        stats = self.stats
+        tess_lang = map_lang_to_tess(lang)
+        stats['lang_pages'][tess_lang] = stats['lang_pages'].get(tess_lang, 0) + 1
+        if not timing:
+            return
+        stats['detect_seconds'] += timing.get('detect_seconds', 0.0)
+        if timing.get('retried'):
+            stats['timeout_retries'] += 1
+        for stage, seconds in timing.get('preprocess', {}).items():
+            stats['preprocess_seconds'][stage] = stats['preprocess_seconds'].get(stage, 0.0) + seconds
+        mp, seconds = timing.get('megapixels'), timing.get('ocr_seconds')
+        if not mp or seconds is None:
+            return
+        prev = self._sec_per_mp.get(tess_lang)
+        cost = seconds / mp
+        self._sec_per_mp[tess_lang] = cost if prev is None else prev * 0.8 + cost * 0.2
+        baseline = self._sec_per_mp.get("khm+eng")
+        if tess_lang != "khm+eng" and baseline is not None:
+            stats['lang_time_saved'] += max(0.0, baseline - self._sec_per_mp[tess_lang]) * mp
+
+    def _detect(self, page, page_num=None):
+        t0 = time.perf_counter()
+        lang = detect_language(page)
+        seconds = time.perf_counter() - t0
+        self.trace.add("detect", t0, seconds, page_num, args={'lang': lang})
+        return lang, {'detect_seconds': seconds}
+
+    # --- Cache ---
+    def _cache_key(self, kind: str, content_hash: str, lang: str | None, *extra) -> str:
+        if self._engine_version is None:
+            self._engine_version = tess_backend.backend_version()
+        lang_key = map_lang_to_tess(lang) if lang else "auto"
+        params = PREPROCESS_PARAMS
+        if self.preprocess:
+            params = {**params, 'pipeline': list(self.preprocess)}
+        return make_key(kind, content_hash, lang_key, params, self._engine_version, *extra)
+
+    def _cache_get(self, key):
+        if self.cache is None or key is None:
+            return None
+        try:
+            hit = self.cache.get(key)
+        except Exception:
+            hit = None
+        self.stats['cache_hits' if hit is not None else 'cache_misses'] += 1
+        return hit
+
+    def _cache_put(self, key, value):
+        if self.cache is None or key is None:
+            return
+        try:
+            self.cache.put(key, value)
+        except Exception:
+            pass
+
+    def _page_key(self, page, lang):
+        if self.cache is None:
+            return None
+        return self._cache_key("page", hash_image(page), lang)
+
+    def ocr_file(self, path, lang: str = None, collect_text: bool = True, pdf_path: str | None = None,
+                 trace: JobTrace | None = None):
+        """OCR a PDF or image file; returns (text, detected_lang).
+
+        With collect_text=False the pages are only delivered through on_page
+        and text is None, so callers that stream pages do not also get a
+        joined copy of the whole document. With pdf_path, a searchable PDF
+        (page image + invisible text) is written there page by page from
+        the same render and OCR pass; every page is then rendered, text
+        layer or not, and the whole-document cache is not read. Stage
+        timings go to `trace` (a new JobTrace by default, kept in
+        self.trace). Raises OcrCancelled if cancel() is called while it runs.
+        """
+        # Before anything can fail, so a failed file's stats are its own and not the previous file's
+        self.update_stats(file_path=path)
+        self.trace = trace if trace is not None else JobTrace(os.path.basename(path))
+        self._page_started = {}
+        self._pdf = SearchablePdfWriter(pdf_path) if pdf_path is not None else None
+        try:
+            result = self._ocr_file(path, lang, collect_text)
+            if self._pdf is not None:
+                self._pdf.close()
+            return result
+        except BaseException:
+            if self._pdf is not None:
+                self._pdf.abort()
+            raise
+        finally:
+            self._pdf = None
+            self._page_sizes = {}
+            self.stats['stage_seconds'] = self.trace.stage_seconds()
+
+    def _ocr_file(self, path, lang, collect_text):
+        self._doc_layouts = {}
+        with self.trace.span("setup"):
+            ok, hint = ensure_lang_available(lang or "mixed")
+        if not ok:
+            raise RuntimeError(hint)
+        self.stats['ocr_engine'] = f"Tesseract ({tess_backend.backend_name()})"
+        ext = os.path.splitext(path)[1].lower()
+        is_pdf = ext in PDF_EXTENSIONS
+
+        doc_key = None
+        if self.cache is not None:
+            # Writing a searchable PDF OCRs born-digital pages too, like use_text_layer=False
+            text_layer = self.use_text_layer and self._pdf is None
+            with self.trace.span("cache"):
+                doc_key = self._cache_key("doc", hash_file(path), lang,
+                                          (DEFAULT_DPI, "fit", text_layer, self.use_embedded_images)
+                                          if is_pdf else None)
+                # A cached document has no page images to put in the PDF
+                hit = self._cache_get(doc_key) if self._pdf is None else None
+            if hit is not None:
+                pages = self._replay_cached(hit)
+                return ("\n\n".join(t for _i, t in pages) if collect_text else None), hit.get('lang')
+
+        if is_pdf:
+            pages, detected_lang = self._ocr_pdf_pages(path, lang)
+        else:
+            text, detected_lang = self.ocr_image(path, lang)
+            pages = [(1, text)]
+        if self.stats['timeout_pages']:
+            # Incomplete result: let the next run try those pages again
+            doc_key = None
+        self._cache_put(doc_key, {
+            'pages': pages,
+            'lang': detected_lang,
+            'total_pages': self.stats['total_pages'],
+            'layouts': self._doc_layouts,
+        })
+        self._doc_layouts = {}
+        return ("\n\n".join(t for _i, t in pages) if collect_text else None), detected_lang
+
+    def _replay_cached(self, hit):
+        """Report a cached document through the usual callbacks."""
+        pages = [(int(i), t) for i, t in hit['pages']]
+        total_pages = hit.get('total_pages') or len(pages)
+        # JSON turned the page numbers into strings
+        layouts = hit.get('layouts') or {}
+        self._emit(self.on_status, "បានយកលទ្ធផលពីឃ្លាំងផ្ទុក (cache)")
+        self.update_stats(total_pages=total_pages)
+        for done, (i, text) in enumerate(pages, 1):
+            self.update_stats(page_num=done, text_length=len(text))
+            self._layout_done(i, PageLayout.from_dict(layouts.get(str(i))))
+            self._emit(self.on_page, i, total_pages, text)
+        return pages
+
+    def ocr_image(self, path, lang: str = None):
+        try:
+            self._page_started[1] = time.perf_counter()
+            img = Image.open(path)
+            timing = {}
+            if lang is None and not self.preprocess:
+                lang, timing = self._detect(img, 1)
+                self._emit(self.on_status, f"រកឃើញភាសា: {lang}")
+            self.update_stats(total_pages=1)
+
+            self._emit(self.on_busy, True)
+            self._emit(self.on_status, "កំពុងអានអក្សរ...")
+            try:
+                text, lang, ocr_timing, layout, encoded = ocr_rendered_page(
+                    img, lang, stages=self.preprocess, cancel=self._cancel, pdf_image=self._pdf is not None)
+            finally:
+                self._emit(self.on_busy, False)
+
+            self.trace.add_timing(ocr_timing, 1)
+            self._record_page_lang(lang, {**timing, **ocr_timing})
+            if self._pdf is not None:
+                dpi = img.info.get("dpi") or (DEFAULT_DPI, DEFAULT_DPI)
+                self._page_sizes[1] = (img.width * 72.0 / float(dpi[0] or DEFAULT_DPI),
+                                       img.height * 72.0 / float(dpi[1] or DEFAULT_DPI))
+            self._page_done({}, 1, 1, text, lang, layout, encoded)
+            return text, lang
+        except OcrCancelled:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"ការអានអក្សរពីរូបភាពបរាជ័យ: {e}")
+
+    def ocr_pdf(self, path, lang: str = None):
+        pages, detected_lang = self._ocr_pdf_pages(path, lang)
+        return "\n\n".join(t for _i, t in pages), detected_lang
+
+    def _ocr_pdf_pages(self, path, lang):
+        """OCR every page; returns ([(page_num, text), ...] in page order, detected_lang)."""
+        poppler_path = guess_poppler_path()
+        # Get page count first to stream pages chunk-by-chunk
+        try:
+            with self.trace.span("pdfinfo"):
+                total_pages = pdf_page_count(path, poppler_path)
+        except Exception as e:
+            raise RuntimeError(f"មិនអាចអានព័ត៌មាន PDF បានទេ: {e}")
+
+        self.update_stats(total_pages=total_pages)
+        results = {}
+        to_render = list(range(1, total_pages + 1))
+        # Born-digital pages need an image in a searchable PDF too
+        if self.use_text_layer and self._pdf is None:
+            to_render = self._take_text_layer(path, total_pages, poppler_path, lang, results)
+        extract = set()
+        geometry = {}
+        if to_render:
+            try:
+                with self.trace.span("pdfinfo", pages=total_pages):
+                    geometry = pdf_page_geometry(path, total_pages, poppler_path)
+            except Exception:
+                geometry = {}
+        if to_render and self.use_embedded_images:
+            try:
+                with self.trace.span("pdfimages"):
+                    extract = single_image_pages(path, to_render, geometry, poppler_path)
+            except Exception:
+                # No pdfimages or unparsable output: render everything
+                extract = set()
+            self.stats['embedded_image_pages'] = len(extract)
+        if self._pdf is not None:
+            for p, (w, h, rot) in geometry.items():
+                self._page_sizes[p] = (h, w) if rot in (90, 270) else (w, h)
+        if to_render:
+            # Render each page straight at the size OCR will use instead of 200 DPI + downscale
+            page_dpi = {p: render_dpi(geometry.get(p), PREPROCESS_PARAMS['max_side']) for p in to_render}
+            pages = iter_rendered_pages(path, to_render, poppler_path, page_dpi=page_dpi,
+                                        chunk_size=self.chunk_size, extract_pages=extract, trace=self.trace)
+            try:
+                if self.workers > 1 and len(to_render) > 1:
+                    self._ocr_pages_parallel(pages, lang, total_pages, results)
+                else:
+                    self._ocr_pages_sequential(pages, lang, total_pages, results)
+            finally:
+                pages.close()
+
+        order = sorted(results)
+        return [(i, results[i][0]) for i in order], lang or merge_page_langs(results[i][1] for i in order)
+
+    def _page_done(self, results, i, total_pages, text, page_lang, layout=None, image=None):
+        results[i] = (text, page_lang)
+        self.update_stats(page_num=len(results), text_length=len(text))
+        if image is not None:
+            with self.trace.span("pdf_write", i):
+                self._write_pdf_page(i, image, layout)
+        with self.trace.span("callbacks", i):
+            self._layout_done(i, layout)
+            self._emit(self.on_page, i, total_pages, text)
+        started = self._page_started.pop(i, None)
+        if started is not None:
+            self.trace.page(i, started)
+        self.stats['stage_seconds'] = self.trace.stage_seconds()
+
+    def _write_pdf_page(self, i, image, layout):
+        """Append a page to the searchable PDF; `image` is a PIL image or EncodedImage."""
+        if self._pdf is None:
+            return
+        if not isinstance(image, tuple):
+            image = encode_page_image(image)
+        size = self._page_sizes.get(i)
+        if size and (size[0] > size[1]) != (image.width > image.height):
+            # The orient stage turned the page
+            size = (size[1], size[0])
+        self._pdf.add_page(i, image, layout, size)
+
+    def _layout_done(self, i, layout):
+        """Count a page's words and hand its layout to on_page_layout."""
+        if layout is None:
+            return
+        self.stats['words'] += layout.word_count()
+        self.stats['uncertain_words'] += layout.uncertain_count(min_confidence())
+        if self.cache is not None:
+            self._doc_layouts[i] = layout.to_dict()
+        self._emit(self.on_page_layout, i, layout)
+
+    def _page_timed_out(self, results, i, total_pages, page_lang, page=None):
+        """Leave a page empty after its retry also timed out, instead of failing the file."""
+        self.stats['timeout_retries'] += 1
+        self.stats['timeout_pages'].append(i)
+        self._emit(self.on_status, f"ទំព័រ {i}: អស់ពេល OCR ត្រូវបានរំលង")
+        self._page_done(results, i, total_pages, "", page_lang, image=page)
+
+    def _wait_any(self, futures):
+        """Wait for at least one future, checking for cancel() meanwhile."""
+        while True:
+            done, _ = wait(futures, timeout=0.2, return_when=FIRST_COMPLETED)
+            if done:
+                return done
+            self._check_cancel()
+
+    def _take_text_layer(self, path, total_pages, poppler_path, lang, results):
+        """Use embedded text for born-digital pages; returns the pages that still need OCR."""
+        try:
+            with self.trace.span("text_layer", pages=total_pages):
+                layers = extract_text_layer(path, total_pages, poppler_path)
+        except Exception:
+            # No pdftotext or a broken PDF: OCR everything as before
+            return list(range(1, total_pages + 1))
+        remaining = []
+        for i, text in enumerate(layers, 1):
+            if usable_text_layer(text):
+                self.stats['text_layer_pages'] += 1
+                self._page_done(results, i, total_pages, text.rstrip(), lang or detect_language_from_text(text))
+            else:
+                remaining.append(i)
+        if self.stats['text_layer_pages']:
+            self._emit(self.on_status, f"ទំព័រ {self.stats['text_layer_pages']} មានអត្ថបទស្រាប់ • OCR {len(remaining)} ទំព័រ")
+        return remaining
+
+    def _ocr_pages_sequential(self, pages, lang, total_pages, results):
+        """OCR pages in this thread while the next chunk renders in the background."""
+        for i, page in pages:
+            self._page_started[i] = time.perf_counter()
+            try:
+                self._check_cancel()
+                # Keyed on the caller's hint so sequential and pooled runs share entries
+                with self.trace.span("cache", i):
+                    page_key = self._page_key(page, lang)
+                    hit = self._cache_get(page_key)
+                if hit is not None:
+                    page_text, page_lang = hit['text'], hit.get('lang')
+                    layout = PageLayout.from_dict(hit.get('layout'))
+                    encoded = page if self._pdf is not None else None
+                    self._record_page_lang(page_lang)
+                else:
+                    page_lang, timing = lang, {}
+                    # With preprocessing, detection runs on the cleaned page in ocr_rendered_page
+                    if page_lang is None and not self.preprocess:
+                        # កំណត់ភាសាដោយស្វ័យប្រវត្តិសម្រាប់ទំព័រនីមួយៗ
+                        page_lang, timing = self._detect(page, i)
+                        self._emit(self.on_status, f"ទំព័រ {i}: រកឃើញភាសា {page_lang}")
+                    self._emit(self.on_busy, True)
+                    self._emit(self.on_status, f"កំពុងអានទំព័រ {i}...")
+                    try:
+                        page_text, page_lang, ocr_timing, layout, encoded = ocr_rendered_page(
+                            page, page_lang, stages=self.preprocess, cancel=self._cancel,
+                            pdf_image=self._pdf is not None)
+                    except TimeoutError:
+                        self._page_timed_out(results, i, total_pages, page_lang,
+                                             page if self._pdf is not None else None)
+                        continue
+                    finally:
+                        self._emit(self.on_busy, False)
+                    self.trace.add_timing(ocr_timing, i)
+                    self._record_page_lang(page_lang, {**timing, **ocr_timing})
+                    with self.trace.span("cache", i):
+                        self._cache_put(page_key, {'text': page_text, 'lang': page_lang,
+                                                   'layout': layout.to_dict() if layout else None})
+
+                self._page_done(results, i, total_pages, page_text, page_lang, layout, encoded)
+                encoded = None
+            except OcrCancelled:
+                raise
+            except Exception as e:
+                raise RuntimeError(f"ការអានអក្សរបរាជ័យលើទំព័រ {i}: {e}")
+            finally:
+                # Free memory explicitly; ocr_rendered_page already ran (and timed)
+                # this page's gc.collect()
+                del page
+
+    def _ocr_pages_parallel(self, pages, lang, total_pages, results):
+        """Feed rendered pages to the process pool; results are reassembled in page order."""
+        pool = self._get_pool()
+        # Bound pages in flight so rendering cannot run far ahead of OCR
+        max_in_flight = self.workers * 2
+        in_flight = {}
+
+        def collect(futures):
+            for fut in futures:
+                i, page_key, page = in_flight.pop(fut)
+                try:
+                    page_text, page_lang, timing, layout, encoded = fut.result()
+                except TimeoutError:
+                    self._page_timed_out(results, i, total_pages, lang, page)
+                    continue
+                except OcrCancelled:
+                    raise
+                except Exception as e:
+                    raise RuntimeError(f"ការអានអក្សរបរាជ័យលើទំព័រ {i}: {e}")
+                self.trace.add_timing(timing, i)
+                with self.trace.span("cache", i):
+                    self._cache_put(page_key, {'text': page_text, 'lang': page_lang,
+                                               'layout': layout.to_dict() if layout else None})
+                self._record_page_lang(page_lang, timing)
+                self._page_done(results, i, total_pages, page_text, page_lang, layout, encoded)
+
+        self._emit(self.on_busy, True)
+        self._emit(self.on_status, f"កំពុងអាន {total_pages} ទំព័រ ({self.workers} processes)...")
+        try:
+            for i, page in pages:
+                self._page_started[i] = time.perf_counter()
+                self._check_cancel()
+                with self.trace.span("cache", i):
+                    page_key = self._page_key(page, lang)
+                    hit = self._cache_get(page_key)
+                if hit is not None:
+                    self._record_page_lang(hit.get('lang'))
+                    self._page_done(results, i, total_pages, hit['text'], hit.get('lang'),
+                                    PageLayout.from_dict(hit.get('layout')),
+                                    page if self._pdf is not None else None)
+                    continue
+                writing = self._pdf is not None
+                # With a PDF the page is kept until its result is back, in case it times out
+                in_flight[pool.submit(ocr_rendered_page, page, lang, None, self.preprocess, None, writing)] = (
+                    i, page_key, page if writing else None)
+                del page
+                if len(in_flight) >= max_in_flight:
+                    collect(self._wait_any(in_flight))
+            while in_flight:
+                collect(self._wait_any(in_flight))
+        except BaseException:
+            for fut in in_flight:
+                fut.cancel()
+            if self._cancel.is_set() and in_flight:
+                # CLI workers kill Tesseract themselves; API calls cannot be interrupted
+                _done, running = wait(in_flight, timeout=CANCEL_GRACE)
+                if running:
+                    self._discard_pool()
+            raise
+        finally:
+            self._emit(self.on_busy, False)
@@ -0,0 +1,311 @@
+"""Persistent OCR job metrics (SQLite) and a Prometheus text exposition.
+
+Every finished job (GUI queue or batch run) appends one row built from
+its stats counters: pages, OCR seconds, characters, cache hits/misses,
+timeout retries and skipped pages, plus its per-stage seconds, labelled
+with the engine configuration (Tesseract backend, worker processes,
+preprocessing, language hint) and outcome. History survives restarts, so
+pages/sec per configuration, error and timeout counts and cache hit rates
+can be followed across days:
+
+    python -m ocr_metrics --days 14          # daily summary per configuration
+    python -m ocr_metrics --prometheus       # exposition text, once
+    python -m ocr_metrics --serve 9464       # GET /metrics for scrapers
+
+The exposition is computed from the table on each scrape, so its
+counters include jobs from every process that shares the file (GUI and
+batch runs) and do not reset when the app restarts.
+
+Environment:
+  AANAI_METRICS       0 disables recording (default 1)
+  AANAI_METRICS_PORT  serve /metrics from the GUI on this port (default off)
+  AANAI_CACHE_DIR     ocr_metrics.sqlite3 lives next to the OCR cache
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+from ocr_cache import default_cache_dir
+
+METRICS_FILENAME = "ocr_metrics.sqlite3"
+LABELS = ("backend", "workers", "preprocess", "lang")
+# stats counters kept per job; also the summed Prometheus counters
+COUNTERS = ("pages_processed", "characters_extracted", "cache_hits", "cache_misses", "timeout_retries",
+            "text_layer_pages", "embedded_image_pages", "words", "uncertain_words")
+EXPOSITION_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# name, column expression, help
+_EXPOSED = (
+    ("aanai_ocr_jobs_total", "COUNT(*)", "OCR jobs finished, by outcome."),
+    ("aanai_ocr_seconds_total", "SUM(seconds)", "Wall time of finished OCR jobs."),
+    ("aanai_ocr_pages_total", "SUM(pages_processed)", "Pages delivered (OCR, text layer or cache)."),
+    ("aanai_ocr_characters_total", "SUM(characters_extracted)", "Characters extracted."),
+    ("aanai_ocr_cache_hits_total", "SUM(cache_hits)", "OCR cache hits (documents and pages)."),
+    ("aanai_ocr_cache_misses_total", "SUM(cache_misses)", "OCR cache misses (documents and pages)."),
+    ("aanai_ocr_timeout_retries_total", "SUM(timeout_retries)", "Pages retried at reduced size after a timeout."),
+    ("aanai_ocr_timeout_pages_total", "SUM(timeout_pages)", "Pages left empty after their retry timed out."),
+    ("aanai_ocr_text_layer_pages_total", "SUM(text_layer_pages)", "PDF pages taken from their text layer."),
+    ("aanai_ocr_uncertain_words_total", "SUM(uncertain_words)", "Words below AANAI_MIN_CONF."),
+    ("aanai_ocr_words_total", "SUM(words)", "Words with a confidence."),
+)
+
+
+def metrics_enabled() -> bool:
+    return os.environ.get("AANAI_METRICS", "1") != "0"
+
+
+def engine_labels(engine, lang: str | None = None) -> dict:
+    """Configuration labels of an OcrEngine run."""
+    import tess_backend
+    try:
+        backend = tess_backend.backend_name()
+    except Exception:
+        backend = "cli"
+    return {
+        'backend': backend,
+        'workers': str(engine.workers),
+        'preprocess': ",".join(engine.preprocess) or "off",
+        'lang': lang or "auto",
+    }
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values) -> str:
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value) -> str:
+    value = value or 0
+    return str(int(value)) if float(value).is_integer() else repr(round(float(value), 6))
+
+
+class MetricsStore:
+    """Append-only job history in SQLite; thread-safe like OcrCache."""
+
+    def __init__(self, path: str):
+        self.path = path
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY,"
+            " finished REAL NOT NULL,"
+            + "".join(f" {name} TEXT NOT NULL," for name in LABELS)
+            + " state TEXT NOT NULL,"
+            " seconds REAL NOT NULL,"
+            " file_size INTEGER NOT NULL,"
+            " total_pages INTEGER NOT NULL,"
+            " timeout_pages INTEGER NOT NULL,"
+            + "".join(f" {name} INTEGER NOT NULL," for name in COUNTERS)
+            + " error TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs(finished)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_stages ("
+            " job_id INTEGER NOT NULL REFERENCES jobs(id),"
+            " stage TEXT NOT NULL,"
+            " seconds REAL NOT NULL)"
+        )
+
+    @classmethod
+    def from_env(cls, filename: str = METRICS_FILENAME):
+        """Store next to the OCR cache (None if AANAI_METRICS=0 or unusable)."""
+        if not metrics_enabled():
+            return None
+        try:
+            return cls(os.path.join(default_cache_dir(), filename))
+        except Exception:
+            return None
+
+    def record(self, stats: dict, state: str, seconds: float, labels: dict, error: str | None = None,
+               finished: float | None = None):
+        """Append one finished job from its stats dict (see ocr_engine.new_stats)."""
+        row = [finished or time.time(), *(str(labels.get(n, "")) for n in LABELS), state, float(seconds or 0.0),
+               int(stats.get('file_size') or 0), int(stats.get('total_pages') or 0),
+               len(stats.get('timeout_pages') or ()), *(int(stats.get(n) or 0) for n in COUNTERS), error]
+        columns = ("finished", *LABELS, "state", "seconds", "file_size", "total_pages", "timeout_pages",
+                   *COUNTERS, "error")
+        with self._lock:
+            cur = self._conn.execute(
+                f"INSERT INTO jobs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", row)
+            stages = (stats.get('stage_seconds') or {}).items()
+            self._conn.executemany("INSERT INTO job_stages (job_id, stage, seconds) VALUES (?, ?, ?)",
+                                   [(cur.lastrowid, stage, float(s)) for stage, s in stages])
+
+    def daily(self, days: int = 7) -> list[dict]:
+        """Per day and configuration: jobs, failures, pages/sec, timeouts and cache hit rate."""
+        since = time.time() - days * 86400
+        label_cols = ", ".join(LABELS)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT date(finished, 'unixepoch', 'localtime') AS day, {label_cols}, COUNT(*),"
+                " SUM(state = 'failed'), SUM(state = 'cancelled'), SUM(pages_processed), SUM(seconds),"
+                " SUM(timeout_retries), SUM(timeout_pages), SUM(cache_hits), SUM(cache_misses)"
+                f" FROM jobs WHERE finished >= ? GROUP BY day, {label_cols} ORDER BY day, {label_cols}",
+                (since,)).fetchall()
+        summary = []
+        for day, *rest in rows:
+            labels, (jobs, failed, cancelled, pages, seconds, retries, timeouts, hits, misses) = \
+                rest[:len(LABELS)], rest[len(LABELS):]
+            summary.append({
+                'day': day,
+                **dict(zip(LABELS, labels)),
+                'jobs': jobs,
+                'failed': failed,
+                'cancelled': cancelled,
+                'pages': pages,
+                'pages_per_sec': round(pages / seconds, 3) if seconds else None,
+                'timeout_retries': retries,
+                'timeout_pages': timeouts,
+                'cache_hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+            })
+        return summary
+
+    def exposition(self, live: dict | None = None) -> str:
+        """All-time counters in the Prometheus text format; `live` adds {state: count} job gauges."""
+        label_cols = ", ".join(LABELS)
+        with self._lock:
+            totals = self._conn.execute(
+                f"SELECT {label_cols}, state, {', '.join(expr for _n, expr, _h in _EXPOSED)}"
+                f" FROM jobs GROUP BY {label_cols}, state").fetchall()
+            stages = self._conn.execute(
+                f"SELECT {', '.join('j.' + n for n in LABELS)}, s.stage, SUM(s.seconds)"
+                f" FROM job_stages s JOIN jobs j ON j.id = s.job_id"
+                f" GROUP BY {', '.join('j.' + n for n in LABELS)}, s.stage").fetchall()
+        names = (*LABELS, "state")
+        lines = []
+        for n, (metric, _expr, help_text) in enumerate(_EXPOSED):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for row in totals:
+                lines.append(f"{metric}{_labels(names, row[:len(names)])} {_number(row[len(names) + n])}")
+        lines.append("# HELP aanai_ocr_stage_seconds_total Time per OCR stage, summed over threads and workers.")
+        lines.append("# TYPE aanai_ocr_stage_seconds_total counter")
+        for row in stages:
+            lines.append(f"aanai_ocr_stage_seconds_total{_labels((*LABELS, 'stage'), row[:-1])} {_number(row[-1])}")
+        if live is not None:
+            lines.append("# HELP aanai_ocr_jobs Jobs in the GUI queue right now, by state.")
+            lines.append("# TYPE aanai_ocr_jobs gauge")
+            for state, count in sorted(live.items()):
+                lines.append(f"aanai_ocr_jobs{_labels(('state',), (state,))} {_number(count)}")
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+
+
+def _handler_class():
+    # http.server is imported only when a server is actually started
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        server_version = "AanAIMetrics/1.0"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            try:
+                live = self.server.live() if self.server.live is not None else None
+                raw = self.server.store.exposition(live).encode("utf-8")
+            except Exception as e:
+                self.send_error(500, str(e))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", EXPOSITION_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+    return MetricsHandler
+
+
+def make_server(store: MetricsStore, port: int, host: str = "127.0.0.1", live=None):
+    """Create (not start) the /metrics server; `live()` returns {state: count} of current jobs."""
+    from http.server import ThreadingHTTPServer
+    server = ThreadingHTTPServer((host, port), _handler_class())
+    server.daemon_threads = True
+    server.store = store
+    server.live = live
+    return server
+
+
+def start_background(store: MetricsStore, port: int, host: str = "127.0.0.1", live=None):
+    server = make_server(store, port, host, live)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def port_from_env() -> int | None:
+    try:
+        port = int(os.environ.get("AANAI_METRICS_PORT", "0"))
+    except ValueError:
+        return None
+    return port if port > 0 else None
+
+
+def print_daily(summary: list[dict]):
+    if not summary:
+        print("មិនទាន់មានប្រវត្តិ")
+        return
+    for row in summary:
+        speed = f"{row['pages_per_sec']:.2f}" if row['pages_per_sec'] is not None else "-"
+        hit_rate = f"{row['cache_hit_rate']:.0%}" if row['cache_hit_rate'] is not None else "-"
+        config = " ".join(f"{n}={row[n]}" for n in LABELS)
+        print(f"{row['day']}  {config}  ឯកសារ {row['jobs']} (បរាជ័យ {row['failed']}) • ទំព័រ {row['pages']} • "
+              f"{speed} ទំព័រ/វិនាទី • អស់ពេល {row['timeout_pages']}/{row['timeout_retries']} • cache {hit_rate}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m ocr_metrics", description="OCR throughput history.")
+    parser.add_argument("--db", help=f"metrics file (default: {METRICS_FILENAME} in the cache directory)")
+    parser.add_argument("--days", type=int, default=7, help="days of history to summarise")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    parser.add_argument("--prometheus", action="store_true", help="print the Prometheus exposition and exit")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="serve /metrics on this port")
+    parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args(argv)
+    store = MetricsStore(args.db or os.path.join(default_cache_dir(), METRICS_FILENAME))
+    try:
+        if args.prometheus:
+            sys.stdout.write(store.exposition())
+        elif args.serve:
+            server = make_server(store, args.serve, args.host)
+            print(f"Metrics on http://{args.host}:{args.serve}/metrics (Ctrl+C to stop)")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        elif args.json:
+            json.dump(store.daily(args.days), sys.stdout, ensure_ascii=False, indent=2)
+            print()
+        else:
+            print(f"{store.path} • {datetime.now():%Y-%m-%d %H:%M}")
+            print_daily(store.daily(args.days))
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
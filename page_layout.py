@@ -0,0 +1,148 @@
+"""Compact per-page document model built from Tesseract's TSV output.
+
+Tesseract already knows the block, paragraph, line, bounding box and
+confidence of every word it recognises; `image_to_string` just throws them
+away. The engine asks for TSV in the same recognition pass and keeps it as
+a PageLayout: lines of (text, conf, left, top, width, height) words in the
+pixel coordinates of the image that was OCR'd.
+
+Layouts are small, picklable (they travel back from pool workers) and
+serialise to plain lists for the OCR cache.
+
+Environment:
+  AANAI_MIN_CONF  word confidence (0-100) below which a word counts as
+                  uncertain: highlighted in the GUI and sent to the AI
+                  proofreader (default 80)
+"""
+import os
+from typing import NamedTuple
+
+DEFAULT_MIN_CONF = 80.0
+
+
+def min_confidence() -> float:
+    try:
+        return float(os.environ.get("AANAI_MIN_CONF", DEFAULT_MIN_CONF))
+    except ValueError:
+        return DEFAULT_MIN_CONF
+
+
+class Word(NamedTuple):
+    text: str
+    conf: float
+    left: int
+    top: int
+    width: int
+    height: int
+
+
+class Line(NamedTuple):
+    block: int
+    par: int
+    words: list
+
+    @property
+    def text(self) -> str:
+        return " ".join(w.text for w in self.words)
+
+    @property
+    def conf(self) -> float:
+        """Confidence of the line's weakest word."""
+        return min((w.conf for w in self.words), default=100.0)
+
+
+class PageLayout:
+    """Words grouped into lines for one OCR'd page image of `width` x `height` pixels."""
+
+    __slots__ = ("width", "height", "lines")
+
+    def __init__(self, width: int, height: int, lines: list[Line]):
+        self.width = width
+        self.height = height
+        self.lines = lines
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        other = PageLayout.from_dict(state)
+        self.width, self.height, self.lines = other.width, other.height, other.lines
+
+    def words(self):
+        for line in self.lines:
+            yield from line.words
+
+    def word_count(self) -> int:
+        return sum(len(line.words) for line in self.lines)
+
+    def uncertain_count(self, threshold: float) -> int:
+        return sum(1 for w in self.words() if w.conf < threshold)
+
+    def mean_confidence(self) -> float | None:
+        confs = [w.conf for w in self.words()]
+        return sum(confs) / len(confs) if confs else None
+
+    def word_spans(self, text: str, threshold: float) -> list[tuple[int, int]]:
+        """(start, end) offsets in `text` of the words below `threshold`.
+
+        `text` is the page text from the same recognition pass, so its words
+        come in the same order; each word is searched for after the previous
+        one, and words that cannot be found are skipped.
+        """
+        spans = []
+        pos = 0
+        for word in self.words():
+            start = text.find(word.text, pos)
+            if start < 0:
+                continue
+            end = start + len(word.text)
+            if word.conf < threshold:
+                spans.append((start, end))
+            pos = end
+        return spans
+
+    def to_dict(self) -> dict:
+        return {
+            'size': [self.width, self.height],
+            'lines': [[line.block, line.par, [list(w) for w in line.words]] for line in self.lines],
+        }
+
+    @classmethod
+    def from_dict(cls, data) -> "PageLayout | None":
+        if not data:
+            return None
+        width, height = data['size']
+        lines = [Line(block, par, [Word(*w) for w in words]) for block, par, words in data['lines']]
+        return cls(width, height, lines)
+
+
+def parse_tsv(tsv: str) -> PageLayout | None:
+    """PageLayout from `tesseract ... tsv` output (None if it has no page row)."""
+    rows = tsv.splitlines()
+    width = height = None
+    lines = {}
+    for row in rows[1:]:
+        cols = row.split("\t")
+        if len(cols) < 12:
+            continue
+        try:
+            level = int(cols[0])
+            block, par, line = int(cols[2]), int(cols[3]), int(cols[4])
+            left, top, w, h = int(cols[6]), int(cols[7]), int(cols[8]), int(cols[9])
+            conf = float(cols[10])
+        except ValueError:
+            continue
+        if level == 1 and width is None:
+            width, height = w, h
+            continue
+        text = cols[11].strip()
+        if level != 5 or conf < 0 or not text:
+            continue
+        key = (block, par, line)
+        if key not in lines:
+            lines[key] = Line(block, par, [])
+        lines[key].words.append(Word(text, round(conf, 1), left, top, w, h))
+    if width is None:
+        return None
+    # Dicts keep insertion order, which is Tesseract's reading order
+    return PageLayout(width, height, list(lines.values()))
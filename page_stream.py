@@ -0,0 +1,112 @@
+"""Ordered, batched delivery of OCR page text to the output widget.
+
+OcrEngine reports pages from its worker thread, and with several workers
+they arrive out of page order. PageStream keeps finished pages until the
+next page in order is available and then, on the Tk thread, appends the
+whole contiguous run with a single insert. Pages leave the stream as soon
+as they are shown, so nothing holds the full document just to display it.
+
+Pages can carry (start, end) spans, e.g. uncertain words; they are shifted
+to offsets in the inserted text so the widget can tag them.
+"""
+import threading
+
+# Pages that finish within this window share one widget insert
+FLUSH_MS = 120
+# Upper bound for one insert so a burst of cached pages cannot freeze Tk
+MAX_FLUSH_CHARS = 200_000
+# Same separator OcrEngine uses when it joins pages
+PAGE_SEPARATOR = "\n\n"
+
+
+class PageStream:
+    """Buffer page texts from any thread and append them in page order.
+
+    `insert(text, spans)` appends to the widget, with spans as (start, end)
+    offsets into `text`, and `schedule(ms, callback)` runs a callback later
+    on the Tk thread (app.after); both are only called from flush(), which
+    itself always runs through `schedule`.
+    """
+
+    def __init__(self, insert, schedule, flush_ms: int = FLUSH_MS, max_chars: int = MAX_FLUSH_CHARS):
+        self._insert = insert
+        self._schedule = schedule
+        self.flush_ms = flush_ms
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self._ready = {}
+        self._next = 1
+        self._scheduled = False
+        self._closed = False
+        self.pages_shown = 0
+        self.chars_shown = 0
+
+    def add(self, page_num: int, text: str, spans=()):
+        """Queue a finished page (any thread); `spans` are (start, end) offsets into `text`."""
+        with self._lock:
+            # Already shown pages can come again when a running job is re-attached
+            if self._closed or page_num < self._next:
+                return
+            self._ready[page_num] = (text, spans)
+            if self._scheduled or self._next not in self._ready:
+                return
+            self._scheduled = True
+        self._schedule(self.flush_ms, self.flush)
+
+    def flush(self):
+        """Append the next contiguous pages (Tk thread)."""
+        with self._lock:
+            self._scheduled = False
+            if self._closed:
+                return
+            chunk, spans = self._take(self.max_chars)
+            more = self._next in self._ready
+            if more:
+                self._scheduled = True
+        self._show(chunk, spans)
+        if more:
+            # Yield to Tk between large inserts
+            self._schedule(1, self.flush)
+
+    def finish(self):
+        """Show everything still buffered, gaps included (Tk thread, after the job ends)."""
+        with self._lock:
+            if self._closed:
+                return
+            chunk, spans = self._take(None)
+            # Pages after a gap (e.g. a failed page) are appended in order
+            for page_num in sorted(self._ready):
+                self._next = page_num
+                more, more_spans = self._take(None)
+                spans += [(start + len(chunk), end + len(chunk)) for start, end in more_spans]
+                chunk += more
+            self._closed = True
+        self._show(chunk, spans)
+
+    def close(self):
+        """Drop buffered pages and ignore anything that still arrives."""
+        with self._lock:
+            self._closed = True
+            self._ready.clear()
+
+    def _take(self, max_chars):
+        parts = []
+        spans = []
+        size = 0
+        while self._next in self._ready and (max_chars is None or size < max_chars):
+            text, page_spans = self._ready.pop(self._next)
+            if self.pages_shown:
+                parts.append(PAGE_SEPARATOR)
+                size += len(PAGE_SEPARATOR)
+            spans.extend((start + size, end + size) for start, end in page_spans)
+            parts.append(text)
+            size += len(text)
+            self.pages_shown += 1
+            self._next += 1
+        return "".join(parts), spans
+
+    def _show(self, chunk, spans=()):
+        if not chunk:
+            return
+        self._insert(chunk, spans)
+        self.chars_shown += len(chunk)
@@ -0,0 +1,296 @@
+"""Poppler helpers for turning PDF pages into text or images for OCR.
+
+Born-digital pages already carry a text layer, which pdftotext extracts
+for the whole document in one run. Scanned pages that are just one
+embedded bitmap are pulled out with pdfimages at their native resolution.
+The remaining pages are rasterized in chunks (one pdftoppm run per chunk
+instead of per page). A producer thread does the extraction and rendering,
+so it overlaps with Tesseract work on the consumer side.
+"""
+import glob
+import os
+import queue
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+
+from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from app_paths import no_window
+
+DEFAULT_DPI = 200
+DEFAULT_CHUNK_SIZE = 8
+# A text layer shorter than this (non-space chars) is treated as a scanned page
+MIN_TEXT_LAYER_CHARS = 20
+
+_DONE = object()
+
+
+class _RenderFailed:
+    def __init__(self, first, last, error):
+        self.first = first
+        self.last = last
+        self.error = error
+
+
+def pdf_page_count(path, poppler_path=None) -> int:
+    info = pdfinfo_from_path(path, poppler_path=poppler_path) if poppler_path else pdfinfo_from_path(path)
+    return int(info.get("Pages", 1))
+
+
+def poppler_tool(name: str, poppler_path=None) -> str:
+    return os.path.join(poppler_path, name) if poppler_path else name
+
+
+def extract_text_layer(path, total_pages, poppler_path=None, timeout=120) -> list[str]:
+    """Embedded text of every page from one pdftotext run ('' for pages without text)."""
+    out = subprocess.run(
+        [poppler_tool("pdftotext", poppler_path), "-layout", "-enc", "UTF-8", path, "-"],
+        capture_output=True, timeout=timeout, **no_window(),
+    )
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.decode("utf-8", "replace").strip() or f"pdftotext exit {out.returncode}")
+    # pdftotext ends every page with a form feed
+    pages = out.stdout.decode("utf-8", "replace").split("\f")
+    pages = pages[:total_pages]
+    return pages + [""] * (total_pages - len(pages))
+
+
+def usable_text_layer(text: str) -> bool:
+    """Is an extracted text layer good enough to use instead of OCR?"""
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < MIN_TEXT_LAYER_CHARS:
+        return False
+    # Replacement chars, private-use glyphs and control codes mean a broken font mapping
+    bad = sum(1 for c in chars if c == "\ufffd" or "\ue000" <= c <= "\uf8ff" or ord(c) < 32)
+    return bad / len(chars) < 0.05
+
+
+def pdf_page_geometry(path, total_pages, poppler_path=None, timeout=60) -> dict[int, tuple[float, float, int]]:
+    """{page: (width_pts, height_pts, rotation)} from one `pdfinfo -f 1 -l N` run."""
+    out = subprocess.run(
+        [poppler_tool("pdfinfo", poppler_path), "-f", "1", "-l", str(total_pages), path],
+        capture_output=True, timeout=timeout, **no_window(),
+    )
+    text = out.stdout.decode("utf-8", "replace")
+    geometry = {}
+    for m in re.finditer(r"^Page\s+(\d+)\s+size:\s+([\d.]+)\s+x\s+([\d.]+)", text, re.M):
+        geometry[int(m.group(1))] = (float(m.group(2)), float(m.group(3)), 0)
+    for m in re.finditer(r"^Page\s+(\d+)\s+rot:\s+(\d+)", text, re.M):
+        page = int(m.group(1))
+        if page in geometry:
+            w, h, _rot = geometry[page]
+            geometry[page] = (w, h, int(m.group(2)) % 360)
+    return geometry
+
+
+def list_page_images(path, poppler_path=None, timeout=60) -> dict[int, list[dict]]:
+    """Images drawn on each page, parsed from `pdfimages -list`."""
+    out = subprocess.run(
+        [poppler_tool("pdfimages", poppler_path), "-list", path],
+        capture_output=True, timeout=timeout, **no_window(),
+    )
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.decode("utf-8", "replace").strip() or f"pdfimages exit {out.returncode}")
+    images = {}
+    # page num type width height color comp bpc enc interp object ID x-ppi y-ppi size ratio
+    for line in out.stdout.decode("utf-8", "replace").splitlines()[2:]:
+        cols = line.split()
+        if len(cols) < 14 or not cols[0].isdigit():
+            continue
+        try:
+            images.setdefault(int(cols[0]), []).append({
+                'type': cols[2],
+                'width': int(cols[3]),
+                'height': int(cols[4]),
+                'color': cols[5],
+                'bpc': int(cols[7]),
+                'enc': cols[8],
+                'x_ppi': float(cols[12]),
+                'y_ppi': float(cols[13]),
+            })
+        except ValueError:
+            continue
+    return images
+
+
+def render_dpi(geometry, max_side: int, dpi: int = DEFAULT_DPI) -> int:
+    """DPI that renders a page straight to at most `max_side` pixels (never above `dpi`).
+
+    Rendering at the final size avoids a second full-image resample in
+    preprocessing. `geometry` is (width_pts, height_pts, rotation) or None.
+    """
+    if not geometry or max(geometry[0], geometry[1]) <= 0:
+        return dpi
+    # One pixel of slack: pdftoppm rounds page sizes up
+    fit = int((max_side - 1) * 72.0 / max(geometry[0], geometry[1]))
+    return max(36, min(dpi, fit))
+
+
+def single_image_pages(path, page_numbers, geometry, poppler_path=None, tolerance=0.03) -> set[int]:
+    """Pages that are exactly one bitmap covering the whole (unrotated) page.
+
+    OCR'ing that bitmap directly gives the scanner's own pixels with no
+    rasterization pass; anything else (vector content, several images,
+    rotated or partial placement, CMYK) is left for the renderer.
+    """
+    listed = list_page_images(path, poppler_path)
+    pages = set()
+    for page in page_numbers:
+        entries = [e for e in listed.get(page, []) if e['type'] in ("image", "smask")]
+        images = [e for e in entries if e['type'] == "image"]
+        if len(images) != 1 or len(entries) != 1 or page not in geometry:
+            continue
+        img = images[0]
+        w_pts, h_pts, rot = geometry[page]
+        if rot or img['color'] == "cmyk" or img['x_ppi'] <= 0 or img['y_ppi'] <= 0:
+            continue
+        covered_w = img['width'] / img['x_ppi'] * 72.0
+        covered_h = img['height'] / img['y_ppi'] * 72.0
+        if abs(covered_w - w_pts) <= w_pts * tolerance and abs(covered_h - h_pts) <= h_pts * tolerance:
+            pages.add(page)
+    return pages
+
+
+def extract_page_image(path, page_num, poppler_path=None, timeout=120):
+    """The single embedded bitmap of a page at native resolution (JPEGs are kept as-is)."""
+    with tempfile.TemporaryDirectory(prefix="aanai-img-") as tmp:
+        out = subprocess.run(
+            [poppler_tool("pdfimages", poppler_path), "-f", str(page_num), "-l", str(page_num),
+             "-j", "-png", path, os.path.join(tmp, "img")],
+            capture_output=True, timeout=timeout, **no_window(),
+        )
+        files = sorted(glob.glob(os.path.join(tmp, "img-*")))
+        if out.returncode != 0 or not files:
+            raise RuntimeError(out.stderr.decode("utf-8", "replace").strip() or "pdfimages មិនបានបញ្ចេញរូបភាព")
+        image = Image.open(files[0])
+        image.load()
+        return image
+
+
+def page_runs(page_numbers, chunk_size, page_dpi=None):
+    """Split sorted page numbers into contiguous (first, last, dpi) runs of at
+    most chunk_size pages; a change of DPI also starts a new run.
+    """
+    page_dpi = page_dpi or {}
+    runs = []
+    for n in page_numbers:
+        dpi = page_dpi.get(n, DEFAULT_DPI)
+        if runs and n == runs[-1][1] + 1 and n - runs[-1][0] < chunk_size and dpi == runs[-1][2]:
+            runs[-1][1] = n
+        else:
+            runs.append([n, n, dpi])
+    return [tuple(r) for r in runs]
+
+
+def render_pdf_pages(path, first_page, last_page, poppler_path=None, dpi=DEFAULT_DPI):
+    """Render a page range with a single Poppler invocation; returns a list of
+    grayscale PIL images (a third of the memory of RGB, and what OCR uses anyway).
+    """
+    try:
+        return convert_from_path(
+            path,
+            dpi=dpi,
+            first_page=first_page,
+            last_page=last_page,
+            grayscale=True,
+            poppler_path=poppler_path,
+        )
+    except TypeError:
+        # Fallback for environments without poppler_path support
+        return convert_from_path(
+            path,
+            dpi=dpi,
+            first_page=first_page,
+            last_page=last_page,
+            grayscale=True,
+        )
+
+
+def iter_rendered_pages(path, page_numbers, poppler_path=None, page_dpi=None,
+                        chunk_size=DEFAULT_CHUNK_SIZE, max_queued=None, extract_pages=(), trace=None):
+    """Yield (page_num, image) in page order while later chunks render in the background.
+
+    `page_numbers` are the 1-based pages to produce; contiguous pages with
+    the same DPI (`page_dpi`, default DEFAULT_DPI) share a Poppler
+    invocation. Pages in `extract_pages` are taken from their
+    embedded bitmap instead (rendered if extraction fails). At most `max_queued` rendered pages (default: one
+    chunk) wait in the queue, so memory stays bounded however far rendering
+    runs ahead of OCR. Closing the generator early stops the producer after
+    its current chunk.
+
+    With a job_trace.JobTrace, extraction and rendering are recorded as
+    "extract" / "render" spans and the consumer's waits for the next page
+    as "render_wait".
+    """
+    chunk_size = max(1, int(chunk_size))
+    q = queue.Queue(maxsize=max_queued or chunk_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    extract_pages = set(extract_pages)
+    jobs = [(p, p, None, True) for p in extract_pages if p in page_numbers]
+    jobs += [(first, last, dpi, False) for first, last, dpi in
+             page_runs(sorted(p for p in page_numbers if p not in extract_pages), chunk_size, page_dpi)]
+    jobs.sort(key=lambda job: job[0])
+
+    def timed(stage, page, **args):
+        return trace.span(stage, page, **args) if trace is not None else nullcontext()
+
+    def producer():
+        try:
+            for first, last, dpi, extract in jobs:
+                if extract:
+                    try:
+                        with timed("extract", first):
+                            image = extract_page_image(path, first, poppler_path)
+                    except Exception:
+                        image = None
+                    if image is not None:
+                        if not put((first, image)):
+                            return
+                        del image
+                        continue
+                try:
+                    if dpi is None:
+                        dpi = (page_dpi or {}).get(first, DEFAULT_DPI)
+                    # One span per Poppler run; it is only tied to a page for single-page runs
+                    with timed("render", first if first == last else None, pages=f"{first}-{last}", dpi=dpi):
+                        images = render_pdf_pages(path, first, last, poppler_path, dpi)
+                except Exception as e:
+                    put(_RenderFailed(first, last, e))
+                    return
+                for offset, image in enumerate(images):
+                    if not put((first + offset, image)):
+                        return
+                del images
+        finally:
+            put(_DONE)
+
+    t = threading.Thread(target=producer, name="pdf-render", daemon=True)
+    t.start()
+    try:
+        while True:
+            waited = time.perf_counter()
+            item = q.get()
+            if trace is not None and isinstance(item, tuple):
+                trace.add("render_wait", waited, time.perf_counter() - waited, item[0])
+            if item is _DONE:
+                break
+            if isinstance(item, _RenderFailed):
+                raise RuntimeError(f"ការបំប្លែងទំព័រ {item.first}-{item.last} បរាជ័យ: {item.error}")
+            yield item
+    finally:
+        stop.set()
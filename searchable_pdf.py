@@ -0,0 +1,247 @@
+"""Streaming writer for searchable PDFs: page image plus an invisible text layer.
+
+Pages are written to the file as soon as they are added and nothing but
+their object offsets is kept, so memory stays flat however long the
+document is. Pages may be added in any order (pool workers finish out of
+order); the page tree written by close() puts them in page-number order.
+
+The text layer follows Tesseract's own PDF renderer: every word is drawn
+in rendering mode 3 (invisible) with a glyphless font whose character
+codes are the UTF-16 code units of the text, so any script (Khmer
+included) copies and searches correctly. The word is scaled to its
+bounding box from the PageLayout. Tesseract's pdf.ttf is embedded when
+it is found in the tessdata directory.
+"""
+import io
+import os
+import zlib
+from typing import NamedTuple
+
+import tess_backend
+
+# Output name next to the input (or in an output directory): scan.pdf -> scan.ocr.pdf
+PDF_SUFFIX = ".ocr.pdf"
+JPEG_QUALITY = 80
+# Glyph advance of the glyphless font, in 1/1000 em
+GLYPH_WIDTH = 500
+
+_TO_UNICODE = b"""/CIDInit /ProcSet findresource begin
+12 dict begin
+begincmap
+/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def
+/CMapName /Adobe-Identity-UCS def
+/CMapType 2 def
+1 begincodespacerange
+<0000> <FFFF>
+endcodespacerange
+1 beginbfrange
+<0000> <FFFF> <0000>
+endbfrange
+endcmap
+CMapName currentdict /CMap defineresource pop
+end
+end
+"""
+
+
+def is_output_file(path: str) -> bool:
+    """True for a searchable PDF this app wrote, which is not OCR input again."""
+    return path.lower().endswith(PDF_SUFFIX)
+
+
+class EncodedImage(NamedTuple):
+    """A page image already compressed for a PDF image XObject."""
+    width: int
+    height: int
+    color_space: str
+    bits: int
+    filter: str
+    data: bytes
+
+
+def encode_page_image(image, quality: int = JPEG_QUALITY) -> EncodedImage:
+    """Compress a PIL image for the PDF: bilevel as Flate, gray/colour as JPEG."""
+    if image.mode == "1":
+        # PIL packs 1-bit rows MSB first with 1 = white, exactly like DeviceGray
+        return EncodedImage(image.width, image.height, "DeviceGray", 1, "FlateDecode",
+                            zlib.compress(image.tobytes(), 6))
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB" if image.mode in ("RGBA", "P", "CMYK", "LA") else "L")
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=quality)
+    space = "DeviceGray" if image.mode == "L" else "DeviceRGB"
+    return EncodedImage(image.width, image.height, space, 8, "DCTDecode", buf.getvalue())
+
+
+def find_glyphless_font() -> str | None:
+    """Tesseract's pdf.ttf, if the tessdata directory has one."""
+    try:
+        tessdata = tess_backend.tessdata_dir()
+    except Exception:
+        tessdata = None
+    for folder in filter(None, [tessdata, os.environ.get("TESSDATA_PREFIX")]):
+        path = os.path.join(folder, "pdf.ttf")
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _num(value: float) -> str:
+    return f"{value:.2f}".rstrip("0").rstrip(".") or "0"
+
+
+def _hex_utf16(text: str) -> str:
+    return text.encode("utf-16-be").hex().upper()
+
+
+class SearchablePdfWriter:
+    """Write a searchable PDF page by page.
+
+        with SearchablePdfWriter("out.pdf") as pdf:
+            pdf.add_page(3, encoded, layout, (612, 792))
+
+    Objects 1 (catalog) and 2 (page tree) are written last; everything
+    else is appended as it is produced.
+    """
+
+    def __init__(self, path: str, font_path: str | None = None):
+        self.path = path
+        self._file = open(path, "wb")
+        self._offsets = {}
+        self._next_id = 3
+        self._pages = {}
+        self._closed = False
+        self._file.write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+        self._font_id = self._write_font(font_path if font_path is not None else find_glyphless_font())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def page_count(self) -> int:
+        return len(self._pages)
+
+    def _alloc(self) -> int:
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _write_obj(self, obj_id: int, body: bytes, stream: bytes | None = None):
+        self._offsets[obj_id] = self._file.tell()
+        self._file.write(f"{obj_id} 0 obj\n".encode("ascii"))
+        self._file.write(body)
+        if stream is not None:
+            self._file.write(b"\nstream\n")
+            self._file.write(stream)
+            self._file.write(b"\nendstream")
+        self._file.write(b"\nendobj\n")
+
+    def _write_font(self, font_path: str | None) -> int:
+        type0, cid_font, descriptor, to_unicode = (self._alloc() for _ in range(4))
+        font_file = None
+        if font_path:
+            try:
+                with open(font_path, "rb") as f:
+                    font_data = f.read()
+                font_file = self._alloc()
+                self._write_obj(font_file, f"<< /Length {len(font_data)} /Length1 {len(font_data)} >>"
+                                .encode("ascii"), font_data)
+            except OSError:
+                font_file = None
+        cid_map = None
+        if font_file is not None:
+            # Every character code draws glyph 1, the font's only (empty) glyph
+            cid_map = self._alloc()
+            data = zlib.compress(b"\x00\x01" * 65536, 9)
+            self._write_obj(cid_map, f"<< /Length {len(data)} /Filter /FlateDecode >>".encode("ascii"), data)
+        self._write_obj(type0, (
+            f"<< /Type /Font /Subtype /Type0 /BaseFont /GlyphLessFont /Encoding /Identity-H "
+            f"/DescendantFonts [{cid_font} 0 R] /ToUnicode {to_unicode} 0 R >>").encode("ascii"))
+        self._write_obj(cid_font, (
+            f"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /GlyphLessFont "
+            f"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> "
+            f"/FontDescriptor {descriptor} 0 R /DW {GLYPH_WIDTH}"
+            + (f" /CIDToGIDMap {cid_map} 0 R" if cid_map else "") + " >>").encode("ascii"))
+        self._write_obj(descriptor, (
+            f"<< /Type /FontDescriptor /FontName /GlyphLessFont /Flags 5 "
+            f"/FontBBox [0 0 {GLYPH_WIDTH} 1000] /ItalicAngle 0 /Ascent 1000 /Descent 0 "
+            f"/CapHeight 1000 /StemV 80"
+            + (f" /FontFile2 {font_file} 0 R" if font_file else "") + " >>").encode("ascii"))
+        self._write_obj(to_unicode, f"<< /Length {len(_TO_UNICODE)} >>".encode("ascii"), _TO_UNICODE)
+        return type0
+
+    def add_page(self, page_num: int, image: EncodedImage, layout=None, page_size=None):
+        """Append one page: `image` fills the page, `layout` (PageLayout) becomes invisible text.
+
+        `page_size` is (width, height) in points; by default the image is
+        taken to be 200 DPI.
+        """
+        if page_num in self._pages:
+            raise ValueError(f"page {page_num} was already written")
+        width, height = page_size or (image.width * 72.0 / 200, image.height * 72.0 / 200)
+        image_id, content_id, page_id = self._alloc(), self._alloc(), self._alloc()
+        self._write_obj(image_id, (
+            f"<< /Type /XObject /Subtype /Image /Width {image.width} /Height {image.height} "
+            f"/ColorSpace /{image.color_space} /BitsPerComponent {image.bits} /Filter /{image.filter} "
+            f"/Length {len(image.data)} >>").encode("ascii"), image.data)
+        content = zlib.compress(self._content(image, layout, width, height), 6)
+        self._write_obj(content_id, f"<< /Length {len(content)} /Filter /FlateDecode >>".encode("ascii"), content)
+        self._write_obj(page_id, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_num(width)} {_num(height)}] "
+            f"/Resources << /XObject << /Im0 {image_id} 0 R >> /Font << /F1 {self._font_id} 0 R >> >> "
+            f"/Contents {content_id} 0 R >>").encode("ascii"))
+        self._pages[page_num] = page_id
+
+    def _content(self, image: EncodedImage, layout, width: float, height: float) -> bytes:
+        ops = [f"q {_num(width)} 0 0 {_num(height)} 0 0 cm /Im0 Do Q"]
+        if layout is not None and layout.width and layout.height:
+            sx = width / layout.width
+            sy = height / layout.height
+            ops.append("BT 3 Tr")
+            for line in layout.lines:
+                last = len(line.words) - 1
+                for n, word in enumerate(line.words):
+                    size = max(1.0, word.height * sy)
+                    natural = len(word.text) * GLYPH_WIDTH / 1000.0 * size
+                    scale = 100.0 * word.width * sx / natural if natural else 100.0
+                    # A trailing space keeps words apart when the text is copied
+                    text = word.text if n == last else word.text + " "
+                    ops.append(f"/F1 {_num(size)} Tf {_num(scale)} Tz "
+                               f"1 0 0 1 {_num(word.left * sx)} {_num(height - (word.top + word.height) * sy)} Tm "
+                               f"<{_hex_utf16(text)}> Tj")
+            ops.append("ET")
+        return "\n".join(ops).encode("ascii")
+
+    def close(self):
+        """Write the page tree, catalog and cross-reference table."""
+        if self._closed:
+            return
+        self._closed = True
+        kids = " ".join(f"{self._pages[p]} 0 R" for p in sorted(self._pages))
+        self._write_obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._pages)} >>".encode("ascii"))
+        self._write_obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self._file.tell()
+        size = self._next_id
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for obj_id in range(1, size):
+            lines.append(f"{self._offsets.get(obj_id, 0):010d} 00000 n \n")
+        self._file.write("".join(lines).encode("ascii"))
+        self._file.write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii"))
+        self._file.close()
+
+    def abort(self):
+        """Close and delete an unfinished file."""
+        if self._closed:
+            return
+        self._closed = True
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
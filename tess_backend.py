@@ -0,0 +1,170 @@
+"""Persistent in-process Tesseract backend built on tesserocr (Tesseract C API).
+
+The CLI path (pytesseract) writes a temp image, starts a `tesseract` process
+and reloads every .traineddata file for each page. When tesserocr is
+installed we instead keep initialised `PyTessBaseAPI` handles alive, one per
+language set, and hand them PIL images in memory. Handles are pooled per
+process, so every worker of the OCR process pool loads its models once.
+
+Set AANAI_TESS_BACKEND=cli to force the pytesseract path, =api to require tesserocr.
+With the default (auto), a language set the API cannot load is OCR'd via
+the CLI instead; with =api that is an error.
+"""
+import os
+import re
+import subprocess
+import threading
+
+import pytesseract
+
+from app_paths import no_window
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except Exception:
+    TESSEROCR_AVAILABLE = False
+
+_lock = threading.Lock()
+_idle_apis: dict[tuple[str, str], list] = {}
+_failed_langs: set[tuple[str, str]] = set()
+_tessdata_cache: dict[str, str | None] = {}
+
+
+def _choice() -> str:
+    return os.environ.get("AANAI_TESS_BACKEND", "auto").strip().lower()
+
+
+def backend_name() -> str:
+    """'api' when the in-process backend will be used, otherwise 'cli'."""
+    choice = _choice()
+    if choice == "cli":
+        return "cli"
+    if choice == "api" and not TESSEROCR_AVAILABLE:
+        raise RuntimeError("AANAI_TESS_BACKEND=api ប៉ុន្តែ tesserocr មិនទាន់ដំឡើង")
+    return "api" if TESSEROCR_AVAILABLE else "cli"
+
+
+def backend_version() -> str:
+    """Identify the Tesseract build behind the active backend (used in cache keys)."""
+    if backend_name() == "api":
+        return f"tesserocr-{tesserocr.tesseract_version().split()[1]}"
+    return f"cli-{pytesseract.get_tesseract_version()}"
+
+
+def tessdata_dir() -> str | None:
+    """tessdata directory for the API: TESSDATA_PREFIX, else ask the tesseract binary."""
+    prefix = os.environ.get("TESSDATA_PREFIX")
+    if prefix:
+        return prefix
+    cmd = pytesseract.pytesseract.tesseract_cmd
+    if cmd not in _tessdata_cache:
+        path = None
+        try:
+            out = subprocess.run([cmd, "--list-langs"], capture_output=True, text=True, timeout=15, **no_window())
+            # e.g. List of available languages in "/usr/share/tesseract-ocr/5/tessdata/" (3):
+            m = re.search(r'"([^"]+)"', out.stdout + out.stderr)
+            if m:
+                path = m.group(1)
+        except Exception:
+            pass
+        _tessdata_cache[cmd] = path
+    return _tessdata_cache[cmd]
+
+
+def _acquire_api(tess_lang: str):
+    path = tessdata_dir() or ""
+    key = (path, tess_lang)
+    with _lock:
+        if key in _failed_langs and _choice() != "api":
+            return None, key
+        idle = _idle_apis.get(key)
+        if idle:
+            return idle.pop(), key
+    try:
+        if path and not path.endswith(("/", "\\")):
+            path += os.sep
+        api = tesserocr.PyTessBaseAPI(path=path, lang=tess_lang) if path else tesserocr.PyTessBaseAPI(lang=tess_lang)
+    except Exception as e:
+        if _choice() == "api":
+            # Explicitly requested: do not hide the problem behind a slower backend
+            raise RuntimeError(f"AANAI_TESS_BACKEND=api ប៉ុន្តែ tesserocr មិនអាចផ្ទុកភាសា {tess_lang} បានទេ: {e}") from e
+        # Models missing for this tessdata/lang: remember and let the CLI handle it
+        with _lock:
+            _failed_langs.add(key)
+        return None, key
+    return api, key
+
+
+def _release_api(api, key):
+    with _lock:
+        _idle_apis.setdefault(key, []).append(api)
+
+
+def _recognize(api, image, timeout_seconds: float):
+    api.SetImage(image)
+    dpi = image.info.get("dpi")
+    if dpi:
+        api.SetSourceResolution(int(dpi[0]))
+    if not api.Recognize(timeout=int(timeout_seconds * 1000)):
+        raise TimeoutError(f"OCR timed out after {timeout_seconds:.0f}s")
+
+
+def api_image_to_string(image, tess_lang: str, timeout_seconds: float = 60.0) -> str | None:
+    """OCR with a pooled in-process API handle.
+
+    Returns None when the API cannot serve this language so the caller can
+    fall back to the CLI, or raises RuntimeError if AANAI_TESS_BACKEND=api.
+    Raises TimeoutError when Tesseract hits the deadline.
+    """
+    api, key = _acquire_api(tess_lang)
+    if api is None:
+        return None
+    try:
+        _recognize(api, image, timeout_seconds)
+        return api.GetUTF8Text()
+    finally:
+        api.Clear()
+        _release_api(api, key)
+
+
+def api_image_to_data(image, tess_lang: str, timeout_seconds: float = 60.0) -> tuple[str, str] | None:
+    """Like api_image_to_string() but returns (text, tsv) from the same recognition pass."""
+    api, key = _acquire_api(tess_lang)
+    if api is None:
+        return None
+    try:
+        _recognize(api, image, timeout_seconds)
+        return api.GetUTF8Text(), api.GetTSVText(0)
+    finally:
+        api.Clear()
+        _release_api(api, key)
+
+
+def api_word_confidences(image, tess_lang: str, timeout_seconds: float = 60.0) -> list[tuple[str, float]] | None:
+    """Like api_image_to_string() but returns (word, confidence) pairs."""
+    api, key = _acquire_api(tess_lang)
+    if api is None:
+        return None
+    try:
+        _recognize(api, image, timeout_seconds)
+        return [(word, float(conf)) for word, conf in api.MapWordConfidences()]
+    finally:
+        api.Clear()
+        _release_api(api, key)
+
+
+def close_all():
+    """Release every pooled API handle (models are freed with them).
+
+    The pool is shared by all engines of the process: call this once, when
+    none of them will OCR again.
+    """
+    with _lock:
+        apis = [api for idle in _idle_apis.values() for api in idle]
+        _idle_apis.clear()
+    for api in apis:
+        try:
+            api.End()
+        except Exception:
+            pass
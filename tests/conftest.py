@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fake_gemini():
+    """Start a fake Gemini server; call it with make_server() options, get (server, base_url)."""
+    import fake_gemini as fake
+    servers = []
+
+    def start(**kwargs):
+        kwargs.setdefault("latency", 0.0)
+        server, base_url = fake.start_background(**kwargs)
+        servers.append(server)
+        return server, base_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,50 @@
+import argparse
+import os
+import time
+
+from batch_ocr import iter_input_files, run_batch
+
+
+def test_directories_skip_earlier_searchable_pdfs(tmp_path):
+    for name in ("a.png", "b.pdf", "b.ocr.pdf", "C.OCR.PDF", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+    found = [os.path.basename(p) for p in iter_input_files([str(tmp_path)])]
+    assert found == ["a.png", "b.pdf"]
+    # Named on the command line, an output is still taken
+    assert list(iter_input_files([str(tmp_path / "b.ocr.pdf")])) == [str(tmp_path / "b.ocr.pdf")]
+
+
+class SlowThenFailingEngine:
+    """Takes 0.3 s on its first file and fails at once on the next, before its stats are reset."""
+
+    workers = 1
+    preprocess = ()
+
+    def __init__(self):
+        self.stats = {'start_time': None, 'pages_processed': 0}
+        self.calls = 0
+
+    def ocr_file(self, path, lang, pdf_path=None):
+        self.calls += 1
+        if self.calls > 1:
+            raise RuntimeError("cannot write the PDF")
+        self.stats['start_time'] = time.time()
+        time.sleep(0.3)
+        return "text", "eng"
+
+
+def test_metrics_time_a_failed_file_from_its_own_start(tmp_path):
+    for name in ("a.png", "b.png"):
+        (tmp_path / name).write_bytes(b"")
+    rows = []
+
+    class Metrics:
+        def record(self, stats, state, seconds, labels, error=None):
+            rows.append((state, seconds))
+
+    args = argparse.Namespace(paths=[str(tmp_path)], recursive=False, output_dir=None, format=["txt"],
+                              skip_existing=False, quiet=True, profile=False, trace=False, lang=None)
+    assert run_batch(SlowThenFailingEngine(), args, Metrics()) == 1
+    (done, first), (failed, second) = rows
+    assert (done, failed) == ("done", "failed")
+    assert first >= 0.3 and second < 0.2
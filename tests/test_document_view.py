@@ -0,0 +1,89 @@
+from document_view import DocumentStore
+from markdown_export import dump_lines
+
+LINES = "".join(f"line {n:02d}\n" for n in range(10))  # 8 characters per line
+
+
+def store_with(text=LINES, page_chars=20, tags=None):
+    store = DocumentStore(page_chars)
+    store.append(text, tags)
+    return store
+
+
+def test_append_cuts_pages_at_line_ends():
+    store = store_with()
+    assert [len(store.page_text(p)) for p in range(len(store.pages))] == [16] * 5
+    assert all(store.page_text(p).endswith("\n") for p in range(len(store.pages)))
+    assert store.text() == LINES
+    assert len(store) == len(LINES)
+    assert store.page_starts() == [0, 16, 32, 48, 64, 80]
+
+
+def test_append_hard_splits_only_lines_longer_than_a_page():
+    store = store_with("short\n" + "x" * 30 + "\nend")
+    assert [store.page_text(p) for p in range(len(store.pages))] == ["short\n", "x" * 20, "x" * 10 + "\nend"]
+
+
+def test_append_clips_tags_to_pages():
+    store = store_with(tags={"bold": [(12, 20)], "uncertain": [(40, 43)]})
+    assert store.pages[0].tags == {"bold": [[12, 16]]}
+    assert store.pages[1].tags == {"bold": [[0, 4]]}
+    assert store.pages[2].tags == {"uncertain": [[8, 11]]}
+
+
+def test_locate_maps_document_offsets_to_pages():
+    store = store_with()
+    assert store.locate(0) == (0, 0)
+    assert store.locate(17) == (1, 1)
+    assert store.locate(len(LINES)) == (4, 16)
+
+
+def test_replace_within_a_page_moves_marks_and_tags():
+    store = store_with(tags={"bold": [(16, 24)]})
+    store.mark_set("s", 21)
+    store.mark_set("e", 23)
+    store.mark_set("after", 30)
+    assert store.replace("s", "e", "one")
+    assert store.page_text(1) == "line one\nline 03\n"
+    assert store.get("s", "e") == "one"
+    assert store.marks["after"] == [1, 15]
+    # A tag covering the replaced range keeps covering it
+    assert store.pages[1].tags["bold"] == [[0, 9]]
+    assert not store.replace("s", "e", "one")
+
+
+def test_replace_across_pages_joins_them():
+    store = store_with()
+    store.mark_set("s", 13)
+    store.mark_set("e", 37)
+    store.replace("s", "e", "X")
+    assert store.text() == LINES[:13] + "X" + LINES[37:]
+    # Later pages keep their numbers; the joined ones are left empty
+    assert len(store.pages) == 5
+    assert store.page_text(1) == store.page_text(2) == ""
+    assert store.get("s", "e") == "X"
+
+
+def test_snapshot_is_not_changed_by_later_edits():
+    store = store_with(tags={"bold": [(0, 4)]})
+    snapshot = store.snapshot()
+    store.mark_set("s", 5)
+    store.mark_set("e", 7)
+    store.replace("s", "e", "zero")
+    store.pages[0].tags["bold"][0][1] = 2
+    assert snapshot.text() == LINES
+    assert snapshot.pages[0].tags == {"bold": [[0, 4]]}
+
+
+def test_dump_items_match_the_text_and_tags():
+    store = store_with(tags={"bold": [(12, 20)]})
+    lines = dump_lines(store.dump_items())
+    assert ["".join(text for text, _tags in runs) for runs in lines] == LINES.split("\n")
+    assert lines[1] == [("line", frozenset()), (" 01", frozenset({"bold"}))]
+    assert lines[2] == [("line", frozenset({"bold"})), (" 02", frozenset())]
+
+
+def test_tag_lines_returns_the_lines_where_a_tag_starts():
+    store = store_with(tags={"uncertain": [(5, 7), (42, 44)]})
+    assert store.tag_lines("uncertain") == {"line 00", "line 05"}
+    assert store.tag_lines("bold") == set()
@@ -0,0 +1,56 @@
+import pytest
+
+from docx_export import BULLET_STYLE, HEADING_STYLE, export_docx, paragraphs
+
+PLAIN = frozenset()
+BOLD = frozenset({"bold"})
+
+
+def test_blank_lines_separate_paragraphs():
+    lines = [[("one", PLAIN)], [("two", PLAIN)], [], [("  ", PLAIN)], [("three", PLAIN)]]
+    assert list(paragraphs(lines)) == [
+        (None, None, [[("one", PLAIN)], [("two", PLAIN)]]),
+        (None, None, [[("three", PLAIN)]]),
+    ]
+
+
+def test_headings_bullets_and_alignment_get_their_own_paragraphs():
+    lines = [[("Title", frozenset({"h1", "center"}))], [("text", frozenset({"right"}))],
+             [("• item", PLAIN)], [("tagged", frozenset({"bullet"}))]]
+    assert list(paragraphs(lines)) == [
+        (HEADING_STYLE, "center", [[("Title", frozenset({"h1", "center"}))]]),
+        (None, "right", [[("text", frozenset({"right"}))]]),
+        (BULLET_STYLE, None, [[("item", PLAIN)]]),
+        (BULLET_STYLE, None, [[("tagged", frozenset({"bullet"}))]]),
+    ]
+
+
+def test_bullet_prefix_split_over_runs():
+    lines = [[("  •", PLAIN), (" ", BOLD), ("bold item", BOLD)]]
+    assert list(paragraphs(lines)) == [(BULLET_STYLE, None, [[("bold item", BOLD)]])]
+
+
+def test_bullet_prefix_in_one_run_with_the_text():
+    lines = [[("• first ", PLAIN), ("word", BOLD)]]
+    assert list(paragraphs(lines)) == [(BULLET_STYLE, None, [[("first ", PLAIN), ("word", BOLD)]])]
+
+
+def test_export_round_trips_through_python_docx(tmp_path):
+    docx = pytest.importorskip("docx")
+    lines = [[("Title", frozenset({"h1"}))], [],
+             [("plain ", PLAIN), ("bold", BOLD), (" big", frozenset({"larger", "italic"}))],
+             [("second line\x0c", PLAIN)], [],
+             [("•", PLAIN), (" item", PLAIN)]]
+    progress = []
+    path = tmp_path / "out.docx"
+    count = export_docx(str(path), lines, 60, lambda done, total: progress.append((done, total)))
+    assert count == 3
+    assert progress[-1] == (60, 60)
+    doc = docx.Document(str(path))
+    title, body, item = doc.paragraphs
+    assert (title.style.name, title.text) == ("Heading 1", "Title")
+    assert body.text == "plain bold big\nsecond line"
+    bold_run, big_run = body.runs[1], body.runs[2]
+    assert bold_run.bold and not bold_run.italic
+    assert big_run.italic and big_run.font.size.pt == 15
+    assert (item.style.name, item.text) == ("List Bullet", "item")
@@ -0,0 +1,67 @@
+import threading
+
+from job_queue import DONE, JobQueue, workers_per_document
+
+
+class FakeEngine:
+    """Stands in for OcrEngine; each ocr_file() waits until `release` is set."""
+
+    def __init__(self, workers, release):
+        self.workers = workers
+        self.preprocess = ()
+        self.stats = {}
+        self.release = release
+        self.resized = []
+
+    def reset_cancel(self):
+        pass
+
+    def cancel(self):
+        pass
+
+    def set_workers(self, workers):
+        if workers != self.workers:
+            self.resized.append(workers)
+            self.workers = workers
+
+    def ocr_file(self, path, lang, collect_text=True, pdf_path=None, trace=None):
+        self.release.wait(5)
+        return None, "eng"
+
+    def close(self):
+        pass
+
+
+def wait_for(predicate):
+    done = threading.Event()
+    for _ in range(500):
+        if predicate():
+            return
+        done.wait(0.01)
+    raise AssertionError("timed out")
+
+
+def test_set_concurrency_resizes_engines_for_their_next_job(monkeypatch):
+    monkeypatch.setenv("AANAI_OCR_WORKERS", "8")
+    release = threading.Event()
+    engines = []
+
+    def make_engine(workers):
+        engines.append(FakeEngine(workers, release))
+        return engines[-1]
+
+    queue = JobQueue(make_engine, concurrency=1)
+    try:
+        first, = queue.add(["a.png"])
+        wait_for(lambda: engines)
+        queue.set_concurrency(4)
+        # The running document keeps the workers it started with
+        assert engines[0].workers == workers_per_document(1) == 8
+        release.set()
+        wait_for(lambda: first.state == DONE)
+        second, = queue.add(["b.png"])
+        wait_for(lambda: second.state == DONE)
+        assert second._engine is None and len(engines) == 1
+        assert engines[0].resized == [workers_per_document(4)] == [2]
+    finally:
+        queue.close()
@@ -0,0 +1,36 @@
+from markdown_export import dump_lines, iter_dump_lines, line_markdown, per_character_markdown, sample_dump
+
+
+def test_dump_lines_splits_runs_at_newlines_and_tag_changes():
+    items = [("text", "plain ", "1.0"), ("tagon", "bold", "1.6"), ("text", "bold\nstill", "1.6"),
+             ("tagoff", "bold", "2.5"), ("text", " done\n", "2.5")]
+    assert dump_lines(items) == [
+        [("plain ", frozenset()), ("bold", frozenset({"bold"}))],
+        [("still", frozenset({"bold"})), (" done", frozenset())],
+        [],
+    ]
+
+
+def test_dump_lines_starts_with_the_tags_active_at_the_start_index():
+    assert dump_lines([("text", "x", "3.0")], initial_tags=("italic",)) == [[("x", frozenset({"italic"}))]]
+
+
+def test_line_markdown_nests_and_closes_inline_markers():
+    runs = [("a ", frozenset()), ("b", frozenset({"bold"})), ("c", frozenset({"bold", "italic"})),
+            (" d", frozenset({"underline"}))]
+    assert line_markdown(runs) == "a **b*c***_ d_"
+
+
+def test_line_markdown_headings_and_bullets():
+    assert line_markdown([("Title", frozenset({"h1", "bold"}))]) == "# **Title**"
+    assert line_markdown([("• item", frozenset())]) == "- • item"
+    assert line_markdown([("item", frozenset({"bullet"}))]) == "- item"
+    assert line_markdown([]) == ""
+
+
+def test_benchmark_paths_agree_on_the_sample():
+    items = sample_dump(20_000)
+    assert "".join(value for key, value, _index in items if key == "text").count("\n") > 100
+    fast = "\n".join(line_markdown(runs) for runs in iter_dump_lines(items))
+    assert "**" in fast and fast.startswith("# ")
+    assert per_character_markdown(items) == fast
@@ -0,0 +1,91 @@
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import ocr_metrics
+from ocr_metrics import MetricsStore
+
+LABELS = {'backend': "api", 'workers': "4", 'preprocess': "off", 'lang': "auto"}
+
+
+def stats(pages, hits=0, misses=0, retries=0, timeouts=(), stage_seconds=None):
+    return {'pages_processed': pages, 'characters_extracted': pages * 100, 'cache_hits': hits,
+            'cache_misses': misses, 'timeout_retries': retries, 'timeout_pages': list(timeouts),
+            'total_pages': pages, 'file_size': 1000, 'stage_seconds': stage_seconds or {}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MetricsStore(str(tmp_path / "metrics.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_daily_rolls_up_per_day_and_configuration(store):
+    now = time.time()
+    store.record(stats(10, hits=1, misses=3, retries=2, timeouts=[7]), "done", 5.0, LABELS, finished=now)
+    store.record(stats(6, hits=2, misses=2), "done", 3.0, LABELS, finished=now)
+    store.record(stats(0), "failed", 1.0, LABELS, "boom", finished=now)
+    store.record(stats(4), "done", 1.0, {**LABELS, 'workers': "1"}, finished=now)
+    store.record(stats(99), "done", 1.0, LABELS, finished=now - 30 * 86400)
+    by_workers = {row['workers']: row for row in store.daily(7)}
+    assert set(by_workers) == {"1", "4"}
+    row = by_workers["4"]
+    assert (row['jobs'], row['failed'], row['cancelled'], row['pages']) == (3, 1, 0, 16)
+    assert row['pages_per_sec'] == round(16 / 9.0, 3)
+    assert (row['timeout_retries'], row['timeout_pages']) == (2, 1)
+    assert row['cache_hit_rate'] == 0.375
+    assert by_workers["1"]['cache_hit_rate'] is None
+
+
+def test_exposition_sums_counters_by_labels_and_state(store):
+    store.record(stats(10, stage_seconds={'tesseract': 2.5, 'render': 1.0}), "done", 5.0, LABELS)
+    store.record(stats(5, stage_seconds={'tesseract': 1.5}), "done", 2.5, LABELS)
+    store.record(stats(0), "failed", 0.5, LABELS, "boom")
+    text = store.exposition(live={'running': 1, 'queued': 2})
+    done = 'backend="api",workers="4",preprocess="off",lang="auto",state="done"'
+    failed = done.replace('"done"', '"failed"')
+    assert f"aanai_ocr_jobs_total{{{done}}} 2" in text.splitlines()
+    assert f"aanai_ocr_jobs_total{{{failed}}} 1" in text.splitlines()
+    assert f"aanai_ocr_pages_total{{{done}}} 15" in text.splitlines()
+    assert f"aanai_ocr_seconds_total{{{done}}} 7.5" in text.splitlines()
+    assert 'aanai_ocr_stage_seconds_total{backend="api",workers="4",preprocess="off",lang="auto",' \
+           'stage="tesseract"} 4' in text.splitlines()
+    assert 'aanai_ocr_jobs{state="queued"} 2' in text.splitlines()
+    assert "# TYPE aanai_ocr_pages_total counter" in text.splitlines()
+    assert text.endswith("\n")
+
+
+def test_exposition_escapes_label_values(store):
+    store.record(stats(1), "done", 1.0, {**LABELS, 'lang': 'a"b\\c\nd'})
+    assert 'lang="a\\"b\\\\c\\nd"' in store.exposition()
+
+
+def test_from_env_respects_aanai_metrics(monkeypatch, tmp_path):
+    monkeypatch.setenv("AANAI_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("AANAI_METRICS", "0")
+    assert MetricsStore.from_env() is None
+    monkeypatch.setenv("AANAI_METRICS", "1")
+    store = MetricsStore.from_env()
+    assert store is not None
+    store.close()
+
+
+def test_server_answers_metrics_and_404(store):
+    store.record(stats(3), "done", 1.0, LABELS)
+    server = ocr_metrics.start_background(store, 0, live=lambda: {'running': 0})
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(base + "/metrics", timeout=5) as resp:
+            assert resp.headers["Content-Type"] == ocr_metrics.EXPOSITION_CONTENT_TYPE
+            body = resp.read().decode("utf-8")
+        assert "aanai_ocr_pages_total{" in body
+        assert 'aanai_ocr_jobs{state="running"} 0' in body
+        with pytest.raises(urllib.error.HTTPError) as err:
+            urllib.request.urlopen(base + "/other", timeout=5)
+        assert err.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,51 @@
+import pickle
+
+from page_layout import PageLayout, min_confidence, parse_tsv
+
+HEADER = "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext"
+
+
+def tsv(*words):
+    """TSV with a page row and (block, par, line, text, conf) word rows."""
+    rows = [HEADER, "1\t1\t0\t0\t0\t0\t0\t0\t600\t800\t-1\t"]
+    for n, (block, par, line, text, conf) in enumerate(words):
+        rows.append(f"5\t1\t{block}\t{par}\t{line}\t{n}\t{10 * n}\t{20 * line}\t9\t12\t{conf}\t{text}")
+    return "\n".join(rows)
+
+
+def test_parse_tsv_groups_words_into_lines():
+    layout = parse_tsv(tsv((1, 1, 1, "Hello", 96.5), (1, 1, 1, "wor1d", 41.0), (1, 1, 2, "again", 90.0)))
+    assert (layout.width, layout.height) == (600, 800)
+    assert [line.text for line in layout.lines] == ["Hello wor1d", "again"]
+    assert layout.lines[0].conf == 41.0
+    assert layout.word_count() == 3
+    assert layout.uncertain_count(80) == 1
+    assert round(layout.mean_confidence(), 2) == 75.83
+
+
+def test_parse_tsv_skips_empty_and_non_word_rows():
+    layout = parse_tsv(tsv((1, 1, 1, " ", 95.0), (1, 1, 1, "x", -1)) + "\n4\t1\t1\t1\t1\t0\t0\t0\t1\t1\t-1\t")
+    assert layout.lines == []
+    assert parse_tsv(HEADER) is None
+
+
+def test_word_spans_finds_uncertain_words_in_order():
+    layout = parse_tsv(tsv((1, 1, 1, "the", 40.0), (1, 1, 1, "cat", 95.0), (1, 1, 2, "the", 30.0),
+                           (1, 1, 2, "missing", 10.0)))
+    text = "the cat\nthe end"
+    assert layout.word_spans(text, 80) == [(0, 3), (8, 11)]
+
+
+def test_layout_survives_pickle_and_cache_round_trips():
+    layout = parse_tsv(tsv((1, 1, 1, "ខ្មែរ", 88.0), (2, 1, 1, "OCR", 70.0)))
+    for copy in (pickle.loads(pickle.dumps(layout)), PageLayout.from_dict(layout.to_dict())):
+        assert copy.to_dict() == layout.to_dict()
+        assert [line.block for line in copy.lines] == [1, 2]
+    assert PageLayout.from_dict(None) is None
+
+
+def test_min_confidence_from_environment(monkeypatch):
+    monkeypatch.setenv("AANAI_MIN_CONF", "65")
+    assert min_confidence() == 65.0
+    monkeypatch.setenv("AANAI_MIN_CONF", "high")
+    assert min_confidence() == 80.0
@@ -0,0 +1,200 @@
+import time
+
+import pytest
+
+import proofread
+from fake_gemini import correct
+from proofread import GeminiProofreader, ProofreadError, TokenBucket, split_chunks, split_paragraphs
+
+TEXT = "teh first paragraph\nwith two lines\n\n  0CR second one  \n\n\nthird teh end\n"
+
+
+def proofreader(base_url, **kwargs):
+    kwargs.setdefault("rpm", 60000)
+    kwargs.setdefault("stream", False)
+    return GeminiProofreader(api_key="test", base_url=base_url, **kwargs)
+
+
+def test_split_paragraphs_round_trips():
+    units = split_paragraphs(TEXT)
+    assert [body for _lead, body, _trail in units] == [
+        "teh first paragraph\nwith two lines", "0CR second one", "third teh end"]
+    assert "".join(lead + body + trail for lead, body, trail in units) == TEXT
+
+
+def test_split_paragraphs_splits_long_paragraphs_at_lines_then_hard():
+    text = "a" * 25 + "\n" + "b" * 5 + "\n\nc"
+    units = split_paragraphs(text, max_chars=10)
+    assert all(len(lead + body + trail) <= 10 for lead, body, trail in units)
+    assert "".join(lead + body + trail for lead, body, trail in units) == text
+    # The blank line after "b" is a unit of its own with an empty body
+    assert [body for _lead, body, _trail in units] == ["a" * 10, "a" * 10, "a" * 5, "b" * 5, "", "c"]
+
+
+def test_split_chunks_packs_paragraphs_up_to_the_limit():
+    text = "\n\n".join(["x" * 8] * 5)
+    chunks = split_chunks(text, max_chars=25)
+    assert len(chunks) == 3
+    assert all(len(lead + body + trail) <= 25 for lead, body, trail in chunks)
+    assert "".join(lead + body + trail for lead, body, trail in chunks) == text
+
+
+def test_proofread_keeps_order_and_separators(fake_gemini):
+    # One request per paragraph; the first is the longest, so it finishes last
+    paragraphs = ["teh " * 20, "0CR " * 12, "teh two " * 6, "three rn " * 5]
+    text = "\n\n".join(paragraphs) + "\n"
+    server, base_url = fake_gemini(latency_per_kchar=10.0)
+    finished = []
+    with proofreader(base_url, concurrency=4, max_chunk_chars=85) as p:
+        result = p.proofread(text, on_chunk=lambda n, total, corrected: finished.append(n))
+    assert result == correct(text)
+    assert sorted(finished) == [0, 1, 2, 3]
+    assert finished[-1] == 0
+    assert server.requests == 4
+
+
+def test_proofread_packs_paragraphs_into_one_request(fake_gemini):
+    server, base_url = fake_gemini()
+    with proofreader(base_url) as p:
+        result = p.proofread(TEXT)
+    assert result == correct(TEXT)
+    assert server.requests == 1
+    assert p.paragraphs_sent == 3
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_retries_on_429_and_5xx(fake_gemini, monkeypatch, status):
+    # Backoff without Retry-After is 2**attempt * uniform(0.5, 1.5) seconds
+    monkeypatch.setattr(proofread.random, "uniform", lambda a, b: 0.01)
+    server, base_url = fake_gemini(fail_statuses=[status, status])
+    with proofreader(base_url) as p:
+        assert p.proofread("teh text") == "the text"
+    assert server.requests == 3
+    assert p.retries == 2
+
+
+def test_gives_up_after_max_retries(fake_gemini, monkeypatch):
+    monkeypatch.setattr(proofread.random, "uniform", lambda a, b: 0.01)
+    server, base_url = fake_gemini(fail_statuses=[503] * 5)
+    with proofreader(base_url, max_retries=2) as p:
+        with pytest.raises(ProofreadError, match="503"):
+            p.proofread("teh text")
+    assert server.requests == 3
+
+
+def test_does_not_retry_client_errors(fake_gemini):
+    server, base_url = fake_gemini(fail_statuses=[400])
+    with proofreader(base_url) as p:
+        with pytest.raises(ProofreadError, match="400"):
+            p.proofread("teh text")
+    assert server.requests == 1
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=20.0, capacity=3)
+    start = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05
+    for _ in range(4):
+        bucket.acquire()
+    # Four more tokens at 20/s take about 0.2 s
+    assert 0.15 <= time.monotonic() - start < 1.0
+
+
+def test_proofreader_requests_follow_the_rpm_budget(fake_gemini):
+    _server, base_url = fake_gemini()
+    text = "\n\n".join(f"paragraph {n}" for n in range(5))
+    start = time.monotonic()
+    # 600 rpm = 10 requests/s with a burst of `concurrency` (1)
+    with proofreader(base_url, rpm=600, concurrency=1, max_chunk_chars=15) as p:
+        p.proofread(text)
+    assert p.requests_sent == 5
+    assert time.monotonic() - start >= 0.35
+
+
+def test_stream_previews_a_single_paragraph_as_it_arrives(fake_gemini):
+    text = "teh quick brown fox jumps over teh lazy dog"
+    # 5-character events, 0.05 s apart
+    _server, base_url = fake_gemini(stream_chars=5, latency_per_kchar=10.0)
+    previews = []
+    last = {}
+    with proofreader(base_url, stream=True) as p:
+        result = p.proofread(text, on_paragraph=last.__setitem__,
+                             on_preview=lambda i, partial: previews.append((time.monotonic(), i, partial)))
+    finished = time.monotonic()
+    assert result == correct(text)
+    assert last == {0: correct(text)}
+    assert {i for _t, i, _c in previews} == {0}
+    assert len(previews) > 3
+    # Previews grow towards the final text and the first came well before the end
+    assert all(correct(text).startswith(c) for _t, _i, c in previews)
+    assert finished - previews[0][0] >= 0.2
+
+
+def test_cut_stream_reports_only_finished_paragraphs(fake_gemini):
+    text = "teh first\n\n0CR second paragraph\n\nthird"
+    # The connection drops half way through the second paragraph
+    _server, base_url = fake_gemini(stream_chars=4, cut_after=20)
+    last = {}
+    previews = {}
+    with proofreader(base_url, stream=True) as p:
+        with pytest.raises(ProofreadError):
+            p.proofread(text, on_paragraph=last.__setitem__, on_preview=previews.__setitem__)
+    assert last == {0: "the first"}
+    assert previews[1] == "OCR secon"
+
+
+def test_stream_reports_each_paragraph_of_a_batch(fake_gemini):
+    text = "teh first\n\n0CR second\n\nthird rn"
+    server, base_url = fake_gemini(stream_chars=4)
+    last = {}
+    with proofreader(base_url, stream=True) as p:
+        result = p.proofread(text, on_paragraph=last.__setitem__)
+    assert result == correct(text)
+    assert last == {0: "the first", 1: "OCR second", 2: "third m"}
+    assert server.requests == 1
+
+
+def test_stream_keeps_multibyte_text_whole(fake_gemini):
+    text = "សួស្តី ពិភពលោក teh\n\nអក្សរខ្មែរ"
+    _server, base_url = fake_gemini(stream_chars=3)
+    with proofreader(base_url, stream=True) as p:
+        assert p.proofread(text) == correct(text)
+
+
+def test_failed_stream_request_is_closed(fake_gemini):
+    _server, base_url = fake_gemini(fail_statuses=[400])
+    closed = []
+    with proofreader(base_url, stream=True) as p:
+        post = p.session.post
+
+        def recording_post(*args, **kwargs):
+            resp = post(*args, **kwargs)
+            close = resp.close
+            resp.close = lambda: (closed.append(resp.status_code), close())
+            return resp
+
+        p.session.post = recording_post
+        with pytest.raises(ProofreadError, match="400"):
+            p.proofread_chunk_stream("teh text")
+    assert closed == [400]
+
+
+def test_select_sends_only_the_chosen_lines(fake_gemini):
+    text = "teh sure line\nteh doubtful line\n\nrn another doubt\n"
+    server, base_url = fake_gemini()
+    sent = []
+    with proofreader(base_url) as p:
+        post = p._post
+
+        def recording_post(method, body, *args, **kwargs):
+            sent.append(body)
+            return post(method, body, *args, **kwargs)
+
+        p._post = recording_post
+        result = p.proofread(text, select=lambda line: "doubt" in line)
+    assert result == "teh sure line\nthe doubtful line\n\nm another doubt\n"
+    assert sent == ["teh doubtful line\n\nrn another doubt"]
+    assert p.lines_skipped == 1
+    assert p.paragraphs_sent == 2
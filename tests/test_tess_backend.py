@@ -0,0 +1,44 @@
+import pytest
+from PIL import Image
+
+import tess_backend
+
+pytest.importorskip("tesserocr")
+
+
+@pytest.fixture
+def no_tessdata(monkeypatch, tmp_path):
+    # An empty tessdata directory: no language can be loaded
+    monkeypatch.setenv("TESSDATA_PREFIX", str(tmp_path))
+    yield
+    tess_backend._failed_langs.clear()
+
+
+def test_auto_falls_back_to_the_cli(monkeypatch, no_tessdata):
+    monkeypatch.setenv("AANAI_TESS_BACKEND", "auto")
+    assert tess_backend.api_image_to_string(Image.new("L", (8, 8), 255), "khm") is None
+
+
+def test_explicit_api_backend_reports_missing_languages(monkeypatch, no_tessdata):
+    monkeypatch.setenv("AANAI_TESS_BACKEND", "auto")
+    tess_backend.api_image_to_string(Image.new("L", (8, 8), 255), "khm")
+    monkeypatch.setenv("AANAI_TESS_BACKEND", "api")
+    with pytest.raises(RuntimeError, match="khm"):
+        tess_backend.api_image_to_string(Image.new("L", (8, 8), 255), "khm")
+
+
+class FakeApi:
+    ended = False
+
+    def End(self):
+        self.ended = True
+
+
+def test_closing_an_engine_keeps_the_shared_api_pool(monkeypatch):
+    from ocr_engine import OcrEngine
+    api = FakeApi()
+    monkeypatch.setitem(tess_backend._idle_apis, ("", "eng"), [api])
+    OcrEngine().close()
+    assert tess_backend._idle_apis[("", "eng")] == [api]
+    tess_backend.close_all()
+    assert api.ended and not tess_backend._idle_apis